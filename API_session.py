@@ -7,7 +7,7 @@ from random import randrange
 from time import sleep
 from warnings import warn
 # ~~ Local ~~
-from marchhare.Utils3 import ( Stopwatch , strip_EXT , yesno , unpickle_dict ,
+from marchhare.Utils3 import ( Stopwatch , strip_EXT , yesno , load_pkl_struct ,
                                ensure_dirs_writable , struct_to_pkl , nowTimeStampFine , 
                                confirm_or_crash , )
 
@@ -46,6 +46,7 @@ from pygn.pygn import register , search
 print( "Loaded 'pygn'! (GraceNote)" )
 
 from marchhare.Utils3 import ( LogMH , parse_lines )
+from API_sssn_py3 import SessionStore
 
 def comma_sep_key_val_from_file( fPath ):
     """ Read a file, treating each line as a key-val pair separated by a comma """
@@ -127,6 +128,7 @@ class Session:
         self.ARTIST_PICKLE_PATH = ""
         self.METADATA           = {} 
         self.ARTISTS            = {}        
+        self.STORE              = None # 'SessionStore' holding METADATA , Set by 'begin_session'
         
         # ~ Logging ~
         self.LOG_DIR = ""
@@ -249,6 +251,17 @@ def construct_session_path( inputPath ):
 
 def construct_pickle_path( RAW_FILE_DIR , inputPath ):
     return RAW_FILE_DIR + '/' + strip_EXT( str( os.path.split( inputPath )[-1] ) ) + "_metadata.pkl"
+
+def construct_store_path( picklePath ):
+    return strip_EXT( picklePath ) + ".db"
+
+
+def load_pickled_dict( pklPath ):
+    """ Return the dict pickled at 'pklPath' , or an empty dict if there is none """
+    if not os.path.isfile( pklPath ):
+        return {}
+    rtnDict = load_pkl_struct( pklPath ) # Prints why , if the file cannot be read
+    return rtnDict if isinstance( rtnDict , dict ) else {}
     
 def begin_session( inputPath , overridePath = None ):
     """ Set all vars that we will need to run a session """
@@ -278,14 +291,25 @@ def begin_session( inputPath , overridePath = None ):
         print( "There was no override file provided" )
     # 4. Construct pickle path
     session.ACTIVE_PICKLE_PATH = construct_pickle_path( session.RAW_FILE_DIR , inputPath )
-    # 5. Unpickle session metadata
-    session.METADATA = unpickle_dict( session.ACTIVE_PICKLE_PATH ) 
-    if session.METADATA:
-        session.LOG.prnt( "Found cached metadata at" , session.ACTIVE_PICKLE_PATH , "with" , len( session.METADATA ) , "entries" )
-    else:
-        session.LOG.prnt( "NO cached metadata at" , session.ACTIVE_PICKLE_PATH )
+    # 5. Open the session metadata , Each change is written to the store as it is made
+    storePath = construct_store_path( session.ACTIVE_PICKLE_PATH )
+    try:
+        fresh         = not os.path.isfile( storePath )
+        session.STORE = SessionStore( storePath )
+    except Exception as ex:
+        session.LOG.prnt( "ERROR , begin_session: Could not open" , storePath , "," , ex )
+        session.STORE = None
+    if session.STORE:
+        #  5.1. The first time , move the metadata of older sessions into the store
+        if fresh and os.path.isfile( session.ACTIVE_PICKLE_PATH ):
+            oldMeta = load_pickled_dict( session.ACTIVE_PICKLE_PATH )
+            session.STORE.import_metadata( oldMeta )
+            session.LOG.prnt( "Moved" , len( oldMeta ) , "entries from" , session.ACTIVE_PICKLE_PATH , "into" , storePath )
+        # NOTE: The full API responses stay in the store , Read them one ID at a time with 'get_response'
+        session.METADATA = session.STORE.export_metadata()
+        session.LOG.prnt( "Opened metadata store at" , storePath , "with" , len( session.METADATA ) , "entries" )
     # Unpickle artist set
-    session.ARTISTS = unpickle_dict( session.ARTIST_PICKLE_PATH ) 
+    session.ARTISTS = load_pickled_dict( session.ARTIST_PICKLE_PATH ) 
     if session.ARTISTS:
         session.LOG.prnt( "Found cached artist set at" , session.ARTIST_PICKLE_PATH , "with" , len( session.ARTISTS ) , "entries" )
     else:
@@ -293,13 +317,16 @@ def begin_session( inputPath , overridePath = None ):
     #  1.1. Activate session
     session.ACTIVE_SESSION = True
     #  2. Check Write locations
-    dirsWritable = verify_session_writable( session )
+    dirsWritable = verify_session_writable( session ) and ( session.STORE is not None ) # Nowhere to save the metadata without the store
     return session , dirsWritable , dlTimer
     
 def close_session( sssn ):
     """ Cache data and write logs """
-    # 23. Pickle all data
-    struct_to_pkl( sssn.METADATA , sssn.ACTIVE_PICKLE_PATH )
+    # 23. Close the metadata , The stages save each change as they make it , This catches any direct edit of METADATA
+    if sssn.STORE:
+        sssn.STORE.import_metadata( sssn.METADATA )
+        sssn.STORE.close()
+        sssn.STORE = None
     struct_to_pkl( sssn.ARTISTS  , sssn.ARTIST_PICKLE_PATH )
     # 24. Save session && output log data
     save_session( sssn )
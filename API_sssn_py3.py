@@ -1,6 +1,6 @@
 # ~~~ Imports ~~~
 # ~~ Standard ~~
-import shutil , os , traceback
+import shutil , os , traceback , json , sqlite3 , threading , time
 from math import pi , sqrt
 from random import randrange
 from time import sleep
@@ -85,12 +85,227 @@ def my_hook( d ):
 # __ End Logging __
 
 
+# ===== class SessionStore =====
+
+class SessionStore:
+    """ SQLite file holding the session record and the per-video METADATA , so that a stage can read and write one ID at a time """
+    # NOTE: A METADATA entry is split across the tables by key , See 'VIDEOCOLS' , 'RAWCOLS' , 'TRACKLISTKEY' , and 'RESPONSEKEYS'
+    # NOTE: WAL mode lets other processes read the store while a stage writes to it
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS settings (
+        key   TEXT PRIMARY KEY ,
+        value TEXT
+    );
+    CREATE TABLE IF NOT EXISTS videos (
+        id        TEXT PRIMARY KEY ,
+        url       TEXT ,
+        seq       INTEGER ,
+        fl_url    INTEGER ,
+        raw_dir   TEXT ,
+        fl_rawdir INTEGER ,
+        fl_dlok   INTEGER ,
+        dl_state  TEXT ,
+        extra     TEXT ,
+        updated   REAL
+    );
+    CREATE INDEX IF NOT EXISTS videos_dl_state ON videos ( dl_state );
+    CREATE INDEX IF NOT EXISTS videos_fl_dlok  ON videos ( fl_dlok );
+    CREATE TABLE IF NOT EXISTS raw_files (
+        id        TEXT PRIMARY KEY REFERENCES videos ( id ) ON DELETE CASCADE ,
+        path      TEXT ,
+        dl_time_s REAL ,
+        tc_time_s REAL
+    );
+    CREATE TABLE IF NOT EXISTS tracklists (
+        id        TEXT REFERENCES videos ( id ) ON DELETE CASCADE ,
+        pos       INTEGER ,
+        stamp     TEXT ,
+        video_seq INTEGER ,
+        balance   TEXT ,
+        line      TEXT ,
+        PRIMARY KEY ( id , pos )
+    );
+    CREATE TABLE IF NOT EXISTS api_responses (
+        id       TEXT REFERENCES videos ( id ) ON DELETE CASCADE ,
+        kind     TEXT ,
+        response TEXT ,
+        fetched  REAL ,
+        PRIMARY KEY ( id , kind )
+    );
+    """
+
+    # METADATA key : Column
+    VIDEOCOLS    = { 'url' : 'url' , 'seq' : 'seq' , 'FL_URL' : 'fl_url' , 'rawDir' : 'raw_dir' , 'FL_RAWDIR' : 'fl_rawdir' ,
+                     'FL_DLOK' : 'fl_dlok' , 'DL_STATE' : 'dl_state' }
+    RAWCOLS      = { 'rawAudioPath' : 'path' , 'dlTime_s' : 'dl_time_s' , 'tcTime_s' : 'tc_time_s' }
+    FLAGCOLS     = ( 'fl_url' , 'fl_rawdir' , 'fl_dlok' ) # Stored as 0/1 , Returned as bool
+    TRACKLISTKEY = 'Tracklist'
+    RESPONSEKEYS = ( 'Metadata' , 'Threads' ) # Full API responses , Fetched only when asked for
+
+    def __init__( self , dbPath ):
+        """ Open or create the store at 'dbPath' """
+        self.dbPath = dbPath
+        self.lock   = threading.RLock()
+        self.conn   = sqlite3.connect( dbPath , check_same_thread = False )
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute( "PRAGMA journal_mode = WAL" )
+        self.conn.execute( "PRAGMA synchronous = NORMAL" ) # Safe in WAL mode , Only the last commits can be lost on power failure
+        self.conn.execute( "PRAGMA foreign_keys = ON" )
+        with self.conn:
+            self.conn.executescript( SessionStore.SCHEMA )
+
+    def close( self ):
+        """ Close the connection """
+        with self.lock:
+            self.conn.close()
+
+    # ~~ Settings ~~
+
+    def get_settings( self ):
+        """ Return the session record as a dict """
+        with self.lock:
+            return { row[ 'key' ] : json.loads( row[ 'value' ] ) for row in self.conn.execute( "SELECT key , value FROM settings" ) }
+
+    def set_settings( self , record ):
+        """ Write every key of the 'record' dict """
+        with self.lock , self.conn:
+            self.conn.executemany( "INSERT OR REPLACE INTO settings ( key , value ) VALUES ( ? , ? )" ,
+                                   [ ( key , json.dumps( val , default = str ) ) for key , val in record.items() ] )
+
+    # ~~ Videos ~~
+
+    def update_video( self , ID , fields ):
+        """ Set the METADATA 'fields' of 'ID' , Creating the video if needed , Fields not given are left as they are """
+        videoSet = { SessionStore.VIDEOCOLS[ key ] : val for key , val in fields.items() if key in SessionStore.VIDEOCOLS }
+        rawSet   = { SessionStore.RAWCOLS[ key ] : val for key , val in fields.items() if key in SessionStore.RAWCOLS }
+        extraSet = { key : val for key , val in fields.items()
+                     if key != 'id' and key not in SessionStore.VIDEOCOLS and key not in SessionStore.RAWCOLS
+                     and key != SessionStore.TRACKLISTKEY and key not in SessionStore.RESPONSEKEYS }
+        with self.lock , self.conn:
+            self.conn.execute( "INSERT OR IGNORE INTO videos ( id , extra ) VALUES ( ? , '{}' )" , ( ID , ) )
+            if extraSet:
+                row   = self.conn.execute( "SELECT extra FROM videos WHERE id = ?" , ( ID , ) ).fetchone()
+                extra = json.loads( row[ 'extra' ] or '{}' )
+                extra.update( extraSet )
+                videoSet[ 'extra' ] = json.dumps( extra , default = str )
+            videoSet[ 'updated' ] = time.time()
+            self.conn.execute( "UPDATE videos SET " + " , ".join( col + " = ?" for col in videoSet ) + " WHERE id = ?" ,
+                               list( videoSet.values() ) + [ ID ] )
+            if rawSet:
+                self.conn.execute( "INSERT OR IGNORE INTO raw_files ( id ) VALUES ( ? )" , ( ID , ) )
+                self.conn.execute( "UPDATE raw_files SET " + " , ".join( col + " = ?" for col in rawSet ) + " WHERE id = ?" ,
+                                   list( rawSet.values() ) + [ ID ] )
+            if SessionStore.TRACKLISTKEY in fields:
+                self.set_tracklist( ID , fields[ SessionStore.TRACKLISTKEY ] )
+            for kind in SessionStore.RESPONSEKEYS:
+                if kind in fields:
+                    self.set_response( ID , kind , fields[ kind ] )
+
+    def get_video( self , ID , withResponses = False ):
+        """ Return the METADATA entry of 'ID' as a dict , or None if there is none , Full API responses only if 'withResponses' """
+        with self.lock:
+            row = self.conn.execute( "SELECT * FROM videos WHERE id = ?" , ( ID , ) ).fetchone()
+            if row is None:
+                return None
+            entry = { 'id' : ID }
+            for key , col in SessionStore.VIDEOCOLS.items():
+                if row[ col ] is not None:
+                    entry[ key ] = bool( row[ col ] ) if col in SessionStore.FLAGCOLS else row[ col ]
+            entry.update( json.loads( row[ 'extra' ] or '{}' ) )
+            raw = self.conn.execute( "SELECT * FROM raw_files WHERE id = ?" , ( ID , ) ).fetchone()
+            if raw is not None:
+                for key , col in SessionStore.RAWCOLS.items():
+                    if raw[ col ] is not None:
+                        entry[ key ] = raw[ col ]
+            tracklist = self.get_tracklist( ID )
+            if tracklist:
+                entry[ SessionStore.TRACKLISTKEY ] = tracklist
+            if withResponses:
+                for kind in SessionStore.RESPONSEKEYS:
+                    response = self.get_response( ID , kind )
+                    if response is not None:
+                        entry[ kind ] = response
+            return entry
+
+    def video_IDs( self , dlState = None , dlOK = None ):
+        """ Return the IDs of videos , Optionally only those in 'dlState' and/or with FL_DLOK equal to 'dlOK' """
+        query  = "SELECT id FROM videos WHERE 1"
+        params = []
+        if dlState is not None:
+            query += " AND dl_state = ?"
+            params.append( dlState )
+        if dlOK is not None:
+            query += " AND fl_dlok = ?"
+            params.append( int( dlOK ) )
+        with self.lock:
+            return [ row[ 'id' ] for row in self.conn.execute( query + " ORDER BY seq , id" , params ) ]
+
+    def delete_video( self , ID ):
+        """ Remove 'ID' and everything stored for it """
+        with self.lock , self.conn:
+            self.conn.execute( "DELETE FROM videos WHERE id = ?" , ( ID , ) )
+
+    # ~~ Tracklists ~~
+
+    def set_tracklist( self , ID , stamps ):
+        """ Replace the tracklist of 'ID' with the list of 'stamps' dicts """
+        with self.lock , self.conn:
+            self.conn.execute( "INSERT OR IGNORE INTO videos ( id , extra ) VALUES ( ? , '{}' )" , ( ID , ) )
+            self.conn.execute( "DELETE FROM tracklists WHERE id = ?" , ( ID , ) )
+            self.conn.executemany(
+                "INSERT INTO tracklists ( id , pos , stamp , video_seq , balance , line ) VALUES ( ? , ? , ? , ? , ? , ? )" ,
+                [ ( ID , pos , json.dumps( stamp.get( 'timestamp' ) ) , stamp.get( 'videoSeq' ) , stamp.get( 'balance' ) , stamp.get( 'line' ) )
+                  for pos , stamp in enumerate( stamps ) ] )
+
+    def get_tracklist( self , ID ):
+        """ Return the tracklist of 'ID' as a list of stamp dicts , in order """
+        with self.lock:
+            return [ { 'timestamp' : json.loads( row[ 'stamp' ] ) , 'videoSeq' : row[ 'video_seq' ] ,
+                       'balance' : row[ 'balance' ] , 'line' : row[ 'line' ] }
+                     for row in self.conn.execute( "SELECT * FROM tracklists WHERE id = ? ORDER BY pos" , ( ID , ) ) ]
+
+    # ~~ API Responses ~~
+
+    def set_response( self , ID , kind , response ):
+        """ Store the API 'response' of 'kind' for 'ID' , Ex: 'Metadata' , 'Threads' """
+        with self.lock , self.conn:
+            self.conn.execute( "INSERT OR IGNORE INTO videos ( id , extra ) VALUES ( ? , '{}' )" , ( ID , ) )
+            self.conn.execute( "INSERT OR REPLACE INTO api_responses ( id , kind , response , fetched ) VALUES ( ? , ? , ? , ? )" ,
+                               ( ID , kind , json.dumps( response , default = str ) , time.time() ) )
+
+    def get_response( self , ID , kind ):
+        """ Return the API response of 'kind' for 'ID' , or None """
+        with self.lock:
+            row = self.conn.execute( "SELECT response FROM api_responses WHERE id = ? AND kind = ?" , ( ID , kind ) ).fetchone()
+        return json.loads( row[ 'response' ] ) if row else None
+
+    # ~~ Whole METADATA ~~
+
+    def import_metadata( self , metadata ):
+        """ Copy a whole METADATA dict into the store , IDs become videos , '%' counts become settings """
+        with self.lock , self.conn:
+            for key , val in metadata.items():
+                if str( key ).startswith( '%' ):
+                    self.set_settings( { key : val } )
+                elif isinstance( val , dict ):
+                    self.update_video( key , val )
+
+    def export_metadata( self , withResponses = False ):
+        """ Return the whole store as a METADATA dict , For code that still wants one """
+        metadata = { ID : self.get_video( ID , withResponses ) for ID in self.video_IDs() }
+        metadata.update( { key : val for key , val in self.get_settings().items() if key.startswith( '%' ) } )
+        return metadata
+
+# _____ End SessionStore _____
+
+
 # ===== class Session =====
 
 class Session:
     """ Flags and vars representing a session , Also acts as a repo for what would otherwise be globals """
     
-    DEFAULT_PKL_PATH = "music_record.pkl";
+    DEFAULT_PKL_PATH = "music_record.pkl"; # The store is kept next to this path , with a ".db" extension
     
     def __init__( self ):
         """ Create a default empty session """
@@ -125,6 +340,7 @@ class Session:
         self.ARTIST_PICKLE_PATH = ""
         self.METADATA           = {} 
         self.ARTISTS            = {}        
+        self.STORE              = None # 'SessionStore' , Holds the record and the per-video metadata
         
         # ~ Logging ~
         self.LOG_DIR = ""
@@ -178,7 +394,7 @@ class Session:
         self.record             = {};                              print( "Record structure created!" )           
         
     def save_session( self ):
-        """ Serialize Music information """
+        """ Write the session record to the store """
         self.record[ 'RAW_FILE_DIR' ]       = self.RAW_FILE_DIR
         self.record[ 'CHOPPED_SONG_DIR' ]   = self.CHOPPED_SONG_DIR
         self.record[ 'PICKLE_DIR' ]         = self.PICKLE_DIR
@@ -186,17 +402,30 @@ class Session:
         self.record[ 'ARTIST_PICKLE_PATH' ] = self.ARTIST_PICKLE_PATH
         self.record[ 'RECORD_PICKLE_PATH' ] = self.RECORD_PICKLE_PATH
         try:
-            struct_to_pkl( self.record , self.RECORD_PICKLE_PATH )
+            if self.STORE is None:
+                self.STORE = SessionStore( strip_EXT( self.RECORD_PICKLE_PATH ) + ".db" )
+            self.STORE.set_settings( self.record )
         except:
-            print( "FAILED to save" , self.RECORD_PICKLE_PATH )
+            print( "FAILED to save" , strip_EXT( self.RECORD_PICKLE_PATH ) + ".db" )
             traceback.print_exc()
         
     def load_session( self , path ):
-        """ De-Serialize Music information """
-        self.record = load_pkl_struct( path )
-        if self.record == None:
+        """ Open the store next to 'path' and read the session record , A pickled record at 'path' fills a new store once """
+        dbPath = strip_EXT( path ) + ".db"
+        fresh  = not os.path.isfile( dbPath )
+        if fresh and not os.path.isfile( path ):
             print( "FAILED to load" , path )
             return False
+        self.STORE = SessionStore( dbPath )
+        if fresh:
+            oldRecord = load_pkl_struct( path )
+            if oldRecord:
+                self.STORE.set_settings( oldRecord )
+                print( "Moved" , path , "into" , dbPath )
+        self.record = self.STORE.get_settings()
+        if not self.record:
+            print( "FAILED to load" , dbPath )
+            return False
         else:
             self.RAW_FILE_DIR       = self.record[ 'RAW_FILE_DIR' ] 
             self.CHOPPED_SONG_DIR   = self.record[ 'CHOPPED_SONG_DIR' ] 
@@ -239,6 +468,9 @@ class Session:
         """ Cache data and write logs """
         # 1. Save the record
         self.save_session()
+        if self.STORE:
+            self.STORE.close()
+            self.STORE = None
         # N. Report
         print( "\nSession CLOSED!" )
     
@@ -0,0 +1,189 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+bench_organizer.py
+Time the stages of organize-music-library.py on synthetic music libraries , Report throughput and peak RSS as JSON
+
+  == USAGE ==
+python bench_organizer.py                                  # 1k , 10k , 100k files
+python bench_organizer.py --sizes 1000 5000 --artists 50 --corrupt 0.05 --depth 4 --jobs 4 --out bench.json
+
+  == NOTES ==
+* Each library size is benchmarked in its own process , so that the peak RSS of one size does not hide the next
+* Peak RSS is the high-water mark of the process at the end of each stage , so a stage only shows up if it raised the mark
+* Files are a few silent MPEG1 Layer III frames behind an ID3v2.3 tag , about 2kB each , Make sure the temp dir has room
+"""
+
+# ~~~ Imports ~~~
+# ~~ Standard ~~
+import os , sys , json , time , random , shutil , struct , argparse , tempfile , subprocess , platform , importlib.util , logging
+try:
+    import resource
+except ImportError: # Not available on Windows
+    resource = None
+# ~~ Local ~~
+SOURCEDIR = os.path.dirname( os.path.abspath( __file__ ) ) # URL, dir containing source file: http://stackoverflow.com/a/7783326
+
+# ~~ Constants ~~
+DEFAULTSIZES = [ 1000 , 10000 , 100000 ]
+MPEGFRAME    = b'\xff\xfb\x90\x64' + b'\x00' * 413 # One MPEG1 Layer III frame , 128kbps , 44.1kHz , 417 bytes
+CORRUPTIONS  = [ 'notag' , 'badsize' , 'garbage' ] # Ways that a tag is damaged , chosen at random
+
+
+# === LIBRARY GENERATION ===================================================================================================================
+
+def ID3v2_text_frame( frameID , text ):
+    """ Return an ID3v2.3 text frame with a latin-1 payload """
+    payload = b'\x00' + text.encode( 'latin-1' , 'replace' )
+    return frameID.encode( 'ascii' ) + struct.pack( '>I' , len( payload ) ) + b'\x00\x00' + payload
+
+def syncsafe_bytes( value ):
+    """ Return 'value' as a 4-byte syncsafe integer """
+    return bytes( [ ( value >> 21 ) & 0x7f , ( value >> 14 ) & 0x7f , ( value >> 7 ) & 0x7f , value & 0x7f ] )
+
+def ID3v2_tag( fields , corruption = None ):
+    """ Return an ID3v2.3 tag holding the 'fields' dict of { frame ID : text } , damaged according to 'corruption' """
+    if corruption == 'notag':
+        return b''
+    body = b''.join( ID3v2_text_frame( frameID , text ) for frameID , text in fields.items() )
+    if corruption == 'garbage': # Frame headers that claim more data than there is
+        body = b'TPE1\x7f\xff\xff\xff\x00\x00' + os.urandom( len( body ) )
+    size = len( body ) + 64 # Padding , like most taggers leave
+    if corruption == 'badsize': # Tag that claims to run past the end of the file
+        size = 0x0fffffff
+    return b'ID3\x03\x00\x00' + syncsafe_bytes( size ) + body + b'\x00' * 64
+
+def synthetic_MP3( rng , fields , corruption = None ):
+    """ Return the bytes of a small MP3 with unique audio and the 'fields' tag """
+    frames = [ MPEGFRAME[:4] + rng.getrandbits( 32 ).to_bytes( 4 , 'big' ) + MPEGFRAME[8:] ] + [ MPEGFRAME ] * rng.randint( 2 , 4 )
+    return ID3v2_tag( fields , corruption ) + b''.join( frames )
+
+def generate_library( inboxDir , nFiles , nArtists = 100 , corruptRate = 0.02 , depth = 3 , seed = 0 ):
+    """ Write 'nFiles' synthetic MP3s under 'inboxDir' , by 'nArtists' artists , with 'corruptRate' of the tags damaged ,
+    in dirs nested up to 'depth' deep , Return the number of bytes written """
+    rng     = random.Random( seed )
+    artists = [ ( "The " if i % 5 == 0 else "" ) + "Artist " + str( i ) for i in range( max( 1 , nArtists ) ) ]
+    nBytes  = 0
+    madeDirs = set()
+    for i in range( nFiles ):
+        dirPath = os.path.join( inboxDir , *[ "disc" + str( rng.randrange( 4 ) ) for _ in range( rng.randint( 0 , depth ) ) ] )
+        if dirPath not in madeDirs:
+            os.makedirs( dirPath , exist_ok = True )
+            madeDirs.add( dirPath )
+        fields = { 'TPE1' : rng.choice( artists ) , 'TIT2' : "Track " + str( i ) , 'TALB' : "Album " + str( i % 97 ) }
+        corruption = rng.choice( CORRUPTIONS ) if rng.random() < corruptRate else None
+        data = synthetic_MP3( rng , fields , corruption )
+        with open( os.path.join( dirPath , "Track " + str( i ) + ".mp3" ) , 'wb' ) as outFile:
+            outFile.write( data )
+        nBytes += len( data )
+    return nBytes
+
+# ___ END GENERATION _______________________________________________________________________________________________________________________
+
+
+# === BENCHMARK ============================================================================================================================
+
+def load_organizer():
+    """ Import organize-music-library.py , which cannot be imported by name because of the dashes """
+    spec = importlib.util.spec_from_file_location( "organize_music_library" , os.path.join( SOURCEDIR , "organize-music-library.py" ) )
+    module = importlib.util.module_from_spec( spec )
+    sys.modules[ spec.name ] = module # Registered , so that the process pool of the scan can find its functions by name
+    spec.loader.exec_module( module )
+    return module
+
+def peak_RSS_kB():
+    """ Return the high-water mark of this process's resident memory in kB , or None if it cannot be measured """
+    if resource is None:
+        return None
+    peak = resource.getrusage( resource.RUSAGE_SELF ).ru_maxrss
+    return peak // 1024 if sys.platform == 'darwin' else peak # macOS reports bytes , Linux reports kB
+
+def bench_size( nFiles , nArtists , corruptRate , depth , scanJobs , moveJobs , seed , skipXML = False ):
+    """ Generate a library of 'nFiles' and time each stage of the organizer on it , Return a list of result dicts """
+    oml     = load_organizer()
+    workDir = tempfile.mkdtemp( prefix = "bench_organizer_" )
+    results = []
+
+    def timed( stage , func , count ):
+        """ Run 'func' , Record its time , throughput , and the peak RSS so far , Return its result """
+        bgn     = time.perf_counter()
+        rtnVal  = func()
+        seconds = time.perf_counter() - bgn
+        results.append( { 'files' : nFiles , 'stage' : stage , 'items' : count() , 'seconds' : round( seconds , 6 ) ,
+                          'itemsPerSecond' : round( count() / seconds , 3 ) if seconds > 0 else None , 'peakRSS_kB' : peak_RSS_kB() } )
+        return rtnVal
+
+    try:
+        inboxDir = os.path.join( workDir , "library" , "zzz_Inbox" )
+        libDir   = os.path.join( workDir , "library" )
+        timed( 'generate' , lambda : generate_library( inboxDir , nFiles , nArtists , corruptRate , depth , seed ) , lambda : nFiles )
+        records   = timed( 'fetch_library_metadata' , lambda : oml.fetch_library_metadata( inboxDir , scanJobs ) , lambda : nFiles )
+        movePlan  = timed( 'create_move_plan' , lambda : oml.create_move_plan( records , libDir ) , lambda : len( records ) )
+        execution = timed( 'execute_move_plan' , lambda : oml.execute_move_plan( movePlan , workers = moveJobs ) , lambda : len( movePlan ) )
+        timed( 'del_empty_subdirs' , lambda : oml.del_empty_subdirs( inboxDir ) , lambda : len( execution ) )
+        if not skipXML:
+            timed( 'records_to_XML_string' ,
+                   lambda : oml.records_to_XML_string( records , os.path.join( workDir , "fileLog.txt" ) ) , lambda : len( records ) )
+
+        def write_JSONL():
+            """ Write the file log as JSON Lines , for comparison with XML """
+            with oml.RecordLogWriter( os.path.join( workDir , "fileLog.jsonl" ) , 'jsonl' ) as outLog:
+                for record in records:
+                    outLog.write( record )
+
+        timed( 'RecordLogWriter_jsonl' , write_JSONL , lambda : len( records ) )
+        failed = sum( 1 for report in execution if not report[ 'success' ] )
+        if failed:
+            print( "bench_organizer: WARNING ," , failed , "operations failed" , file = sys.stderr )
+    finally:
+        shutil.rmtree( workDir , ignore_errors = True )
+    return results
+
+def run_benchmark( args ):
+    """ Benchmark every size in 'args.sizes' in a separate process , Return the report dict """
+    report = { 'python' : platform.python_version() , 'platform' : platform.platform() , 'cpus' : os.cpu_count() ,
+               'params' : { 'artists' : args.artists , 'corrupt' : args.corrupt , 'depth' : args.depth ,
+                            'jobs' : args.jobs , 'moveJobs' : args.move_jobs , 'seed' : args.seed } ,
+               'results' : [] }
+    for nFiles in args.sizes:
+        print( "bench_organizer: Benchmarking" , nFiles , "files ..." , file = sys.stderr )
+        childArgs = [ sys.executable , os.path.abspath( __file__ ) , '--child' ,
+                      '--sizes' , str( nFiles ) , '--artists' , str( args.artists ) , '--corrupt' , str( args.corrupt ) ,
+                      '--depth' , str( args.depth ) , '--jobs' , str( args.jobs ) , '--move-jobs' , str( args.move_jobs ) ,
+                      '--seed' , str( args.seed ) ] + ( [ '--skip-xml' ] if args.skip_xml else [] )
+        child = subprocess.run( childArgs , stdout = subprocess.PIPE , check = True )
+        report[ 'results' ].extend( json.loads( child.stdout.decode( 'utf-8' ) ) )
+    return report
+
+# ___ END BENCHMARK ________________________________________________________________________________________________________________________
+
+
+# === Main =================================================================================================================================
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser( description = "Benchmark the music library organizer on synthetic libraries" )
+    parser.add_argument( '--sizes' , type = int , nargs = '+' , default = DEFAULTSIZES , help = "Library sizes , in files" )
+    parser.add_argument( '--artists' , type = int , default = 100 , help = "Number of distinct artists" )
+    parser.add_argument( '--corrupt' , type = float , default = 0.02 , help = "Fraction of files with damaged tags" )
+    parser.add_argument( '--depth' , type = int , default = 3 , help = "Deepest nesting of the inbox dirs" )
+    parser.add_argument( '--jobs' , type = int , default = 1 , help = "Tag-parsing processes" )
+    parser.add_argument( '--move-jobs' , type = int , default = 1 , help = "Move threads" )
+    parser.add_argument( '--seed' , type = int , default = 0 , help = "Seed for the library generator" )
+    parser.add_argument( '--skip-xml' , action = 'store_true' , help = "Do not time 'records_to_XML_string' , which is slow" )
+    parser.add_argument( '--out' , default = '-' , help = "Report file , '-' for standard output" )
+    parser.add_argument( '--child' , action = 'store_true' , help = argparse.SUPPRESS ) # Benchmark one size in this process
+    args = parser.parse_args()
+
+    if args.child:
+        logging.getLogger( 'eyed3' ).setLevel( logging.ERROR ) # The damaged tags would flood standard error
+        print( json.dumps( bench_size( args.sizes[0] , args.artists , args.corrupt , args.depth , args.jobs , args.move_jobs , args.seed ,
+                                       args.skip_xml ) ) )
+    else:
+        reportStr = json.dumps( run_benchmark( args ) , indent = 2 )
+        if args.out == '-':
+            print( reportStr )
+        else:
+            with open( args.out , 'w' ) as outFile:
+                outFile.write( reportStr )
+
+# ___ End Main _____________________________________________________________________________________________________________________________
@@ -13,9 +13,8 @@ File ops for music organization
 
 # ~~~ Imports ~~~
 # ~~ Standard ~~
-import os
+import os , errno , shutil , stat , hashlib , unicodedata , string , subprocess
 from math import pi , sqrt
-from random import choice
 # ~~ Special ~~
 import numpy as np
 # ~~ Local ~~
@@ -25,44 +24,496 @@ EPSILON = 1e-7
 infty   = 1e309 # URL: http://stackoverflow.com/questions/1628026/python-infinity-any-caveats#comment31860436_1628026
 endl    = os.linesep
 
-# URL: http://code.activestate.com/recipes/65117-converting-between-ascii-numbers-and-characters/
-ASCII_ALPHANUM = [chr(code) for code in xrange(48,57+1)]+[chr(code) for code in xrange(65,90+1)]+[chr(code) for code in xrange(97,122+1)]
 DISALLOWEDCHARS = "\\/><|:&; \r\t\n.\"\'?*" # Do not create a directory or file with these chars
 
 # === RENAMING =============================================================================================================================
 
+SAFENAMETABLE = str.maketrans( '' , '' , DISALLOWEDCHARS + string.whitespace ) # Deletes every disallowed char and whitespace
+
 def safe_dir_name( trialStr , defaultChar = None ):
-    """ Return a string stripped of all disallowed chars """
-    rtnStr = ""
-    if trialStr: # if a string was received 
-        for char in trialStr: # for each character of the input string
-            if char not in DISALLOWEDCHARS and not char.isspace(): # If the character is not disallowed and is not whitespace
-                try:
-                    char = char.encode( 'ascii' , 'ignore' ) # Ignore conv errors but inconsistent # http://stackoverflow.com/a/2365444/893511
-                    rtnStr += char # Append the char to the proper directory name
-                except:
-                    if defaultChar == None:
-                        rtnStr += choice( ASCII_ALPHANUM ) # Random ASCII character so that completely unreadable names are not overwritten
-                    else:
-                        rtnStr += defaultChar
-        return rtnStr
-    else:
+    """ Return a string stripped of all disallowed chars , Accented letters are folded to ASCII , other non-ASCII chars are dropped 
+    or replaced with 'defaultChar' if given , A name with nothing readable gets a name derived from its hash """
+    # NOTE: Works on the whole string with 'unicodedata' and 'str.translate' , instead of one char at a time
+    if not trialStr: # if no string was received 
         return None
+    folded = unicodedata.normalize( 'NFKD' , trialStr ) # Split accented letters into a letter and a combining mark , "é" --> "e´"
+    if defaultChar is None:
+        rtnStr = folded.encode( 'ascii' , 'ignore' ).decode( 'ascii' ) # http://stackoverflow.com/a/2365444/893511
+    else:
+        rtnStr = "".join( char if ord( char ) < 128 else defaultChar for char in folded if not unicodedata.combining( char ) )
+    rtnStr = rtnStr.translate( SAFENAMETABLE )
+    if not rtnStr: # Completely unreadable name , Use the same stand-in every time so that files are not scattered across runs
+        rtnStr = "X" + hashlib.blake2b( trialStr.encode( 'utf-8' , 'surrogatepass' ) , digest_size = 4 ).hexdigest()
+    return rtnStr
 
 # ___ END NAME _____________________________________________________________________________________________________________________________
 
 
-# === DIRECTORIES ==========================================================================================================================
+# === TAG READING ==========================================================================================================================
+
+# Read only the ID3v2 frames we need , the ID3v1 footer , and the first MPEG frame , without touching the rest of the audio payload
+# URL , ID3v2.3 structure: http://id3.org/id3v2.3.0
+# URL , MPEG frame header: http://www.mp3-tech.org/programmer/frame_header.html
+
+ID3_FRAME_FIELDS = { 'TPE1' : 'artist' , 'TIT2' : 'title' , 'TALB' : 'album' , 'TPE2' : 'albumArtist' , # ID3v2.3 / ID3v2.4 frame IDs
+                     'TP1'  : 'artist' , 'TT2'  : 'title' , 'TAL'  : 'album' , 'TP2'  : 'albumArtist' } # ID3v2.2 frame IDs
+ID3_TEXT_ENCODINGS = { 0 : 'latin-1' , 1 : 'utf-16' , 2 : 'utf-16-be' , 3 : 'utf-8' }
+MPEG_SYNC_WINDOW   = 65536 # Search at most this many bytes past the ID3v2 tag for the first MPEG frame
+MPEG_READ_CHUNK    =  4096 # Read the search window in chunks of this size
+MPEG_MAX_FRAME     =  2884 # Longest possible MPEG frame ( MPEG2.5 L3 160kbps @ 8kHz ) plus a header , in bytes
+
+# Bitrates in kbps , indexed by [ MPEG1? ][ layer ][ bitrate index ]
+MPEG_BITRATES = {
+    True  : { 1 : ( 0 , 32 , 64 , 96 , 128 , 160 , 192 , 224 , 256 , 288 , 320 , 352 , 384 , 416 , 448 ) ,
+              2 : ( 0 , 32 , 48 , 56 ,  64 ,  80 ,  96 , 112 , 128 , 160 , 192 , 224 , 256 , 320 , 384 ) ,
+              3 : ( 0 , 32 , 40 , 48 ,  56 ,  64 ,  80 ,  96 , 112 , 128 , 160 , 192 , 224 , 256 , 320 ) } ,
+    False : { 1 : ( 0 , 32 , 48 , 56 ,  64 ,  80 ,  96 , 112 , 128 , 144 , 160 , 176 , 192 , 224 , 256 ) ,
+              2 : ( 0 ,  8 , 16 , 24 ,  32 ,  40 ,  48 ,  56 ,  64 ,  80 ,  96 , 112 , 128 , 144 , 160 ) ,
+              3 : ( 0 ,  8 , 16 , 24 ,  32 ,  40 ,  48 ,  56 ,  64 ,  80 ,  96 , 112 , 128 , 144 , 160 ) } ,
+}
+# Sample rates in Hz , indexed by [ version bits ][ sample rate index ]
+MPEG_SAMPLERATES = { 3 : ( 44100 , 48000 , 32000 ) , 2 : ( 22050 , 24000 , 16000 ) , 0 : ( 11025 , 12000 , 8000 ) }
 
-def makedirs_exist_ok( path ):
-    """ Mimic the 3.6 behavior 'os.makedirs( path , exist_ok = 1 )' """
-    if not os.path.isdir( path ):
-        os.makedirs( path )
-        print path , "- CREATED"
+def syncsafe_int( data ):
+    """ Decode a big-endian integer stored 7 bits per byte , as ID3v2 does for sizes """
+    rtnInt = 0
+    for byte in data:
+        rtnInt = ( rtnInt << 7 ) | ( byte & 0x7F )
+    return rtnInt
+
+def decode_ID3_text( payload ):
+    """ Decode the payload of an ID3v2 text frame , Return None if it is empty or undecodable """
+    if len( payload ) < 1 or payload[0] not in ID3_TEXT_ENCODINGS:
+        return None
+    try:
+        text = payload[1:].decode( ID3_TEXT_ENCODINGS[ payload[0] ] )
+    except UnicodeDecodeError:
+        return None
+    text = text.rstrip( '\x00' ).replace( '\x00' , '/' ) # ID3v2.4 separates multiple values with nulls
+    return text if text else None
+
+def read_ID3v2_fields( f , header ):
+    """ Read the wanted text frames from the ID3v2 tag whose 10-byte 'header' was just read from 'f' , Return ( fields , tag end ) """
+    # NOTE: Frames we do not need are skipped with 'seek' , so large APIC (cover art) frames are never read
+    major   = header[3]
+    flags   = header[5]
+    tagEnd  = 10 + syncsafe_int( header[6:10] ) + ( 10 if ( major == 4 and flags & 0x10 ) else 0 ) # Account for the v2.4 footer
+    fields  = {}
+    if major not in ( 2 , 3 , 4 ) or ( major == 2 and flags & 0x40 ): # Unknown version , or v2.2 compression
+        return None , tagEnd
+    hdrLen  = 6 if major == 2 else 10
+    idLen   = 3 if major == 2 else 4
+    # 1. A whole-tag unsynchronisation ( v2.2 / v2.3 ) means that the frames must be un-escaped before parsing , read the tag
+    if flags & 0x80 and major < 4:
+        body = f.read( tagEnd - 10 ).replace( b'\xff\x00' , b'\xff' )
+        read = lambda pos , n : body[ pos - 10 : pos - 10 + n ]
     else:
-        print path , "- EXISTS!"
+        def read( pos , n ):
+            f.seek( pos )
+            return f.read( n )
+    pos = 10
+    # 2. Skip the extended header
+    if flags & 0x40 and major > 2:
+        extHdr = read( pos , 4 )
+        pos += syncsafe_int( extHdr ) if major == 4 else 4 + int.from_bytes( extHdr , 'big' )
+    # 3. Visit each frame header , and read only the payloads of frames we want
+    while pos + hdrLen <= tagEnd and len( fields ) < 4:
+        frameHdr = read( pos , hdrLen )
+        if len( frameHdr ) < hdrLen or frameHdr[0] == 0: # Reached the padding
+            break
+        frameID = frameHdr[ :idLen ].decode( 'latin-1' )
+        if major == 2:
+            frameSize  = int.from_bytes( frameHdr[3:6] , 'big' )
+            frameFlags = 0
+        else:
+            frameSize  = syncsafe_int( frameHdr[4:8] ) if major == 4 else int.from_bytes( frameHdr[4:8] , 'big' )
+            frameFlags = int.from_bytes( frameHdr[8:10] , 'big' )
+        pos += hdrLen
+        if frameID in ID3_FRAME_FIELDS and ID3_FRAME_FIELDS[ frameID ] not in fields:
+            payload = read( pos , frameSize )
+            if major == 4:
+                if frameFlags & 0x000C: # Compressed or encrypted , let the full parser deal with it
+                    return None , tagEnd
+                if frameFlags & 0x0002:
+                    payload = payload.replace( b'\xff\x00' , b'\xff' )
+                if frameFlags & 0x0001: # Data length indicator precedes the payload
+                    payload = payload[4:]
+            elif major == 3:
+                if frameFlags & 0x00C0: # Compressed or encrypted , let the full parser deal with it
+                    return None , tagEnd
+                if frameFlags & 0x0020: # Grouping identity byte precedes the payload
+                    payload = payload[1:]
+            fields[ ID3_FRAME_FIELDS[ frameID ] ] = decode_ID3_text( payload )
+        pos += frameSize
+    return fields , tagEnd
+
+def read_ID3v1_fields( footer ):
+    """ Parse the 128-byte ID3v1 'footer' , Return a dict of fields or None if there is no ID3v1 tag """
+    if len( footer ) < 128 or footer[:3] != b'TAG':
+        return None
+    text = lambda data : data.split( b'\x00' , 1 )[0].decode( 'latin-1' ).strip() or None
+    return { 'title' : text( footer[3:33] ) , 'artist' : text( footer[33:63] ) , 'album' : text( footer[63:93] ) , 'albumArtist' : None }
+
+def parse_MPEG_header( data , i ):
+    """ Decode the 4-byte MPEG audio frame header at 'data[i]' , Return a dict or None if it is not a valid header """
+    if i + 4 > len( data ) or data[i] != 0xFF or ( data[i+1] & 0xE0 ) != 0xE0:
+        return None
+    verBits = ( data[i+1] >> 3 ) & 0x03
+    layer   = 4 - ( ( data[i+1] >> 1 ) & 0x03 )
+    brIndex = data[i+2] >> 4
+    srIndex = ( data[i+2] >> 2 ) & 0x03
+    if verBits == 1 or layer == 4 or brIndex in ( 0 , 15 ) or srIndex == 3: # Reserved values , or free-format bitrate
+        return None
+    mpeg1   = ( verBits == 3 )
+    bitrate = MPEG_BITRATES[ mpeg1 ][ layer ][ brIndex ] * 1000
+    srate   = MPEG_SAMPLERATES[ verBits ][ srIndex ]
+    padding = ( data[i+2] >> 1 ) & 0x01
+    mono    = ( data[i+3] >> 6 ) == 3
+    if layer == 1:
+        samples  = 384
+        frameLen = ( 12 * bitrate // srate + padding ) * 4
+    else:
+        samples  = 1152 if ( layer == 2 or mpeg1 ) else 576
+        frameLen = ( samples // 8 ) * bitrate // srate + padding
+    # Offset of the Xing/Info header , which follows the side information of the first frame
+    xingOff = 4 + ( ( 17 if mono else 32 ) if mpeg1 else ( 9 if mono else 17 ) )
+    return { 'bitrate' : bitrate , 'srate' : srate , 'samples' : samples , 'frameLen' : frameLen , 'xingOff' : xingOff }
+
+def MPEG_duration( f , audioStart , audioEnd ):
+    """ Estimate the duration of the MPEG audio between 'audioStart' and 'audioEnd' from its first frame , Return seconds or None """
+    f.seek( audioStart )
+    window = f.read( MPEG_READ_CHUNK )
+    i = window.find( b'\xff' )
+    while True:
+        # Grow the window in small chunks until a frame ( and the start of the next one ) fits , or the search limit is reached
+        if ( i < 0 or i + MPEG_MAX_FRAME > len( window ) ) and len( window ) < MPEG_SYNC_WINDOW:
+            more = f.read( MPEG_READ_CHUNK )
+            if more:
+                window += more
+                if i < 0:
+                    i = window.find( b'\xff' , len( window ) - len( more ) )
+                continue
+        if i < 0:
+            break
+        frame = parse_MPEG_header( window , i )
+        # Require the next frame to also be valid , random data often contains something that looks like one header
+        if frame and ( i + frame[ 'frameLen' ] + 4 > len( window ) or parse_MPEG_header( window , i + frame[ 'frameLen' ] ) ):
+            # 1. VBR files carry the total number of frames in a Xing/Info or VBRI header inside the first frame
+            xing = i + frame[ 'xingOff' ]
+            if window[ xing : xing + 4 ] in ( b'Xing' , b'Info' ) and int.from_bytes( window[ xing+4 : xing+8 ] , 'big' ) & 0x01:
+                numFrames = int.from_bytes( window[ xing+8 : xing+12 ] , 'big' )
+                return numFrames * frame[ 'samples' ] / frame[ 'srate' ]
+            if window[ i+36 : i+40 ] == b'VBRI':
+                numFrames = int.from_bytes( window[ i+50 : i+54 ] , 'big' )
+                return numFrames * frame[ 'samples' ] / frame[ 'srate' ]
+            # 2. Otherwise assume a constant bitrate
+            return ( audioEnd - ( audioStart + i ) ) * 8 / frame[ 'bitrate' ]
+        i = window.find( b'\xff' , i + 1 )
+    return None
+
+def read_tags_fast( fPath ):
+    """ Read artist / title / album / album artist and duration from the file at 'fPath' without reading the audio payload ,
+    Return a dict , with 'tagVersion' None if the file has no tags , Return None if the file could not be parsed """
+    try:
+        with open( fPath , 'rb' , buffering = 0 ) as f: # Unbuffered , so that only the bytes asked for are read
+            fileSize = os.fstat( f.fileno() ).st_size
+            header   = f.read( 10 )
+            fields   = None
+            tagVer   = None
+            audioStart = 0
+            # 1. ID3v2 at the front of the file
+            if len( header ) == 10 and header[:3] == b'ID3':
+                fields , audioStart = read_ID3v2_fields( f , header )
+                if fields is None:
+                    return None
+                tagVer = "ID3v2." + str( header[3] )
+            # 2. ID3v1 at the end of the file , used only if there was no ID3v2 tag
+            audioEnd = fileSize
+            if fileSize >= 128:
+                f.seek( fileSize - 128 )
+                v1Fields = read_ID3v1_fields( f.read( 128 ) )
+                if v1Fields is not None:
+                    audioEnd = fileSize - 128
+                    if fields is None:
+                        fields = v1Fields
+                        tagVer = "ID3v1"
+            # 3. Duration from the first MPEG frame
+            seconds = MPEG_duration( f , audioStart , audioEnd )
+    except ( IOError , OSError ):
+        return None
+    if seconds is None: # Not MPEG audio that we understand
+        return None
+    rtnDict = { 'artist' : None , 'title' : None , 'album' : None , 'albumArtist' : None }
+    if fields:
+        rtnDict.update( fields )
+    rtnDict[ 'tagVersion' ]    = tagVer
+    rtnDict[ 'total_seconds' ] = seconds
+    return rtnDict
+
+# ___ END TAG ______________________________________________________________________________________________________________________________
+
+
+# === AUDIO HASHING ========================================================================================================================
+
+HASHSPAN = 65536 # Bytes hashed at each end of the audio for a partial hash
+
+def audio_span( fPath ):
+    """ Return ( start , end ) byte offsets of the audio in the MP3 at 'fPath' , excluding the ID3v2 and ID3v1 tags """
+    with open( fPath , 'rb' , buffering = 0 ) as f:
+        fileSize = os.fstat( f.fileno() ).st_size
+        header   = f.read( 10 )
+        start    = 0
+        if len( header ) == 10 and header[:3] == b'ID3':
+            start = 10 + syncsafe_int( header[6:10] ) + ( 10 if ( header[3] == 4 and header[5] & 0x10 ) else 0 )
+        end = fileSize
+        if fileSize - start >= 128:
+            f.seek( fileSize - 128 )
+            if f.read( 3 ) == b'TAG':
+                end = fileSize - 128
+    return min( start , end ) , end
+
+def hash_file_span( fPath , start , end , partial = False ):
+    """ Return the digest of bytes 'start' to 'end' of the file at 'fPath' , only the first and last 'HASHSPAN' bytes if 'partial' """
+    digest = hashlib.blake2b( digest_size = 16 )
+    with open( fPath , 'rb' ) as f:
+        if partial and end - start > 2 * HASHSPAN:
+            spans = ( ( start , HASHSPAN ) , ( end - HASHSPAN , HASHSPAN ) )
+        else:
+            spans = ( ( start , end - start ) , )
+        for pos , nBytes in spans:
+            f.seek( pos )
+            while nBytes > 0:
+                data = f.read( min( COPYCHUNK , nBytes ) )
+                if not data:
+                    break
+                digest.update( data )
+                nBytes -= len( data )
+    return digest.digest()
+
+# ___ END HASHING __________________________________________________________________________________________________________________________
+
+
+# === ACOUSTIC FINGERPRINTS ================================================================================================================
+
+FFMPEG     = "ffmpeg" # Decoder used for fingerprinting , already needed by the YouTube downloads
+FPRATE     = 11025 # -- Samples per second that audio is decoded at , enough for the highest band
+FPWINDOW   = 30.0 # --- Seconds of audio decoded from the middle of each track
+FPFRAME    = 2048 # --- Samples per FFT frame
+FPHOP      = 512 # ---- Samples between the starts of consecutive frames , Frames overlap so that two envelopes line up within 25 ms
+FPBANDS    = 16 # ----- Spectral bands , log-spaced from 'FPLOWHZ' to 'FPHIGHHZ'
+FPLOWHZ    = 80.0 # --- Bottom edge of the lowest band
+FPHIGHHZ   = 5000.0 # - Top edge of the highest band , well below the cutoff of a 128k encode
+FPFLOORDB  = 40.0 # --- Bands and frames more than this many dB below the loudest one are raised to that floor
+FPMAXLAG   = 6.0 # ---- Most seconds that two envelopes are slid against each other , allows for silence trimmed from one end
+FPDIM      = FPBANDS # Length of the spectrum vector of a fingerprint
+
+def decode_audio_window( fPath , startSec , durSec , rate = FPRATE ):
+    """ Decode 'durSec' seconds of the audio at 'fPath' , from 'startSec' , to mono float samples at 'rate' with ffmpeg , 
+    Return None if it could not be decoded """
+    cmd = [ FFMPEG , '-v' , 'error' , '-nostdin' , '-ss' , str( startSec ) , '-t' , str( durSec ) , '-i' , fPath , 
+            '-vn' , '-ac' , '1' , '-ar' , str( rate ) , '-f' , 's16le' , '-' ]
+    try:
+        proc = subprocess.run( cmd , stdout = subprocess.PIPE , stderr = subprocess.DEVNULL )
+    except OSError: # ffmpeg is not installed
+        return None
+    if proc.returncode != 0 or len( proc.stdout ) < 2 * FPFRAME:
+        return None
+    return np.frombuffer( proc.stdout , dtype = '<i2' ).astype( np.float32 ) / 32768.0
+
+def audio_fingerprint( samples , rate = FPRATE ):
+    """ Return the fingerprint ( spectrum , envelope ) of 'samples' , or None if they are silent or too short , 'spectrum' is the 
+    'FPDIM' log band energies of the whole window , 'envelope' is the log loudness of each frame within the bands """
+    # NOTE: Both are in bels with their mean subtracted , so they do not change with the gain , The spectrum is NOT scaled to unit 
+    #       length , that would erase its tilt and make a dark track and a bright one look alike , It is divided by sqrt( FPDIM ) 
+    #       instead , so that the distance between two spectra is the RMS difference of their bands
+    # NOTE: The spectrum finds the candidates , the envelope gives the time structure that confirms them , see 'envelope_correlation'
+    nFrames = ( len( samples ) - FPFRAME ) // FPHOP + 1
+    if nFrames < 2:
+        return None
+    frames  = samples[ FPHOP * np.arange( nFrames )[ : , None ] + np.arange( FPFRAME )[ None , : ] ] * np.hanning( FPFRAME )
+    power   = np.abs( np.fft.rfft( frames , axis = 1 ) ) ** 2
+    bandDex = np.searchsorted( np.geomspace( FPLOWHZ , FPHIGHHZ , FPBANDS + 1 ) , np.fft.rfftfreq( FPFRAME , 1.0 / rate ) , 
+                               side = 'right' ) - 1 # Band of each FFT bin , -1 or 'FPBANDS' if it is outside all bands
+    bandMat = ( bandDex[ : , None ] == np.arange( FPBANDS )[ None , : ] ).astype( power.dtype ) # bin x band , 1 where the bin is in the band
+    bandPow = power @ bandMat # frame x band
+    if bandPow.sum() <= EPSILON: # Silence
+        return None
+    spectrum  = np.log10( bandPow.sum( axis = 0 ) + 1e-12 )
+    spectrum  = np.maximum( spectrum , spectrum.max() - FPFLOORDB / 10.0 ) # Near-empty bands hold mostly encoder noise , floor them
+    spectrum -= spectrum.mean()
+    envelope  = np.log10( bandPow.sum( axis = 1 ) + 1e-12 )
+    envelope  = np.maximum( envelope , envelope.max() - FPFLOORDB / 10.0 ) # Near-silent frames , likewise
+    envelope -= envelope.mean()
+    return ( spectrum / np.sqrt( FPDIM ) ).astype( np.float32 ) , envelope.astype( np.float16 ) # Half precision keeps the cache small
+
+def envelope_correlation( envA , envB , maxLag = FPMAXLAG , rate = FPRATE ):
+    """ Return the highest correlation of the envelopes 'envA' and 'envB' over the shifts of up to 'maxLag' seconds , from -1 to 1 """
+    # NOTE: Two tracks that sound the same have the same loudness from moment to moment , at some shift , Two different tracks with 
+    #       the same overall spectrum ( one album , one mastering ) do not
+    envA    = envA.astype( np.float32 )
+    envB    = envB.astype( np.float32 )
+    minLen  = min( len( envA ) , len( envB ) ) // 2 # Shorter overlaps than this are not compared
+    lagMax  = int( maxLag * rate / FPHOP )
+    best    = -1.0
+    for lag in range( -lagMax , lagMax + 1 ):
+        partA = envA[ max( 0 , lag ) : ]
+        partB = envB[ max( 0 , -lag ) : ]
+        nOver = min( len( partA ) , len( partB ) )
+        if nOver < max( 2 , minLen ):
+            continue
+        partA = partA[ : nOver ] - partA[ : nOver ].mean()
+        partB = partB[ : nOver ] - partB[ : nOver ].mean()
+        scale = np.sqrt( np.dot( partA , partA ) * np.dot( partB , partB ) )
+        if scale > EPSILON:
+            best = max( best , float( np.dot( partA , partB ) / scale ) )
+        elif np.dot( partA , partA ) <= EPSILON and np.dot( partB , partB ) <= EPSILON: # Both steady , only the spectrum can tell them apart
+            best = 1.0
+    return best
+
+def fingerprint_file( fPath , totalSeconds = None ):
+    """ Return the fingerprint ( spectrum , envelope ) of the audio at 'fPath' , or None if it could not be decoded """
+    # NOTE: The window is centered on the middle of the track , so silence trimmed from either end only shifts it a little
+    startSec = max( 0.0 , totalSeconds / 2.0 - FPWINDOW / 2.0 ) if totalSeconds else 0.0
+    samples  = decode_audio_window( fPath , startSec , FPWINDOW )
+    return None if samples is None else audio_fingerprint( samples )
+
+# ___ END FINGERPRINTS _____________________________________________________________________________________________________________________
+
+
+# === FILE MOVING ==========================================================================================================================
+
+COPYCHUNK  = 8 * 1024 * 1024 # Bytes handed to each 'sendfile' call
+FSYNCBATCH = 64 # ------------- Copies held before they are synced to disk and their origins are removed
+COPYSUFFIX = ".oml.part" # ---- Added to the destination of a copy until it is synced , so that a copy cut short is never mistaken for a file
+
+def stat_file( fPath ):
+    """ Return the 'os.stat' of 'fPath' if it is a regular file , otherwise None """
+    try:
+        info = os.stat( fPath )
+    except OSError:
+        return None
+    return info if stat.S_ISREG( info.st_mode ) else None
+
+def copy_file_data( srcFd , dstFd , nBytes ):
+    """ Copy 'nBytes' from 'srcFd' to 'dstFd' in chunks , in kernel space with 'os.sendfile' if possible , Return bytes copied """
+    copied = 0
+    if hasattr( os , 'sendfile' ):
+        try:
+            while copied < nBytes:
+                sent = os.sendfile( dstFd , srcFd , copied , min( COPYCHUNK , nBytes - copied ) )
+                if sent == 0: # File shrank while copying
+                    break
+                copied += sent
+            return copied
+        except OSError as err:
+            # NOTE: Some filesystems do not support 'sendfile' , fall back to copying through user space if nothing was sent yet
+            if copied or err.errno not in ( errno.EINVAL , errno.ENOSYS , errno.EOPNOTSUPP ):
+                raise
+    while True:
+        data = os.read( srcFd , COPYCHUNK )
+        if not data:
+            break
+        view = memoryview( data )
+        while view:
+            view = view[ os.write( dstFd , view ): ]
+        copied += len( data )
+    return copied
+
+class CrossDeviceMover( object ):
+    """ Move files between devices by copying , Origins are removed only after a batch of copies has been synced to disk """
+    # NOTE: One 'fsync' per copied file is unavoidable , but syncing a batch at a time lets the disk write the copies in any order
+    #       and keeps every origin in place until its copy is durable
+    # NOTE: Each copy is written to its destination plus 'COPYSUFFIX' , and only renamed to the destination once it is synced
+    
+    def __init__( self , batchSize = FSYNCBATCH ):
+        """ Start with no pending copies """
+        self.batchSize = batchSize
+        self.pending   = [] # ( srcPath , dstPath , dstFd , tag ) , copies that have not been synced yet
+        self.failed    = [] # tags of the copies that could not be synced
+
+    def move( self , srcPath , dstPath , srcInfo = None , tag = None ):
+        """ Copy 'srcPath' to 'dstPath' and queue the removal of 'srcPath' , Return bytes copied """
+        srcInfo  = srcInfo if srcInfo is not None else os.stat( srcPath )
+        partPath = dstPath + COPYSUFFIX
+        srcFd    = os.open( srcPath , os.O_RDONLY )
+        try:
+            dstFd = os.open( partPath , os.O_WRONLY | os.O_CREAT | os.O_EXCL , stat.S_IMODE( srcInfo.st_mode ) ) # Never overwrite
+            try:
+                nBytes = copy_file_data( srcFd , dstFd , srcInfo.st_size )
+            except:
+                os.close( dstFd )
+                os.unlink( partPath )
+                raise
+        finally:
+            os.close( srcFd )
+        shutil.copystat( srcPath , partPath ) # Keep the modification time of the original
+        self.pending.append( ( srcPath , dstPath , dstFd , tag ) )
+        if len( self.pending ) >= self.batchSize:
+            self.sync_pending()
+        return nBytes
+
+    def sync_pending( self ):
+        """ Sync all pending copies and their directories to disk , then remove the origins of the copies that were synced """
+        synced = []
+        for srcPath , dstPath , dstFd , tag in self.pending:
+            partPath = dstPath + COPYSUFFIX
+            try:
+                os.fsync( dstFd )
+                if os.path.lexists( dstPath ): # Something took the name while the copy was pending , never overwrite it
+                    raise FileExistsError( errno.EEXIST , "Destination exists" , dstPath )
+                os.rename( partPath , dstPath )
+                synced.append( ( srcPath , dstPath , tag ) )
+            except OSError:
+                self.failed.append( tag )
+                try:
+                    os.unlink( partPath ) # Keep the origin , drop the copy that may be incomplete
+                except OSError:
+                    pass
+            finally:
+                os.close( dstFd )
+        self.pending = []
+        for dirPath in set( os.path.dirname( dstPath ) for srcPath , dstPath , tag in synced ):
+            try: # Make the new directory entries durable , Not supported on all platforms
+                dirFd = os.open( dirPath , os.O_RDONLY )
+                try:
+                    os.fsync( dirFd )
+                finally:
+                    os.close( dirFd )
+            except OSError:
+                pass
+        for srcPath , dstPath , tag in synced:
+            try:
+                os.unlink( srcPath )
+            except OSError:
+                self.failed.append( tag )
+
+    def flush( self ):
+        """ Sync all pending copies , Return the tags of all copies that failed since the last flush """
+        self.sync_pending()
+        failed , self.failed = self.failed , []
+        return failed
+
+def move_file( srcPath , dstPath , srcInfo = None , dstDev = None , mover = None , tag = None ):
+    """ Move 'srcPath' to 'dstPath' , atomic rename on the same device , chunked copy across devices , Return ( mode , bytes moved ) """
+    # NOTE: If a 'mover' is given , a cross-device origin is not removed until 'mover.flush' is called
+    srcInfo = srcInfo if srcInfo is not None else os.stat( srcPath )
+    dstDev  = dstDev if dstDev is not None else os.stat( os.path.dirname( os.path.abspath( dstPath ) ) ).st_dev
+    if srcInfo.st_dev == dstDev:
+        try:
+            os.rename( srcPath , dstPath )
+            return 'rename' , srcInfo.st_size
+        except OSError as err:
+            if err.errno != errno.EXDEV: # Same device , different mount points , Copy instead
+                raise
+    if mover is not None:
+        return 'copy' , mover.move( srcPath , dstPath , srcInfo , tag )
+    mover  = CrossDeviceMover()
+    nBytes = mover.move( srcPath , dstPath , srcInfo , tag )
+    if mover.flush():
+        raise OSError( errno.EIO , "Copy could not be synced" , dstPath )
+    return 'copy' , nBytes
 
-# ___ END DIR ________________________________________________________________________________________________________________________________
+# ___ END MOVING ___________________________________________________________________________________________________________________________
 
 
 # === Testing ==============================================================================================================================
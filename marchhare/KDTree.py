@@ -1,11 +1,14 @@
-#!/usr/bin/env python
+#!/usr/bin/env python3
 
 
 import numpy as np
 from math import pi , sqrt
 
 from random import choice , randrange # ADDED
-from types import NoneType # ADDED
+NoneType = type( None ) # ADDED , 'types.NoneType' only exists for Python 3.10+
+
+from marchhare.Vector import vec_dif_sqr , vec_dif_mag
+from marchhare.Utils3 import indexw , BPQ , LPQ
 
 
 # === RRT classes and functions ===
@@ -27,10 +30,11 @@ class TreeNode:
 class kdNode: # ADDED
     """ Search tree node with the combined aspects of a kd-tree binary node and an RRT search node """    
     
-    def __init__( self , pState , pSplitDim = 0 , pParent = None , pLeft = None , pRight = None ):
-        """ Create a node representing a configuration state """
+    def __init__( self , pState , pSplitDim = 0 , pParent = None , pLeft = None , pRight = None , pData = None ):
+        """ Create a node representing a configuration state , optionally carrying 'pData' that the state describes """
         # Configuration State
         self.state = pState
+        self.data  = pData
         # Binary Node Members
         self.left = pLeft
         self.rght = pRight
@@ -70,7 +74,10 @@ class kdNode: # ADDED
         return self.__class__.__name__ + "@" + str( self.state )
 
 class kd_Tree_Approx:
-    """ kd-Tree for searching nearest neighbors in R^n space , NN search results are approximate but unsure why """
+    """ kd-Tree for searching nearest neighbors in R^n space """
+    # NOTE: Each search descends the side of the splitting plane that holds the test point , then crosses the plane only if the search 
+    #       radius ( squared , like all the distances in the queues ) reaches it , Results were approximate when the first side was 
+    #       chosen by the children's coordinates and the plane test mixed plain and squared distances
     
     def __init__( self , pDim ):
         """ Init the tree in which each node holds a state with 'pDim' """
@@ -85,79 +92,40 @@ class kd_Tree_Approx:
             addNode.splitDim = splitD
             rootNode = addNode
         elif addNode.state[ rootNode.splitDim ] < rootNode.state[ rootNode.splitDim ]: # else if the new nodes's splitting coord is less than root's splitting coord
-            rootNode.left = self.insert_recur( rootNode.left , addNode , indexw( splitD + 1 , addNode.state ) ) # increment splitting coord and recur on the left tree
+            rootNode.left = self.insert_recur( rootNode.left , addNode , indexw( addNode.state , splitD + 1 ) ) # increment splitting coord and recur on the left tree
         else: # else the new node's splitting coord is greater than or equal to the root's splitting coord
-            rootNode.rght = self.insert_recur( rootNode.rght , addNode , indexw( splitD + 1 , addNode.state ) ) # increment splitting coord and recur on the right tree
+            rootNode.rght = self.insert_recur( rootNode.rght , addNode , indexw( addNode.state , splitD + 1 ) ) # increment splitting coord and recur on the right tree
         return rootNode # Root exists at this level, and the new node was added at some deeper level, leave the root node intact
         
     def insert( self , addNode ):
         """ Add a node to the kd-tree """
         self.root = self.insert_recur( self.root , addNode , 0 )
         
-    def insert_state( self , addState ):
-        """ Create a node that corresponds to the configuration state and add it to the kd-tree """
-        self.root = self.insert_recur( self.root , kdNode( addState ) , 0 )
+    def insert_state( self , addState , data = None ):
+        """ Create a node that corresponds to the configuration state and add it to the kd-tree , Return the node """
+        addNode = kdNode( addState , pData = data )
+        self.root = self.insert_recur( self.root , addNode , 0 )
+        return addNode
 
     @staticmethod
     def NN_recur( testPoint , node , bestNode = None , bestDist = infty ):
-        """ Find the nearest neighbor to 'state' in the subtree below 'node' """
-        # Base Case: Once the algorithm reaches a leaf node, it saves that node point as the "current best"
-        if not node.left and not node.rght:
-            # testDist = vec_dif_sqr( node.state , testPoint )
-            splitDex = node.splitDim # Get the splitting dimension
-            return node , vec_dif_sqr( node.state , testPoint ) # testDist if testDist < bestDist else bestDist
-            
-        # Recurive Case: the algorithm moves down the tree recursively, in the same way that it would if the search point were being inserted 
-        #                 (i.e. it goes left or right depending on whether the point is lesser than or greater than the current node in the split dimension) 
-        
-        else: # else this is a non-leaf node
-            # before we go any further, check how far this node is from the test point
-            nodeDist = vec_dif_sqr( node.state , testPoint )
-            if nodeDist < bestDist:
-                bestDist = nodeDist
-                bestNode = node
-                
-            # Now we can check successors   
-            splitDex = node.splitDim # Get the splitting dimension
-            twoSides = False
-            leftBest = False
-            
-            # 1. Get the "current best" from the first leaf node encountered on the binary search
-            if node.left and node.rght: # Both branches are present, compare on the split dimension
-                twoSides = True
-                if abs( node.left.state[ splitDex ] - testPoint[ splitDex ] ) <= abs( node.rght.state[ splitDex ] - testPoint[ splitDex ] ):
-                    recurNode , recurDist = kd_Tree_Approx.NN_recur( testPoint , node.left , bestNode , bestDist ) # Current best from the left
-                    leftBest = True
-                else:
-                    recurNode , recurDist = kd_Tree_Approx.NN_recur( testPoint , node.rght , bestNode , bestDist ) # Current best from the right
-                
-            elif node.left: # Only the the left node exists, recur
-                recurNode , recurDist = kd_Tree_Approx.NN_recur( testPoint , node.left , bestNode , bestDist )  # Current best from the left
-                # No alternate branch to explore
-            else: # Only the the right node exists, recur
-                recurNode , recurDist = kd_Tree_Approx.NN_recur( testPoint , node.rght , bestNode , bestDist ) # Current best from the right
-                # No alternate branch to explore
-            # 2. The algorithm unwinds the recursion of the tree, performing the following steps at each node:
-            #    a. If the current node is closer than the current best, then it becomes the current best.
-            if recurDist < bestDist:
-                bestDist = recurDist
-                bestNode = recurNode
-                
-            #    b. The algorithm checks whether there could be any points on the other side of the splitting plane that are closer to 
-            #       the search point than the current best. If the best distance cross the cutting line, then search the other subtree
-            # radius = bestDist # The radius is the best distance so far
-            if abs( node.state[ splitDex ] - testPoint[ splitDex ] ) <= bestDist and twoSides: # If the radius crosses the split and there is another side
-                if leftBest:
-                    recurNode , recurDist = kd_Tree_Approx.NN_recur( testPoint , node.rght , bestNode , bestDist ) # Current best from the right
-                else:
-                    recurNode , recurDist = kd_Tree_Approx.NN_recur( testPoint , node.left , bestNode , bestDist ) # Current best from the left
-            
-            # Check for the best again, the other side may or may not have been better
-            if recurDist < bestDist:
-                bestDist = recurDist
-                bestNode = recurNode
-            
-        return bestNode , bestDist # vec_dif_mag( bestNode.state , testPoint ) # Return the closest node and the actual (not squared) distance
+        """ Find the nearest neighbor to 'state' in the subtree below 'node' , Return the node and the squared distance """
+        # Base Case: Reached past a leaf , nothing to compare
+        if node is None:
+            return bestNode , bestDist
+        # 1. Check how far this node is from the test point
+        nodeDist = vec_dif_sqr( node.state , testPoint )
+        if nodeDist < bestDist:
+            bestNode , bestDist = node , nodeDist
+        # 2. Recur on the side of the splitting plane that holds the test point , the same way the point would be inserted
+        splitDex = node.splitDim # Get the splitting dimension
+        splitGap = testPoint[ splitDex ] - node.state[ splitDex ]
+        nearSide , farSide = ( node.left , node.rght ) if splitGap < 0 else ( node.rght , node.left )
+        bestNode , bestDist = kd_Tree_Approx.NN_recur( testPoint , nearSide , bestNode , bestDist )
+        # 3. If the best distance crosses the splitting plane , then there could be a closer point on the other side , search it
+        if splitGap ** 2 <= bestDist:
+            bestNode , bestDist = kd_Tree_Approx.NN_recur( testPoint , farSide , bestNode , bestDist )
+        return bestNode , bestDist
         
     def NN( self , testState ):
         """ Find the nearest neighbor to 'state' """
@@ -166,55 +134,25 @@ class kd_Tree_Approx:
         
     @staticmethod
     def k_NN_recur( testPoint , node , k , bestQueue ):
-        """ Find the nearest neighbor to 'state' in the subtree below 'node' """
-        # Base Case: Once the algorithm reaches a leaf node, it saves that node point as the "current best"
-        if not node.left and not node.rght:
-            bestQueue.push( node , vec_dif_sqr( node.state , testPoint ) )
-            # return node , bestQueue # testDist if testDist < bestDist else bestDist
-            
-        # Recurive Case: the algorithm moves down the tree recursively, in the same way that it would if the search point were being inserted 
-        #                 (i.e. it goes left or right depending on whether the point is lesser than or greater than the current node in the split dimension) 
-        
-        else: # else this is a non-leaf node
-            # before we go any further, check how far this node is from the test point
-            bestQueue.push( node , vec_dif_sqr( node.state , testPoint ) )
-            
-            # Now we can check successors   
-            splitDex = node.splitDim # Get the splitting dimension
-            twoSides = False
-            leftBest = False
-            
-            # 1. Get the "current best" from the first leaf node encountered on the binary search
-            if node.left and node.rght: # Both branches are present, compare on the split dimension
-                twoSides = True
-                if abs( node.left.state[ splitDex ] - testPoint[ splitDex ] ) <= abs( node.rght.state[ splitDex ] - testPoint[ splitDex ] ):
-                    kd_Tree_Approx.k_NN_recur( testPoint , node.left , k , bestQueue ) # Current best from the left
-                    leftBest = True
-                else:
-                    kd_Tree_Approx.k_NN_recur( testPoint , node.rght , k , bestQueue ) # Current best from the right
-                
-            elif node.left: # Only the the left node exists, recur
-                kd_Tree_Approx.k_NN_recur( testPoint , node.left , k , bestQueue )  # Current best from the left
-                # No alternate branch to explore
-            else: # Only the the right node exists, recur
-                kd_Tree_Approx.k_NN_recur( testPoint , node.rght , k , bestQueue ) # Current best from the right
-                # No alternate branch to explore
-            # 2. The algorithm unwinds the recursion of the tree, performing the following steps at each node:
-            #    a. If the current node is closer than the current best, then it becomes the current best.
-            #    b. The algorithm checks whether there could be any points on the other side of the splitting plane that are closer to 
-            #       the search point than the current best. If the best distance cross the cutting line, then search the other subtree
-            if len( bestQueue ) < k and ( abs( node.state[ splitDex ] - testPoint[ splitDex ] ) <= bestQueue.btm_priority() and twoSides ) or \
-               ( abs( node.state[ splitDex ] - testPoint[ splitDex ] ) <= bestQueue.top_priority() and twoSides ): # If the radius crosses the split and there is another side
-                if leftBest:
-                    kd_Tree_Approx.k_NN_recur( testPoint , node.rght , k , bestQueue ) # Current best from the right
-                else:
-                    kd_Tree_Approx.k_NN_recur( testPoint , node.left , k , bestQueue ) # Current best from the left
-            
+        """ Push the 'k' nearest neighbors to 'state' in the subtree below 'node' onto the bounded 'bestQueue' """
+        # Base Case: Reached past a leaf , nothing to compare
+        if node is None:
+            return
+        # 1. Check how far this node is from the test point , The queue keeps only the 'k' best
+        bestQueue.push( node , vec_dif_sqr( node.state , testPoint ) )
+        # 2. Recur on the side of the splitting plane that holds the test point
+        splitDex = node.splitDim # Get the splitting dimension
+        splitGap = testPoint[ splitDex ] - node.state[ splitDex ]
+        nearSide , farSide = ( node.left , node.rght ) if splitGap < 0 else ( node.rght , node.left )
+        kd_Tree_Approx.k_NN_recur( testPoint , nearSide , k , bestQueue )
+        # 3. Search the other side while the queue is not full , or if the 'k'th best distance crosses the splitting plane
+        if len( bestQueue ) < k or splitGap ** 2 <= bestQueue.btm_priority():
+            kd_Tree_Approx.k_NN_recur( testPoint , farSide , k , bestQueue )
         # Return nothing, just unspool the queue after the algo has finished
     
     def k_NN( self , state , k ):
         """ Return the 'k' nearest neighbors to 'state' """
-        rtnQ = BPQwR( k )
+        rtnQ = BPQ( k )
         
         kd_Tree_Approx.k_NN_recur( state , self.root , k , rtnQ )
         rtnPnts , NN_dist = rtnQ.unspool()
@@ -224,55 +162,26 @@ class kd_Tree_Approx:
         
     @staticmethod
     def r_NN_recur( testPoint , node , r , bestQueue ):
-        """ Find the nearest neighbor to 'state' in the subtree below 'node' """
-        # Base Case: Once the algorithm reaches a leaf node, it saves that node point as the "current best"
-        if not node.left and not node.rght:
-            bestQueue.push( node , vec_dif_sqr( node.state , testPoint ) )
-            # return node , bestQueue # testDist if testDist < bestDist else bestDist
-            
-        # Recurive Case: the algorithm moves down the tree recursively, in the same way that it would if the search point were being inserted 
-        #                 (i.e. it goes left or right depending on whether the point is lesser than or greater than the current node in the split dimension) 
-        
-        else: # else this is a non-leaf node
-            # before we go any further, check how far this node is from the test point
-            bestQueue.push( node , vec_dif_sqr( node.state , testPoint ) )
-            
-            # Now we can check successors   
-            splitDex = node.splitDim # Get the splitting dimension
-            twoSides = False
-            leftBest = False
-            
-            # 1. Get the "current best" from the first leaf node encountered on the binary search
-            if node.left and node.rght: # Both branches are present, compare on the split dimension
-                twoSides = True
-                if abs( node.left.state[ splitDex ] - testPoint[ splitDex ] ) <= abs( node.rght.state[ splitDex ] - testPoint[ splitDex ] ):
-                    kd_Tree_Approx.r_NN_recur( testPoint , node.left , r , bestQueue ) # Current best from the left
-                    leftBest = True
-                else:
-                    kd_Tree_Approx.r_NN_recur( testPoint , node.rght , r , bestQueue ) # Current best from the right
-                
-            elif node.left: # Only the the left node exists, recur
-                kd_Tree_Approx.r_NN_recur( testPoint , node.left , r , bestQueue )  # Current best from the left
-                # No alternate branch to explore
-            else: # Only the the right node exists, recur
-                kd_Tree_Approx.r_NN_recur( testPoint , node.rght , r , bestQueue ) # Current best from the right
-                # No alternate branch to explore
-            # 2. The algorithm unwinds the recursion of the tree, performing the following steps at each node:
-            #    a. If the current node is closer than the current best, then it becomes the current best.
-            #    b. The algorithm checks whether there could be any points on the other side of the splitting plane that are closer to 
-            #       the search point than the current best. If the best distance cross the cutting line, then search the other subtree
-            if ( abs( node.state[ splitDex ] - testPoint[ splitDex ] ) <= r and twoSides ): # If the radius crosses the split and there is another side
-                if leftBest:
-                    kd_Tree_Approx.r_NN_recur( testPoint , node.rght , r , bestQueue ) # Current best from the right
-                else:
-                    kd_Tree_Approx.r_NN_recur( testPoint , node.left , r , bestQueue ) # Current best from the left
-            
+        """ Push every neighbor to 'state' in the subtree below 'node' that is within squared distance 'r' onto the limited 'bestQueue' """
+        # Base Case: Reached past a leaf , nothing to compare
+        if node is None:
+            return
+        # 1. Check how far this node is from the test point , The queue keeps only those within the radius
+        bestQueue.push( node , vec_dif_sqr( node.state , testPoint ) )
+        # 2. Recur on the side of the splitting plane that holds the test point
+        splitDex = node.splitDim # Get the splitting dimension
+        splitGap = testPoint[ splitDex ] - node.state[ splitDex ]
+        nearSide , farSide = ( node.left , node.rght ) if splitGap < 0 else ( node.rght , node.left )
+        kd_Tree_Approx.r_NN_recur( testPoint , nearSide , r , bestQueue )
+        # 3. If the radius crosses the splitting plane , then search the other side
+        if splitGap ** 2 <= r:
+            kd_Tree_Approx.r_NN_recur( testPoint , farSide , r , bestQueue )
         # Return nothing, just unspool the queue after the algo has finished
     
     def r_NN( self , state , r ):
         """ Return all the nearest neighbors to 'state' that are within distance 'r' """
         # print "Entered r_NN!"
-        rtnQ = LPQwR( r**2 ) # Using squared distance for the sake of efficiency
+        rtnQ = LPQ( r**2 ) # Using squared distance for the sake of efficiency
         
         kd_Tree_Approx.r_NN_recur( state , self.root , r**2 , rtnQ ) # Using squared distance for the sake of efficiency
         # rtnPnts = [ node.state for node in rtnQ.unspool()[0] ]
@@ -12,7 +12,7 @@ NOTE: This file is the 3.6 replacement for the 2.7 "marchhare.py"
 
 # ~~~ Imports ~~~
 # ~~ Standard ~~
-import os , builtins , operator , time , pickle
+import os , builtins , operator , time , pickle , heapq
 from math import pi , sqrt
 # ~~ Special ~~
 import numpy as np
@@ -340,10 +340,17 @@ class PriorityQueue( list ): # Requires heapq
         priority , count , item = heapq.heappop( self )
         return item , priority
 
+    def opposite_index( self ):
+        """ Return the index of the longest priority item , which is one of the leaves of the heap , not necessarily the last """
+        return max( range( len( self ) ) , key = self.__getitem__ ) # Entries are unique by ( priority , count ) , items are not compared
+
     def pop_opposite( self ):
         """ Remove the item with the longest priority , opoosite of the usual pop """
-        priority , count , item = self[-1]
+        oppDex = self.opposite_index()
+        priority , count , item = self[ oppDex ]
+        self[ oppDex ] = self[-1]
         del self[-1]
+        heapq.heapify( self ) # Restore the heap property after the swap
         return item
 
     def isEmpty(self):
@@ -371,7 +378,7 @@ class PriorityQueue( list ): # Requires heapq
 
     def peek_opposite( self ):
         """ Return the bottom priority item without popping it """
-        priority , count , item = self[-1]
+        priority , count , item = self[ self.opposite_index() ]
         return item
 
     def top_priority( self ):
@@ -380,7 +387,7 @@ class PriorityQueue( list ): # Requires heapq
 
     def btm_priority( self ):
         """ Return the value of the bottom priority """
-        return self[-1][0]
+        return self[ self.opposite_index() ][0]
 
     def get_priority_and_index( self , item , eqFunc = pyEq ):
         """ Return the priority for 'item' and the index it was found at , using the secified 'eqFunc' , otherwise return None if 'item' DNE """
@@ -394,6 +401,33 @@ class PriorityQueue( list ): # Requires heapq
         temp = list.pop( self , index ) # Remove the item at the former priority
         self.push( temp[-1] , priority ) # Push with new priority , this item should have the same hashable lookup
 
+class BPQ( PriorityQueue ): 
+    """ Bounded Priority Queue , does not keep more than N items in the queue """
+
+    def __init__( self , boundN , *args ):
+        """ Create a priority queue with a specified bound """
+        PriorityQueue.__init__( self , *args )
+        self.bound = boundN
+
+    def push( self , item , priority , hashable = None ):
+        """ Push an item onto the queue and discard largest priority items that are out of bounds """
+        PriorityQueue.push( self , item , priority , hashable ) # The usual push
+        while len( self ) > self.bound: # If we exceeded the bounds , then discard down to the limit
+            self.pop_opposite()
+
+class LPQ( PriorityQueue ): 
+    """ Limited Priority Queue , does not accept items with priorities longer than 'limit' """
+
+    def __init__( self , limitR , *args ):
+        """ Create a priority queue with a specified limit """
+        PriorityQueue.__init__( self , *args )
+        self.limit = limitR
+
+    def push( self , item , priority , hashable = None ):
+        """ Push an item onto the queue if it is leq the limit """
+        if priority <= self.limit:
+            PriorityQueue.push( self , item , priority , hashable ) # The usual push
+
 class Counter( dict ): 
     """ The counter object acts as a dict, but sets previously unused keys to 0 , in the style of 6300 """
     # TODO: Add Berkeley / 6300 functionality
@@ -520,6 +554,17 @@ def elemw( iterable , i ):
             return iterable[ 0 ]
         return iterable[ seqLen - revDex ]
 
+def indexw( iterable , i ): 
+    """ Return the 'i'th index of 'iterable', wrapping to index 0 at all integer multiples of 'len(iterable)' """
+    seqLen = len( iterable )
+    if i >= 0:
+        return i % ( seqLen )
+    else:
+        revDex = abs( i ) % ( seqLen )
+        if revDex == 0:
+            return 0
+        return seqLen - revDex
+
 # ___ END ITERABLE ___________________________________________________________________________________________________________________
 
 
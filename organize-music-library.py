@@ -1,7 +1,7 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 """
-organize-music-library.py , Built on Spyder for Python 2.7
+organize-music-library.py , Built on Spyder for Python 2.7 , Ported to Python 3
 James Watson, 2016 March
 Organize music library, try to gracefully handle duplicates and problem files
 
@@ -63,8 +63,12 @@ Main Sequence
    1.6.1. [X] Log the success of the plan execution 
    1.7.   [X] Check and execute directory deletion plans
    1.8.   [X] Implement a user menu
+   1.9.   [X] Move exact duplicates ( same audio , any tags ) to a folder for review
+   1.10.  [X] Journal the moves so that an interrupted run can be resumed , and any run can be undone
+   1.11.  [X] Profile each stage of a run , see 'StageProfiler'
+   1.12.  [X] Set aside near-duplicates ( same song , other encoding ) by acoustic fingerprint , see 'NearDuplicateFinder'
 2. Empty Dir Cleaning - COMPLETE
-3. Inbox Processing - NOT STARTED # This should be the default action to running the main file
+3. Inbox Processing - COMPLETE , see 'InboxWatcher' # This should be the default action to running the main file
 4. Adapt #1 for 2 & 3 
 
   == TODO ==
@@ -91,10 +95,10 @@ def add_first_valid_dir_to_path(dirList):
     validDir = first_valid_dir(dirList)
     if validDir:
         if validDir in sys.path:
-            print "Already in sys.path:", validDir
+            print( "Already in sys.path:", validDir )
         else:
             sys.path.append( validDir )
-            print 'Loaded:', str(validDir)
+            print( 'Loaded:', str(validDir) )
     else:
         raise ImportError("None of the specified directories were loaded") # Assume that not having this loaded is a bad thing
 # List all the places where the research environment could be
@@ -107,22 +111,33 @@ def add_first_valid_dir_to_path(dirList):
                                 #'F:\Python\ResearchEnv'] )
 
 # ~~ Constants , Shortcuts , Aliases ~~
-import __builtin__ # URL, add global vars across modules: http://stackoverflow.com/a/15959638/893511
-__builtin__.EPSILON = 1e-7 # Assume floating point errors below this level
-__builtin__.infty = 1e309 # URL: http://stackoverflow.com/questions/1628026/python-infinity-any-caveats#comment31860436_1628026
-__builtin__.endl = os.linesep # Line separator
+import builtins # URL, add global vars across modules: http://stackoverflow.com/a/15959638/893511
+builtins.EPSILON = 1e-7 # Assume floating point errors below this level
+builtins.infty = 1e309 # URL: http://stackoverflow.com/questions/1628026/python-infinity-any-caveats#comment31860436_1628026
+builtins.endl = os.linesep # Line separator
+import operator
+builtins.pyEq = operator.eq # Default python equality , 'marchhare.Utils3' expects these constants when they were set here
+builtins.piHalf = 1.5707963267948966
 
 # ~~ Libraries ~~
 # ~ Standard Libraries ~
-import os, time, shutil, sys , traceback
+import os, time, shutil, sys , traceback , errno , pickle , threading , zlib , json , argparse , select , struct , cProfile
+import ctypes , ctypes.util
 from datetime import datetime
-from random import choice
+from collections import deque
+from functools import lru_cache
+from concurrent.futures import ProcessPoolExecutor , ThreadPoolExecutor
 from copy import deepcopy
 from xml.dom.minidom import parseString
 # ~ Special Libraries ~
 import eyed3 # This script was built for eyed3 0.7.9
+import numpy as np
 from dicttoxml import dicttoxml # For logging
 # ~ Local Libraries ~
+from file_org_ops import ( safe_dir_name , read_tags_fast , stat_file , move_file , CrossDeviceMover , audio_span , 
+                           hash_file_span , fingerprint_file , envelope_correlation , FPDIM , FFMPEG , COPYSUFFIX )
+from marchhare.Utils3 import Stopwatch
+from marchhare.KDTree import kd_Tree_Approx
 
 # ~~ Script Signature ~~
 __progname__ = "Music Library Organizer"
@@ -139,7 +154,7 @@ def sep( title = "" , width = 6 , char = '=' , strOut = False ):
     if strOut:
         return LINE + ' ' + title + ' ' + LINE
     else:
-        print LINE + ' ' + title + ' ' + LINE
+        print( LINE + ' ' + title + ' ' + LINE )
 
 def format_epoch_timestamp( sysTime ): 
     """ Format epoch time into a readable timestamp """
@@ -151,10 +166,10 @@ def validate_dirs_writable( *dirList ):
     # NOTE: Assume that a writable directory is readable
     for directory in dirList:
         if not os.path.isdir( directory ):
-            print "Directory" , directory , "does not exist!"
+            print( "Directory" , directory , "does not exist!" )
             return False
         if not os.access( directory , os.W_OK ): # URL, Check write permission: http://stackoverflow.com/a/2113511/893511
-            print "System does not have write permission for" , directory , "!"
+            print( "System does not have write permission for" , directory , "!" )
             return False
     return True # All checks finished OK, return true
 
@@ -166,10 +181,6 @@ def tokenize_with_wspace( rawStr , evalFunc = str ):
 
 
 
-# TODO: Send to AsmEnv
-# URL: http://code.activestate.com/recipes/65117-converting-between-ascii-numbers-and-characters/
-ASCII_ALPHANUM = [chr(code) for code in xrange(48,57+1)]+[chr(code) for code in xrange(65,90+1)]+[chr(code) for code in xrange(97,122+1)]
-
 """ URL: https://msdn.microsoft.com/en-us/library/windows/desktop/aa365247(v=vs.85).aspx
 Use any character in the current code page for a name, including Unicode characters and characters in the extended character set (128–255), 
 except for the following reserved characters:
@@ -189,20 +200,91 @@ except for the following reserved characters:
 DISALLOWEDCHARS = "\\/><|:&; \r\t\n.\"\'?*" # Do not create a directory or file with these chars
 
 def strip_the( artistName ):
-    """ Strip a musical artist's name of a leading 'the ' , case insensitive """
+    """ Strip a musical artist's name of a leading 'the ' or a trailing ', the' , case insensitive """
     # NOTE: This must be run BEFORE 'proper_dir_name' because it relies on there being a space after "The"
     if artistName and artistName[:4].lower() == "the ": 
         return artistName[4:]
+    elif artistName and artistName[-5:].lower() == ", the": # "Beatles, The"
+        return artistName[:-5]
     else:
         return artistName
 
 # [X] Generate Simplified folder names # safe path with safe filename
 
+@lru_cache( maxsize = None ) # The same artist is on many files , sanitize each distinct name once
 def safe_artist_name( artistName ):
     """ Return a version of the artist name that has neither the definite article nor any disallowed chars """
     artistName = strip_the( artistName )
     return safe_dir_name( artistName )
 
+# [X] Merge variants of an artist name into one folder
+
+ARTISTTABLENAME = "artistAliases.tsv" # Name of the artist alias table , stored in the logging directory
+
+def artist_key( artistName ):
+    """ Return the key that all variants of 'artistName' share , lowercase ASCII letters and digits with no article """
+    # NOTE: "The Beatles" , "Beatles, The" , "BEATLES" , and "Beatles!" all have the key "beatles"
+    safeName = safe_artist_name( artistName )
+    if not safeName:
+        return None
+    return "".join( char for char in safeName.casefold() if char.isalnum() ) or safeName
+
+class ArtistResolver( object ):
+    """ Map each artist name to its canonical library folder , remembered across runs in a table of ( key , folder ) """
+    # NOTE: The first folder seen for a key becomes canonical , either from the table , an existing library folder , or the first record
+    # NOTE: Each distinct artist name is resolved once per run
+
+    def __init__( self , path = None , libraryPath = None ):
+        """ Load the table at 'path' if it exists , then add the folders that already exist under 'libraryPath' """
+        self.path    = path
+        self.folders = {} # key --> canonical folder name
+        self.byName  = {} # artist name --> canonical folder name , for this run
+        if path and os.path.isfile( path ):
+            self.load()
+        if libraryPath and os.path.isdir( libraryPath ):
+            self.seed( libraryPath )
+
+    def seed( self , libraryPath ):
+        """ Make each existing top-level folder of 'libraryPath' canonical for its key , unless the key already has a folder """
+        folderNames = sorted( entry.name for entry in os.scandir( libraryPath ) if entry.is_dir() and entry.name != DUPFOLDERNAME )
+        for folderName in folderNames:
+            key = artist_key( folderName )
+            if key and key not in self.folders:
+                self.folders[ key ] = folderName
+
+    def resolve( self , artistName ):
+        """ Return the canonical folder name for 'artistName' , or None if the name has no usable characters """
+        if artistName not in self.byName:
+            key = artist_key( artistName )
+            if key is None:
+                self.byName[ artistName ] = None
+            else:
+                self.byName[ artistName ] = self.folders.setdefault( key , safe_artist_name( artistName ) )
+        return self.byName[ artistName ]
+
+    def load( self ):
+        """ Load the table from 'self.path' , one tab-separated ( key , folder ) per line """
+        try:
+            with open( self.path , 'r' , encoding = 'utf-8' ) as inFile:
+                for line in inFile:
+                    fields = line.rstrip( '\n' ).split( '\t' )
+                    if len( fields ) == 2:
+                        self.folders[ fields[0] ] = fields[1]
+        except Exception as err:
+            print( "ArtistResolver: Could not load" , self.path , ", Starting a new table ..." , err )
+            self.folders = {}
+
+    def save( self ):
+        """ Write the table to 'self.path' , Write to a temp file first so that a crash does not corrupt the existing table """
+        tempPath = self.path + ".tmp"
+        with open( tempPath , 'w' , encoding = 'utf-8' ) as outFile:
+            outFile.writelines( key + '\t' + folder + '\n' for key , folder in sorted( self.folders.items() ) )
+        os.replace( tempPath , self.path )
+
+    def __len__( self ):
+        """ Return the number of keys in the table """
+        return len( self.folders )
+
 # [X] Generate NTFS-safe filename
 
 def safe_file_name( fName ):
@@ -214,78 +296,597 @@ def safe_file_name( fName ):
 
 # [X] Fetch all relevant metadata and display / return
 
-def fetch_library_metadata( searchPath ):
+SCANWORKERS = os.cpu_count() or 1 # Number of tag-parsing processes to use for a parallel scan
+SCANCHUNK   = 64 # ----------------- Number of files handed to a tag-parsing process at a time
+
+def scan_library_entries( searchPath , counts = None ):
+    """ Walk 'searchPath' , yielding ( dirName , fName , statInfo ) for every file , in a deterministic ( sorted , depth-first ) order """
+    # NOTE: 'os.scandir' caches the stat for each 'DirEntry' , so every file costs at most one stat call (none for dirs on Linux)
+    # NOTE: If a 'counts' dict is given , the 'scandir' and 'stat' calls are tallied in it , see 'StageProfiler'
+    dirStack = [ searchPath ]
+    while dirStack:
+        dirName = dirStack.pop()
+        if counts is not None:
+            counts[ 'scandir' ] = counts.get( 'scandir' , 0 ) + 1
+        try:
+            with os.scandir( dirName ) as dirIter:
+                entries = sorted( dirIter , key = lambda entry: entry.name )
+        except OSError as err:
+            print( "scan_library_entries: Could not scan" , dirName , err )
+            continue
+        subDirs = []
+        for entry in entries:
+            try:
+                if entry.is_dir( follow_symlinks = False ):
+                    subDirs.append( entry.path )
+                elif entry.is_file():
+                    if counts is not None:
+                        counts[ 'stat' ] = counts.get( 'stat' , 0 ) + 1
+                    yield dirName , entry.name , entry.stat()
+            except OSError as err: # The entry vanished or could not be stat'ed between the listing and now
+                print( "scan_library_entries: Could not stat" , entry.path , err )
+        dirStack.extend( reversed( subDirs ) ) # Push in reverse so that subdirs are popped in sorted order , same as 'os.walk'
+
+def fetch_song_metadata( fullPath ):
+    """ Read the ID3 tags of the file at 'fullPath' , Return a dict of song metadata , with dummy data if the tags could not be read """
+    # NOTE: Try the partial-read parser first , it reads only the tag frames and the first MPEG frame instead of the whole file
+    fastData = read_tags_fast( fullPath )
+    if fastData is not None:
+        if fastData[ 'tagVersion' ]: # Tags were found , but the artist may still be None just like with eyed3
+            return { key : fastData[ key ] for key in ( 'artist' , 'title' , 'album' , 'albumArtist' , 'total_seconds' ) }
+        return { 'artist' : 'Various' , 'title' : None , 'album' : None , 'albumArtist' : None , 'total_seconds' : None }
+    # Fall back to eyed3 for anything the fast parser could not handle
+    songData = {}
+    try:
+        audiofile = eyed3.core.load( fullPath ) # Load the file
+        audiofileTag = audiofile.tag # Instantiate an audio metadata object
+    except:
+        audiofileTag = None
+    if audiofileTag: # if the metadata was able to be loaded
+        songData[ 'artist' ] = audiofileTag.artist # -------------------- MP3 Artist
+        songData[ 'title' ] = audiofileTag.title # ---------------------- MP3 Title
+        songData[ 'album' ] = audiofileTag.album # ---------------------- MP3 Album
+        songData[ 'albumArtist' ] = audiofileTag.album_artist # --------- Album Artist
+        songData[ 'total_seconds' ] = audiofile.info.time_secs if audiofile.info else None # MP3 Length , None if no MPEG frame was found
+    else: # else could not load MP3 tags , Load dummy data
+        songData[ 'artist' ] = 'Various' # ------------------------------ MP3 Artist
+        songData[ 'title' ] = None # ------------------------------------ MP3 Title
+        songData[ 'album' ] = None # ------------------------------------ MP3 Album
+        songData[ 'albumArtist' ] = None # ------------------------------ Album Artist
+        songData[ 'total_seconds' ] = None # ---------------------------- MP3 Length
+    return songData
+
+class LibraryRecord( object ):
+    """ Everything we know about one file , Only the scanned fields are stored , the rest are derived on access """
+    # NOTE: '__slots__' removes the per-instance dict , which is most of the memory of a dict record
+    # NOTE: Supports 'record[ key ]' with the same keys as the original dict records , so that existing code reads it unchanged
+    __slots__ = ( 'folder' , #- Containing Directory
+                  'fileName' , # filename
+                  'modDate' , #- modification date 
+                  'size' , # --- size on disk
+                  'artist' , #-- MP3 Artist
+                  'title' , # -- MP3 Title
+                  'album' , # -- MP3 Album
+                  'albumArtist' , # Album Artist
+                  'total_seconds' ) # MP3 Length
+    KEYS = ( 'folder' , 'fileName' , 'fullPath' , 'EXT' , 'modDate' , 'modDateReadable' , 'size' , 'artist' , 'title' , 'album' , 
+             'albumArtist' , 'total_seconds' , 'mm:ss' , 'artistSafe' , 'fileNameSafe' ) # Keys of the original dict record , in order
+    KEYALIAS = { 'mm:ss' : 'mm_ss' } # Dict keys that are not valid attribute names
+
+    def __init__( self , folder , fileName , modDate , size , artist = 'Various' , title = None , album = None , 
+                  albumArtist = None , total_seconds = None ):
+        """ Store the scanned fields """
+        self.folder        = folder
+        self.fileName      = fileName
+        self.modDate       = modDate
+        self.size          = size
+        self.artist        = artist
+        self.title         = title
+        self.album         = album
+        self.albumArtist   = albumArtist
+        self.total_seconds = total_seconds
+
+    # ~ Derived Fields ~
+
+    @property
+    def fullPath( self ):
+        """ full path """
+        return os.path.join( self.folder , self.fileName )
+
+    @property
+    def EXT( self ):
+        """ extension , capitalized without the period """
+        return os.path.splitext( self.fileName )[1][1:].upper()
+
+    @property
+    def modDateReadable( self ):
+        """ modification date (human readable) """
+        return format_epoch_timestamp( self.modDate )
+
+    @property
+    def mm_ss( self ):
+        """ Time in mm:ss """
+        if self.total_seconds is None:
+            return ( None , None )
+        return ( int( self.total_seconds / 60 ) , self.total_seconds % 60 )
+
+    @property
+    def artistSafe( self ):
+        """ MP3 Artist (NTFS Safe) """
+        return safe_artist_name( self.artist )
+
+    @property
+    def fileNameSafe( self ):
+        """ File Name (NTFS Safe) """
+        return safe_file_name( self.fileName )
+
+    # ~ Dict Interface ~
+
+    def __getitem__( self , key ):
+        """ Return the field named 'key' , as if this were a dict record """
+        try:
+            return getattr( self , LibraryRecord.KEYALIAS.get( key , key ) )
+        except AttributeError:
+            raise KeyError( key )
+
+    def keys( self ):
+        """ Return the keys of the equivalent dict record """
+        return LibraryRecord.KEYS
+
+    def as_dict( self ):
+        """ Return the equivalent dict record , for logging """
+        return { key : self[ key ] for key in LibraryRecord.KEYS }
+
+    def __eq__( self , other ):
+        """ Records are equal if all their scanned fields are equal """
+        return isinstance( other , LibraryRecord ) and \
+               all( getattr( self , attr ) == getattr( other , attr ) for attr in LibraryRecord.__slots__ )
+
+    def __repr__( self ):
+        """ Show the record as its path and artist """
+        return "LibraryRecord( " + repr( self.fullPath ) + " , artist = " + repr( self.artist ) + " )"
+
+def fetch_file_record( dirName , fName , modDate , size , songData = None ):
+    """ Get information about one file , given the modification date and size from the scan , Return a 'LibraryRecord' """
+    # NOTE: If 'songData' is provided ( Ex: from a 'LibraryIndex' ) , then the file tags are not read again
+    if songData is None:
+        songData = fetch_song_metadata( os.path.join( dirName , fName ) )
+    return LibraryRecord( dirName , fName , modDate , size , **songData )
+
+def fetch_song_metadata_chunk( pathList ):
+    """ Read the tags of every path in 'pathList' , Return a list of song metadata dicts , One task for a process pool """
+    return [ fetch_song_metadata( fullPath ) for fullPath in pathList ]
+
+def fetch_song_metadata_timed_chunk( pathList ):
+    """ Same as 'fetch_song_metadata_chunk' , but Return a list of ( song metadata dict , seconds to parse ) , for 'StageProfiler' """
+    parsed = []
+    for fullPath in pathList:
+        watch    = Stopwatch()
+        songData = fetch_song_metadata( fullPath )
+        parsed.append( ( songData , watch.elapsed() ) )
+    return parsed
+
+def iter_library_metadata( searchPath , workers = 1 , index = None , profiler = None ):
+    """ Generate the record for each file under 'searchPath' as soon as it is available , in scan order """
+    # NOTE: With 'workers' > 1 , tag parsing is fanned out to a process pool in chunks of 'SCANCHUNK' files
+    #       At most 2 chunks per worker are in flight , so memory stays bounded no matter how large the library is
+    # NOTE: If a 'LibraryIndex' is given , only new or changed files have their tags parsed , and the index is updated in place
+    #       Entries for vanished files are pruned only once the generator has been exhausted
+    # NOTE: If a 'StageProfiler' is given , the walk and the tag parsing are timed as their own stages , and each parse is timed
+    pool      = ProcessPoolExecutor( max_workers = workers ) if workers > 1 else None
+    inFlight  = deque() # Queue of ( chunk , future ) , in scan order
+    chunk     = [] # ---- [ [ dirName , fName , modDate , size , songData , fileSig ] , ... ]
+    seenPaths = set()
+    parseFunc = fetch_song_metadata_chunk if profiler is None else fetch_song_metadata_timed_chunk
+
+    def finish_chunk( chunk , future ):
+        """ Fill in the song metadata of the files that were parsed , Update the index , Yield the finished records """
+        missing = [ entry for entry in chunk if entry[4] is None ]
+        if profiler is not None:
+            frame = profiler.enter( 'parse' )
+        if future is not None:
+            parsed = future.result()
+        else:
+            parsed = parseFunc( [ os.path.join( entry[0] , entry[1] ) for entry in missing ] )
+        if profiler is not None:
+            profiler.exit( frame , len( missing ) )
+            parsed = profiler.note_parses( parsed )
+        for entry , songData in zip( missing , parsed ):
+            entry[4] = songData
+            if index is not None:
+                index.update( os.path.join( entry[0] , entry[1] ) , entry[5] , songData )
+        for entry in chunk:
+            yield fetch_file_record( *entry[:5] )
+
+    def submit_chunk( chunk ):
+        """ Hand the files of 'chunk' that need parsing to the pool , Return the future or None if there is nothing to parse """
+        missPaths = [ os.path.join( entry[0] , entry[1] ) for entry in chunk if entry[4] is None ]
+        if pool is None or not missPaths:
+            return None
+        return pool.submit( parseFunc , missPaths )
+
+    entries = scan_library_entries( searchPath , None if profiler is None else profiler.opCounts )
+    if profiler is not None:
+        entries = profiler.timed_iter( 'walk' , entries )
+    try:
+        # 1. Walk the 'searchPath' , stat'ing each file exactly once , and fetch the cached tags of unchanged files
+        for dirName , fName , info in entries:
+            fullPath = os.path.join( dirName , fName )
+            fileSig  = LibraryIndex.signature( info )
+            songData = index.lookup( fullPath , fileSig ) if index is not None else None
+            seenPaths.add( fullPath )
+            chunk.append( [ dirName , fName , info.st_mtime , info.st_size , songData , fileSig ] )
+            # 2. Parse the tags of every file that was not found in the index , one chunk at a time
+            if len( chunk ) >= ( SCANCHUNK if pool else 1 ):
+                inFlight.append( ( chunk , submit_chunk( chunk ) ) )
+                chunk = []
+                while len( inFlight ) > 2 * workers or ( inFlight and inFlight[0][1] is None ):
+                    yield from finish_chunk( *inFlight.popleft() )
+        if chunk:
+            inFlight.append( ( chunk , submit_chunk( chunk ) ) )
+        while inFlight:
+            yield from finish_chunk( *inFlight.popleft() )
+    finally:
+        if pool is not None:
+            pool.shutdown( cancel_futures = True )
+
+    # 3. Forget files that were in the index but are no longer under 'searchPath'
+    if index is not None:
+        index.prune( searchPath , seenPaths )
+
+def fetch_library_metadata( searchPath , workers = 1 , index = None ):
     """ Get information about all the files in the 'libraryPath' , this will be used to generate file management actions """
     # The goal of this function is to get the information for everything in 'searchPath' we need for all follow-up file operations
-
-    allRecords = []
-
-    # Walk the 'searchPath'
-    for dirName , subdirList , fileList in os.walk( searchPath ): # for each subdir in 'searchPath', including 'searchPath'
-        for fName in fileList: # for each file in this subdir    
-
-            record = {} # Create a dictionary to store everything we find out about the file
-
-            # Information to get:
-            # ~ File Metadata ~
-            record[ 'folder' ] = dirName # ------------------------------------ Containing Directory
-            record[ 'fileName' ] = fName # ------------------------------------ filename
-            fullPath = os.path.join( dirName , fName )
-            record[ 'fullPath' ] = fullPath # --------------------------------- full path
-            record[ 'EXT' ] = os.path.splitext( fName )[1][1:].upper() # -------- extension
-            # creation date # This is not consistent across OS
-            record[ 'modDate' ] = os.path.getmtime( fullPath ) # -------------- modification date 
-            record[ 'modDateReadable' ] = \
-                format_epoch_timestamp( record[ 'modDate' ] ) # --------------- modification date (human readable)
-            record[ 'size' ] = os.path.getsize( fullPath ) # ------------------ size on disk
-            # ~ Song Metadata ~
-            try:
-                audiofile = eyed3.core.load( fullPath ) # Load the file
-                audiofileTag = audiofile.tag # Instantiate an audio metadata object
-            except:
-                audiofileTag = None
-            if audiofileTag: # if the metadata was able to be loaded
-                record[ 'artist' ] = audiofileTag.artist # -------------------- MP3 Artist
-                record[ 'title' ] = audiofileTag.title # ---------------------- MP3 Title
-                record[ 'album' ] = audiofileTag.album # ---------------------- MP3 Album
-                record[ 'albumArtist' ] = audiofileTag.album_artist # --------- Album Artist
-                record[ 'total_seconds' ] = audiofile.info.time_secs # -------- MP3 Length
-                record[ 'mm:ss' ] = ( int( audiofile.info.time_secs / 60 ) , 
-                                      audiofile.info.time_secs % 60 )# -------- Time in mm:ss
-            else: # else could not load MP3 tags , Load dummy data
-                record[ 'artist' ] = 'Various' # ------------------------------ MP3 Artist
-                record[ 'title' ] = None # ------------------------------------ MP3 Title
-                record[ 'album' ] = None # ------------------------------------ MP3 Album
-                record[ 'albumArtist' ] = None # ------------------------------ Album Artist
-                record[ 'total_seconds' ] = None # ---------------------------- MP3 Length
-                record[ 'mm:ss' ] = ( None , None ) # ------------------------- Time in mm:ss
-            # ~ Generated Metadata ~
-            record[ 'artistSafe' ] = safe_artist_name( record[ 'artist' ] ) # - MP3 Artist (NTFS Safe)
-            record[ 'fileNameSafe' ] = safe_file_name( record[ 'fileName' ] ) # File Name (NTFS Safe)
-
-            allRecords.append( record )
-
-    return allRecords
+    # NOTE: See 'iter_library_metadata' for the meaning of 'workers' and 'index'
+    return list( iter_library_metadata( searchPath , workers , index ) )
+
+# [X] Persistent file-signature index
+
+INDEXNAME = "libraryIndex.pkl" # Name of the scan index file , stored in the logging directory
+
+class LibraryIndex( object ):
+    """ On-disk map of file path --> ( signature , song metadata ) , so that unchanged files are not re-parsed on every scan """
+    # NOTE: A file signature is ( mtime in ns , size , inode ) , any change to one of these causes the tags to be read again
+    # NOTE: Each entry also holds a dict of costly per-file facts , Ex: audio span and hashes , that is dropped with the entry
+
+    def __init__( self , path = None ):
+        """ Create an empty index , then load the index at 'path' if it exists """
+        self.path    = path
+        self.entries = {} # fullPath --> ( signature , songData , extras )
+        self.hits    = 0 #- Lookups that were answered by the index since load
+        self.misses  = 0 #- Lookups that required the tags to be read since load
+        if path and os.path.isfile( path ):
+            self.load()
+
+    @staticmethod
+    def signature( info ):
+        """ Return the signature tuple for the 'os.stat_result' 'info' """
+        return ( info.st_mtime_ns , info.st_size , info.st_ino )
+
+    def lookup( self , fullPath , fileSig ):
+        """ Return the cached song metadata for 'fullPath' if its signature matches 'fileSig' , Otherwise return None """
+        entry = self.entries.get( fullPath , None )
+        if entry and entry[0] == fileSig:
+            self.hits += 1
+            return entry[1]
+        self.misses += 1
+        return None
+
+    def update( self , fullPath , fileSig , songData ):
+        """ Store the song metadata for 'fullPath' under 'fileSig' , Any cached extras of the old signature are dropped """
+        self.entries[ fullPath ] = ( fileSig , songData , {} )
+
+    def get_extra( self , fullPath , key , size = None ):
+        """ Return the cached 'key' fact of 'fullPath' , or None if there is none or the file is no longer 'size' bytes """
+        entry = self.entries.get( fullPath , None )
+        if entry is None or len( entry ) < 3 or ( size is not None and entry[0][1] != size ):
+            return None
+        return entry[2].get( key , None )
+
+    def set_extra( self , fullPath , key , value ):
+        """ Cache the 'key' fact of 'fullPath' , only if the file has an entry , Return True if it was cached """
+        entry = self.entries.get( fullPath , None )
+        if entry is None:
+            return False
+        if len( entry ) < 3: # Entry from an index written before extras were kept
+            entry = self.entries[ fullPath ] = ( entry[0] , entry[1] , {} )
+        entry[2][ key ] = value
+        return True
+
+    def prune( self , searchPath , seenPaths ):
+        """ Drop entries under 'searchPath' that are not in 'seenPaths' , Return the number of entries dropped """
+        prefix = os.path.join( searchPath , '' )
+        stale  = [ fullPath for fullPath in self.entries if fullPath.startswith( prefix ) and fullPath not in seenPaths ]
+        for fullPath in stale:
+            del self.entries[ fullPath ]
+        return len( stale )
+
+    def apply_moves( self , opReport ):
+        """ Re-key the entries of files that were successfully moved/renamed in 'opReport' , so that they are not re-parsed """
+        # NOTE: A rename keeps the inode and the mtime , so the moved entry will match on the next scan
+        #       A cross-device move creates a new inode , so that file will be re-parsed once
+        for operation in opReport:
+            if operation.get( 'success' , False ) and operation[ 'orgn' ] in self.entries:
+                self.entries[ operation[ 'dest' ] ] = self.entries.pop( operation[ 'orgn' ] )
+
+    def load( self ):
+        """ Load the index from 'self.path' , Start empty if the file could not be read """
+        try:
+            with open( self.path , 'rb' ) as inFile:
+                self.entries = pickle.load( inFile )
+        except Exception as err:
+            print( "LibraryIndex: Could not load" , self.path , ", Starting a new index ..." , err )
+            self.entries = {}
+
+    def save( self ):
+        """ Write the index to 'self.path' , Write to a temp file first so that a crash does not corrupt the existing index """
+        tempPath = self.path + ".tmp"
+        with open( tempPath , 'wb' ) as outFile:
+            pickle.dump( self.entries , outFile , pickle.HIGHEST_PROTOCOL )
+        os.replace( tempPath , self.path )
+
+    def __len__( self ):
+        """ Return the number of files in the index """
+        return len( self.entries )
 
 # [X] Generate a movement plan , per file
 
 EXTIGNORE = [ item.upper() for item in [ "txt" , "py" , "pyc" ] ]
 MISCFOLDERNAME = "Various" # Name of the folder for files without a readable artist name
 
-def create_move_plan( recordList , libraryPath ):
-    """ Given a 'recordList' created by 'fetch_library_metadata' generate a movement plan , per file """
-
-    plannedMoves = []
-
-    for record in recordList:
+DUPFOLDERNAME = "Duplicates" # Name of the folder that exact duplicates are moved to , for the user to review
+
+class DuplicateFilter( object ):
+    """ Find files whose audio is identical to a file seen earlier , ignoring the ID3 tags , in near-linear time """
+    # NOTE: Files are compared in three rounds , and each round runs only for files that matched in the previous one
+    #       1. Size of the audio , from the tag headers  2. Hash of the first and last 'HASHSPAN' bytes of audio  3. Hash of all the audio
+    # NOTE: The first file seen with some audio is kept , every later copy of that audio is a duplicate of it
+
+    def __init__( self , index = None ):
+        """ Start with no files seen , Audio spans and hashes are cached in the 'LibraryIndex' 'index' if one is given """
+        self.index  = index
+        self.bySize = {} # audio size --> [ entry , ... ] for kept files , entry = [ [ path , ... ] , start , end , partial , full , size ]
+        self.kept   = {} # path --> entry , for kept files
+        self.counts = { 'partialHashes' : 0 , 'fullHashes' : 0 , 'duplicates' : 0 , 'cachedSpans' : 0 , 'cachedHashes' : 0 }
+
+    def cached( self , paths , key , size ):
+        """ Return the 'key' fact cached in the index for the newest of 'paths' that has an entry , or None """
+        if self.index is None:
+            return None
+        for path in reversed( paths ):
+            value = self.index.get_extra( path , key , size )
+            if value is not None:
+                return value
+        return None
+
+    def cache( self , paths , key , value ):
+        """ Cache the 'key' fact in the index under the newest of 'paths' that has an entry """
+        if self.index is not None:
+            for path in reversed( paths ):
+                if self.index.set_extra( path , key , value ):
+                    return
+
+    def digest( self , entry , partial ):
+        """ Return the partial or full audio hash of 'entry' , reading it from the index or computing it on first use """
+        slot = 3 if partial else 4
+        key  = 'partialHash' if partial else 'fullHash'
+        if entry[ slot ] is None:
+            entry[ slot ] = self.cached( entry[0] , key , entry[5] )
+            if entry[ slot ] is not None:
+                self.counts[ 'cachedHashes' ] += 1
+                return entry[ slot ]
+            for path in reversed( entry[0] ): # The file may have been moved since it was seen , try the newest path first
+                try:
+                    entry[ slot ] = hash_file_span( path , entry[1] , entry[2] , partial )
+                    break
+                except OSError:
+                    pass
+            if entry[ slot ] is not None: # Count only the files that could be read
+                self.counts[ 'partialHashes' if partial else 'fullHashes' ] += 1
+                self.cache( entry[0] , key , entry[ slot ] )
+        return entry[ slot ]
+
+    def original_of( self , record ):
+        """ Return the path of the kept file that 'record' duplicates , or None if 'record' is kept """
+        path = record[ 'fullPath' ]
+        if path in self.kept: # Seen again after being moved
+            return None
+        span = self.cached( [ path ] , 'audioSpan' , record[ 'size' ] ) if record[ 'EXT' ] == 'MP3' else ( 0 , record[ 'size' ] )
+        if span is None:
+            try:
+                span = audio_span( path )
+            except OSError:
+                return None
+            self.cache( [ path ] , 'audioSpan' , span )
+        else:
+            self.counts[ 'cachedSpans' ] += record[ 'EXT' ] == 'MP3'
+        start , end = span
+        if end <= start: # Nothing to compare
+            return None
+        entry = [ [ path ] , start , end , None , None , record[ 'size' ] ]
+        for other in self.bySize.get( end - start , [] ):
+            partial = self.digest( entry , True )
+            if partial is not None and partial == self.digest( other , True ):
+                full = self.digest( entry , False )
+                if full is not None and full == self.digest( other , False ):
+                    self.counts[ 'duplicates' ] += 1
+                    return other[0][-1]
+        self.bySize.setdefault( end - start , [] ).append( entry )
+        self.kept[ path ] = entry
+        return None
+
+    def relocate( self , oldPath , newPath ):
+        """ Note that the kept file at 'oldPath' is planned to move to 'newPath' """
+        entry = self.kept.pop( oldPath , None )
+        if entry is not None:
+            entry[0].append( newPath )
+            self.kept[ newPath ] = entry
+
+NEARDUPRADIUS = 0.1 # --- Largest distance between the spectra of near-duplicates , the RMS difference of their bands in bels
+NEARDUPCORR   = 0.8 # --- Smallest correlation between the loudness envelopes of near-duplicates , see 'envelope_correlation'
+NEARDUPSLACK  = 10.0 # -- Most seconds that the lengths of near-duplicates may differ by , allows for trimmed silence
+NEARDUPEXT = [ "MP3" , "M4A" , "AAC" , "OGG" , "OPUS" , "FLAC" , "WAV" , "WMA" ] # Extensions of the files that are fingerprinted
+FPCACHEKEY = 'fingerprint' # Key of the fingerprints cached in the 'LibraryIndex'
+
+class NearDuplicateFinder( object ):
+    """ Find tracks that sound the same without being the same file , Ex: one song encoded at 128k and at 320k , or with trimmed silence """
+    # NOTE: Each track gets an acoustic fingerprint ( see 'audio_fingerprint' ) whose spectrum is indexed in a kd-tree , then each track
+    #       asks the tree for its nearest neighbors , so that finding the clusters does not compare every pair of tracks
+    # NOTE: A neighbor is only a candidate , it must also last about as long and have the same loudness envelope as the kept track
+    # NOTE: The largest file of each cluster ( usually the highest bitrate ) is kept , and every other member was matched against it
+    #       directly , so A ~ B ~ C never puts A and C together unless A ~ C as well
+
+    def __init__( self , radius = NEARDUPRADIUS , durationSlack = NEARDUPSLACK , minCorrelation = NEARDUPCORR ):
+        """ Start with no tracks """
+        self.tree           = kd_Tree_Approx( FPDIM )
+        self.nodes          = [] # Tree node of each track , the data of each node is the index of its track
+        self.tracks         = [] # [ ( fullPath , size , seconds ) , ... ]
+        self.envelopes      = [] # Loudness envelope of each track
+        self.radius         = radius
+        self.durationSlack  = durationSlack
+        self.minCorrelation = minCorrelation
+        self.counts         = { 'fingerprinted' : 0 , 'notFingerprinted' : 0 , 'cachedFingerprints' : 0 , 
+                                'unconfirmed' : 0 , 'nearDupClusters' : 0 , 'nearDuplicates' : 0 }
+
+    def add( self , fullPath , fingerprint , size , seconds = None ):
+        """ Index the 'fingerprint' of the track at 'fullPath' , Tracks that could not be fingerprinted are only counted """
+        if fingerprint is None:
+            self.counts[ 'notFingerprinted' ] += 1
+            return
+        spectrum , envelope = fingerprint
+        self.tracks.append( ( fullPath , size , seconds ) )
+        self.envelopes.append( envelope )
+        self.nodes.append( self.tree.insert_state( np.asarray( spectrum , dtype = float ) , len( self.tracks ) - 1 ) )
+        self.counts[ 'fingerprinted' ] += 1
+
+    def add_records( self , records , workers = 1 , index = None ):
+        """ Fingerprint the audio files among 'records' with 'workers' threads , and index them , 
+        Fingerprints are read from and written to the 'LibraryIndex' if one is given """
+        # NOTE: Threads are enough , the decoding is done by ffmpeg processes
+        tracks       = [ record for record in records if record[ 'EXT' ] in NEARDUPEXT ]
+        fingerprints = [ index.get_extra( record[ 'fullPath' ] , FPCACHEKEY , record[ 'size' ] ) if index is not None else None 
+                         for record in tracks ]
+        toDo         = [ dex for dex , fingerprint in enumerate( fingerprints ) if fingerprint is None ]
+        self.counts[ 'cachedFingerprints' ] += len( tracks ) - len( toDo )
+        with ThreadPoolExecutor( max_workers = max( 1 , workers ) ) as pool:
+            computed = pool.map( lambda dex : fingerprint_file( tracks[ dex ][ 'fullPath' ] , tracks[ dex ][ 'total_seconds' ] ) , toDo )
+            for dex , fingerprint in zip( toDo , computed ):
+                fingerprints[ dex ] = fingerprint
+                if index is not None and fingerprint is not None: # A failure is not cached , ffmpeg may be installed later
+                    index.set_extra( tracks[ dex ][ 'fullPath' ] , FPCACHEKEY , fingerprint )
+        for record , fingerprint in zip( tracks , fingerprints ):
+            self.add( record[ 'fullPath' ] , fingerprint , record[ 'size' ] , record[ 'total_seconds' ] )
+
+    def near( self , trackDex ):
+        """ Return the indices of the tracks whose spectra are within 'radius' of track 'trackDex' , itself included """
+        # NOTE: A radius search , and not 'k_NN' , because the radius is small , so only the branches near the track are visited , 
+        #       while the 'k'th neighbor of a track without duplicates is far away , and finding it visits most of the tree
+        nodes , dists = self.tree.r_NN( self.nodes[ trackDex ].state , self.radius )
+        return [ node.data for node in nodes ]
+
+    def same_length( self , i , j ):
+        """ Return True if tracks 'i' and 'j' are about as long as each other , or if either length is unknown """
+        iSec , jSec = self.tracks[i][2] , self.tracks[j][2]
+        return iSec is None or jSec is None or abs( iSec - jSec ) <= self.durationSlack
+
+    def correlation( self , i , j ):
+        """ Return the correlation of the loudness envelopes of tracks 'i' and 'j' """
+        return envelope_correlation( self.envelopes[i] , self.envelopes[j] )
+
+    def clusters( self ):
+        """ Return a list of clusters of near-duplicate tracks , each a list of track indices with the kept track first """
+        # NOTE: The tracks are visited largest first , each one that is not yet claimed is kept , and claims the candidates near it 
+        #       that pass the length and envelope checks , A candidate is only ever compared to a kept track
+        order   = sorted( range( len( self.tracks ) ) , key = lambda i : ( -self.tracks[i][1] , self.tracks[i][0] ) ) # Largest file first
+        claimed = set()
+        clusters = []
+        for i in order:
+            if i in claimed:
+                continue
+            claimed.add( i ) # Kept , a smaller track never claims it
+            members = [ i ]
+            for j in sorted( self.near( i ) , key = lambda j : ( -self.tracks[j][1] , self.tracks[j][0] ) ):
+                if j == i or j in claimed or not self.same_length( i , j ):
+                    continue
+                if self.correlation( i , j ) >= self.minCorrelation:
+                    members.append( j )
+                    claimed.add( j )
+                else: # Close spectra , but the time structure differs
+                    self.counts[ 'unconfirmed' ] += 1
+            if len( members ) > 1:
+                clusters.append( members )
+        return sorted( clusters , key = lambda members : self.tracks[ members[0] ][0] )
+
+    def iter_plan( self , libraryPath ):
+        """ Generate a 'dup' operation for every near-duplicate , moving it to 'DUPFOLDERNAME' under 'libraryPath' for review """
+        dupDir  = os.path.join( libraryPath , DUPFOLDERNAME )
+        claimed = set()
+        for members in self.clusters():
+            self.counts[ 'nearDupClusters' ] += 1
+            keptPath = self.tracks[ members[0] ][0]
+            for i in members[1:]:
+                fullPath = self.tracks[i][0]
+                self.counts[ 'nearDuplicates' ] += 1
+                yield { 'op': 'dup' , 
+                        'orgn': fullPath , 
+                        'orginDir' : os.path.dirname( fullPath ) , 
+                        'dest': claim_dest( claimed , dupDir , os.path.basename( fullPath ) , fullPath ) , 
+                        'destDir': dupDir , 
+                        'dupOf': keptPath , # the file that is kept
+                        'distance': round( float( np.linalg.norm( self.nodes[i].state - self.nodes[ members[0] ].state ) ) , 4 ) , 
+                        'correlation': round( self.correlation( i , members[0] ) , 4 ) }
+
+def plan_near_duplicates( libraryPath , workers = 1 , index = None , finder = None ):
+    """ Scan 'libraryPath' , fingerprint its audio , and Return the plan that moves every near-duplicate to 'DUPFOLDERNAME' """
+    # NOTE: Unlike the exact duplicates , the clusters need every fingerprint before the first one is known , so this is its own pass
+    if shutil.which( FFMPEG ) is None:
+        print( "plan_near_duplicates: WARNING ," , FFMPEG , "was not found , no track can be fingerprinted" , file = sys.stderr )
+    finder  = NearDuplicateFinder() if finder is None else finder
+    dupDir  = os.path.join( libraryPath , DUPFOLDERNAME )
+    records = ( record for record in iter_library_metadata( libraryPath , workers , index ) 
+                if not ( record[ 'folder' ] == dupDir or record[ 'folder' ].startswith( dupDir + os.sep ) ) ) # Already set aside
+    finder.add_records( records , workers , index )
+    return list( finder.iter_plan( libraryPath ) )
+
+def claim_dest( claimed , properDir , fileName , orgn , checkDisk = True ):
+    """ Return a path in 'properDir' that is not in the set 'claimed' ( nor on disk ) , adding "_2" , "_3" , ... to the name if needed """
+    # NOTE: With 'checkDisk' False , 'claimed' must already hold every name in 'properDir' , so that no stat call is needed
+    stem , ext = os.path.splitext( fileName )
+    dest = os.path.join( properDir , fileName )
+    num  = 1
+    while dest in claimed or ( checkDisk and dest != orgn and os.path.lexists( dest ) ):
+        num += 1
+        dest = os.path.join( properDir , stem + "_" + str( num ) + ext )
+    claimed.add( dest )
+    return dest
+
+def iter_move_plan( records , libraryPath , dupFilter = None , resolver = None ):
+    """ Given 'records' generated by 'iter_library_metadata' , generate the planned operation for each file that needs one """
+    # NOTE: If a 'dupFilter' is given , exact duplicates are planned to move to 'DUPFOLDERNAME' instead of being organized
+    # NOTE: If an 'ArtistResolver' is given , variants of an artist name are planned into one folder
+    dupDir  = os.path.join( libraryPath , DUPFOLDERNAME )
+    claimed = set() # Destinations of the operations planned so far
+
+    for record in records:
         # 1.   Get the file type
         ext = record[ 'EXT' ]
-        # 1.1. The action depends on the file type
-        if ext not in EXTIGNORE: 
+        # 1.1. The action depends on the file type , Files in the duplicates folder are left for the user
+        if ext not in EXTIGNORE and record[ 'folder' ] != dupDir: 
+            # 1.2. If the file is an exact duplicate of a file seen earlier , move it aside
+            original = dupFilter.original_of( record ) if dupFilter is not None else None
+            if original is not None:
+                yield { 'op': 'dup' , 
+                        'orgn': record[ 'fullPath' ] , 
+                        'orginDir' : record[ 'folder' ] , 
+                        'dest': claim_dest( claimed , dupDir , record[ 'fileNameSafe' ] , record[ 'fullPath' ] ) , 
+                        'destDir': dupDir , 
+                        'dupOf': original } # the file that is kept
+                continue
             if ext == 'MP3':
                 # 2.   Get the artist and proper file name , Determine the proper folder for this file
                 try:
-                    properDir = os.path.join( libraryPath , record[ 'artistSafe' ] ) # The file should be stored under the safe artist name
+                    artistDir = resolver.resolve( record[ 'artist' ] ) if resolver is not None else record[ 'artistSafe' ]
+                    properDir = os.path.join( libraryPath , artistDir ) # The file should be stored under the safe artist name
                 except Exception: # Could not retrieve a safe artist , send to MISC
                     # print "DEBUG:" , libraryPath , MISCFOLDERNAME
                     properDir = os.path.join( libraryPath , MISCFOLDERNAME ) 
@@ -296,81 +897,625 @@ def create_move_plan( recordList , libraryPath ):
             # 4.1. If the file is not in the right folder , move and perhaps rename
             if not correctLoc: # If the file is not in the proper directory , move and perhaps rename
                 # 4.1. If the file is not in the right folder , specify a move action    
-                plannedMoves.append( { 'op': 'mv' , # move operation
-                                       'orgn': record[ 'fullPath' ] , # from the current path
-                                       'orginDir' : record[ 'folder' ] ,
-                                       'dest': os.path.join( properDir , record[ 'fileNameSafe' ] ) , 
-                                       'destDir': properDir } ) # to the proper dir with a safe name
+                operation = { 'op': 'mv' , # move operation
+                              'orgn': record[ 'fullPath' ] , # from the current path
+                              'orginDir' : record[ 'folder' ] ,
+                              'dest': claim_dest( claimed , properDir , record[ 'fileNameSafe' ] , record[ 'fullPath' ] ) , 
+                              'destDir': properDir } # to the proper dir with a safe name
             elif not record[ 'fileNameSafe' ] == record[ 'fileName' ]:
-                plannedMoves.append( { 'op': 'nm' , 
-                                       'orgn': record[ 'fullPath' ] , 
-                                       'orginDir' : record[ 'folder' ] , # Origin and destination folders are the same in this case
-                                       'dest': os.path.join( record[ 'folder' ] , record[ 'fileNameSafe' ] ) , # Renamed in the same folder
-                                       'destDir': record[ 'folder' ] } )
-            # else the file is both in the proper dir and has a safe name , no action
-    return plannedMoves
+                operation = { 'op': 'nm' , 
+                              'orgn': record[ 'fullPath' ] , 
+                              'orginDir' : record[ 'folder' ] , # Origin and destination folders are the same in this case
+                              'dest': claim_dest( claimed , record[ 'folder' ] , record[ 'fileNameSafe' ] , record[ 'fullPath' ] ) , 
+                              'destDir': record[ 'folder' ] } # Renamed in the same folder
+            else: # else the file is both in the proper dir and has a safe name , no action
+                continue
+            if dupFilter is not None:
+                dupFilter.relocate( operation[ 'orgn' ] , operation[ 'dest' ] )
+            yield operation
+
+def create_move_plan( recordList , libraryPath , dupFilter = None , resolver = None ):
+    """ Given a 'recordList' created by 'fetch_library_metadata' generate a movement plan , per file """
+    return list( iter_move_plan( recordList , libraryPath , dupFilter , resolver ) )
 
 # [X] Check and execute directory creation plans
 # [X] Check and execute file move/rename plans
 
-def execute_move_plan( movePlan , verbose = False ): # Set simulate to 'True' to disable actual file operations
-    """ Carry out all dir creation / file move / file rename operations determined by 'create_move_plan' , return operation status """
-    opReport = deepcopy( movePlan ) # operation status , Create a deep copy of the move plan so that it can be annotated as we go
+EXECWORKERS = 4 # ---- Number of threads for a concurrent execution of the move plan
+EXECLANES   = 2 # ---- Number of concurrent move streams per ( origin device , destination device ) pair
+EXECBATCH   = 1024 # - Most operations executed concurrently at a time when streaming
+EXECWAIT    = 0.25 # - Seconds after its first operation that a streamed batch is executed , even if it is not full
+
+def iter_batches( items , size , wait ):
+    """ Generate lists of consecutive 'items' , Each is cut at 'size' items or once 'wait' seconds have passed since its first item """
+    batch   = []
+    started = 0.0
+    for item in items:
+        if not batch:
+            started = time.monotonic()
+        batch.append( item )
+        if len( batch ) >= size or time.monotonic() - started >= wait:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def plan_dir_creation( movePlan ):
+    """ Return the sorted list of unique destination directories needed by the move operations in 'movePlan' """
+    return sorted( set( operation[ 'destDir' ] for operation in movePlan if operation[ 'op' ] in ( 'mv' , 'dup' ) ) )
+
+class DestDirCache( object ):
+    """ Thread-safe memory of the destination directories that have been checked / created , so that each is created only once """
+    # NOTE: 'create_all' makes every planned directory up front , after that 'ensure' is a dict lookup with no system calls
+
+    def __init__( self ):
+        """ Start with no known directories """
+        self.lock    = threading.Lock()
+        self.status  = {} # dirPath --> True if the dir exists or was created , False if it could not be created
+        self.devices = {} # dirPath --> Device ID , see 'device_of'
+        self.counts  = { 'mvOps' : 0 , 'uniqueDestDirs' : 0 , 'dirsCreated' : 0 , 'dirSyscalls' : 0 }
+
+    def make_dir( self , dirPath ):
+        """ Create 'dirPath' , Return True if the directory exists afterwards , Caller must hold the lock """
+        # NOTE: One 'mkdir' per directory in the common case , an existing path costs one more call to check that it is a directory
+        self.counts[ 'uniqueDestDirs' ] += 1
+        self.counts[ 'dirSyscalls' ]    += 1
+        try:
+            os.mkdir( dirPath )
+            self.counts[ 'dirsCreated' ] += 1
+            return True
+        except FileExistsError:
+            self.counts[ 'dirSyscalls' ] += 1
+            return os.path.isdir( dirPath )
+        except FileNotFoundError: # A parent is missing as well
+            try: # http://stackoverflow.com/a/5032238/7186022
+                self.counts[ 'dirSyscalls' ] += 1
+                os.makedirs( dirPath , exist_ok = True )
+                self.counts[ 'dirsCreated' ] += 1
+                return True
+            except OSError:
+                return False
+        except OSError:
+            return False
 
-    def log_status( reportList , op ,  index , success , msg , verbose ):
-        """ Local helper function to add success/failure data to the record of each attempted operation """
-        reportList[ index ][ 'success' ] = success
-        reportList[ index ][ 'statusMsg' ] = msg
+    def create_all( self , dirList ):
+        """ Create every directory in 'dirList' that is not already known , in bulk """
+        with self.lock:
+            for dirPath in sorted( dirList ): # Sorted , so that parents are created before their children
+                if dirPath not in self.status:
+                    self.status[ dirPath ] = self.make_dir( dirPath )
+
+    def ensure( self , dirPath ):
+        """ Create 'dirPath' if this is the first time it was requested , Return True if the directory exists """
+        with self.lock:
+            self.counts[ 'mvOps' ] += 1
+            if dirPath not in self.status: # Not planned in advance , create it now
+                self.status[ dirPath ] = self.make_dir( dirPath )
+            return self.status[ dirPath ]
+
+    def device( self , dirPath ):
+        """ Return the device ID of 'dirPath' , Cached by dir """
+        with self.lock:
+            return device_of( dirPath , self.devices )
+
+    def summary( self ):
+        """ Return a dict of directory statistics for the exec log """
+        # NOTE: The per-op scheme made one 'isdir' per move , plus one 'makedirs' per missing directory
+        summary = dict( self.counts )
+        summary[ 'dirSyscallsSaved' ] = self.counts[ 'mvOps' ] + self.counts[ 'dirsCreated' ] - self.counts[ 'dirSyscalls' ]
+        return summary
+
+def execute_operation( operation , opDex , dirCache , verbose = False , mover = None ):
+    """ Carry out one dir creation / file move / file rename operation , Return a copy of 'operation' annotated with its status """
+    # NOTE: Moves within one device are atomic renames , moves across devices are copies handed to 'mover' , see 'settle_copies'
+    report = deepcopy( operation ) # operation status , Create a deep copy of the operation so that it can be annotated
+    report[ 'opNum' ] = opDex
+
+    def log_status( success , msg ):
+        """ Local helper function to add success/failure data to the record of the attempted operation """
+        report[ 'success' ] = success
+        report[ 'statusMsg' ] = msg
         if verbose:
-            print op[ 'op' ] , op[ 'orgn' ] , "Success?" , reportList[ index ][ 'success' ] , "Msg:" , reportList[ index ][ 'statusMsg' ]    
-
-    for opDex , operation in enumerate( movePlan ):
-        opReport[ opDex ][ 'opNum' ] = opDex
-        if operation[ 'op' ] == 'mv': # MOVE operation
-            dirSuccess = False
-            # Check that the origin file exists
-            if os.path.isfile( operation[ 'orgn' ] ):
+            print( operation[ 'op' ] , operation[ 'orgn' ] , "Success?" , report[ 'success' ] , "Msg:" , report[ 'statusMsg' ] )
+
+    if operation[ 'op' ] in ( 'mv' , 'dup' ): # MOVE operation , Duplicates are moved to the duplicates folder
+        # Check that the origin file exists
+        srcInfo = stat_file( operation[ 'orgn' ] )
+        if srcInfo is not None and os.path.lexists( operation[ 'dest' ] ): # Never overwrite a file
+            log_status( False , "FAIL: DESTINATION EXISTS" )
+        elif srcInfo is not None:
+            # Check that the destination directory exists , If the dest dir does not exist , create it
+            if dirCache.ensure( operation[ 'destDir' ] ): # If the directory exists
+                # Move the file
                 try:
-                    # Check that the destination directory exists
-                    if not os.path.isdir( operation[ 'destDir' ] ):
-                        # If the dest dir does not exist , create it
-                        try: # http://stackoverflow.com/a/5032238/7186022
-                            os.makedirs( operation[ 'destDir' ] )
-                            dirSuccess = True
-                        except OSError as exception:
-                            if exception.errno != errno.EEXIST: # For any other error than an already existent directory , raise
-                                raise
-                    else: # else the directory already exists , make sure to set the flag to allow move
-                        dirSuccess = True
-                except Exception as err:
-                    dirSuccess = False
-                if dirSuccess: # If the directory exists
-                    # Move the file , else simulate
-                    shutil.move( operation[ 'orgn' ] , operation[ 'dest' ] )
-                    # Check that the file was successfully moved and report status		
-                    if os.path.isfile( operation[ 'dest' ] ):
-                        log_status( opReport , operation , opDex , True , "SUCCESS" , verbose )
-                    else: # else could not find file at the intended destination
-                        log_status( opReport , operation , opDex , False , "FAIL: FILE NOT MOVED" , verbose )			
-                else: # else the directory was not found and was not created
-                    log_status( opReport , operation , opDex , False , "FAIL: DIRECTORY NOT CREATED" , verbose )    
-            else: # else the file was not found at the origin location
-                log_status( opReport , operation , opDex , False , "FAIL: ORIGIN FILE DNE" , verbose )    
-        elif operation[ 'op' ] == 'nm': # RENAME operation
-            # Check that the target file exists
-            if os.path.isfile( operation[ 'orgn' ] ):
+                    report[ 'moveMode' ] , report[ 'bytesMoved' ] = move_file( operation[ 'orgn' ] , operation[ 'dest' ] , srcInfo , 
+                                                                               dirCache.device( operation[ 'destDir' ] ) , mover , report )
+                except OSError as err:
+                    log_status( False , "FAIL: FILE NOT MOVED , " + str( err ) )
+                    return report
+                # Check that the file was successfully moved and report status , A pending copy is renamed into place by 'settle_copies'
+                if os.path.isfile( operation[ 'dest' ] ) or ( mover is not None and os.path.isfile( operation[ 'dest' ] + COPYSUFFIX ) ):
+                    log_status( True , "SUCCESS" )
+                else: # else could not find file at the intended destination
+                    log_status( False , "FAIL: FILE NOT MOVED" )
+            else: # else the directory was not found and was not created
+                log_status( False , "FAIL: DIRECTORY NOT CREATED" )
+        else: # else the file was not found at the origin location
+            log_status( False , "FAIL: ORIGIN FILE DNE" )
+    elif operation[ 'op' ] == 'nm': # RENAME operation
+        # Check that the target file exists
+        srcInfo = stat_file( operation[ 'orgn' ] )
+        if srcInfo is not None and os.path.lexists( operation[ 'dest' ] ): # Never overwrite a file
+            log_status( False , "FAIL: DESTINATION EXISTS" )
+        elif srcInfo is not None:
+            try:
                 os.rename( operation[ 'orgn' ] , operation[ 'dest' ] )
-                if os.path.isfile( operation[ 'dest' ] ):
-                    log_status( opReport , operation , opDex , True , "SUCCESS" , verbose )
-                else:
-                    log_status( opReport , operation , opDex , False , "FAIL: FILE NOT RENAMED" , verbose )	    
+            except OSError as err:
+                log_status( False , "FAIL: RENAME ERROR " + str( err ) )
+                return report
+            report[ 'moveMode' ] , report[ 'bytesMoved' ] = 'rename' , srcInfo.st_size
+            if os.path.isfile( operation[ 'dest' ] ):
+                log_status( True , "SUCCESS" )
             else:
-                log_status( opReport , operation , opDex , False , "FAIL: ORIGIN FILE DNE" , verbose )
-        else: # else an unrecognized operation was requested , notify
-            print "execute_move_plan: Operations type" , operation[ 'op' ] , "is not recognized!"
-            log_status( opReport , operation , opDex , False , "FAIL: OPERATION NOT RECOGNIZED" , verbose )
+                log_status( False , "FAIL: FILE NOT RENAMED" )
+        else:
+            log_status( False , "FAIL: ORIGIN FILE DNE" )
+    else: # else an unrecognized operation was requested , notify
+        print( "execute_move_plan: Operations type" , operation[ 'op' ] , "is not recognized!" )
+        log_status( False , "FAIL: OPERATION NOT RECOGNIZED" )
+    return report
+
+def settle_copies( mover ):
+    """ Sync the pending cross-device copies of 'mover' , Mark the reports of copies that could not be completed as failed """
+    for report in mover.flush():
+        report[ 'success' ]   = False
+        report[ 'statusMsg' ] = "FAIL: COPY NOT SYNCED"
+
+def execute_operations( operations , opOffset , dirCache , verbose = False ):
+    """ Carry out 'operations' in order , Return their status once all cross-device copies have been synced """
+    mover    = CrossDeviceMover()
+    opReport = [ execute_operation( operation , opOffset + i , dirCache , verbose , mover ) for i , operation in enumerate( operations ) ]
+    settle_copies( mover )
+    return opReport
+
+def device_of( dirPath , devCache ):
+    """ Return the device ID of 'dirPath' , or of its nearest existing ancestor if it does not exist yet , Cache results by dir """
+    if dirPath not in devCache:
+        try:
+            devCache[ dirPath ] = os.stat( dirPath ).st_dev
+        except OSError:
+            parent = os.path.dirname( dirPath )
+            devCache[ dirPath ] = device_of( parent , devCache ) if parent != dirPath else None
+    return devCache[ dirPath ]
+
+def execute_move_plan_concurrent( movePlan , verbose = False , workers = EXECWORKERS , lanesPerDevice = EXECLANES , 
+                                  opOffset = 0 , dirCache = None , stats = None ):
+    """ Carry out all operations in 'movePlan' with a thread pool , Operations are queued by ( origin device , destination device ) , 
+    Return operation status in the same order as 'movePlan' """
+    # NOTE: Each device pair gets 'lanesPerDevice' queues that run at the same time , so that a slow copy between two disks does not 
+    #       block moves between other disks , and so that one disk is not thrashed by more streams than it can serve
+    # NOTE: Operations with the same destination always share a lane , so they happen in plan order
+    movePlan = list( movePlan )
+    opReport = [ None ] * len( movePlan )
+    ownCache = dirCache is None
+    if ownCache:
+        dirCache = DestDirCache()
+        dirCache.create_all( plan_dir_creation( movePlan ) )
+    devCache = {}
+    lanes    = {} # ( origin device , destination device , lane ) --> [ opDex , ... ]
+    for opDex , operation in enumerate( movePlan ):
+        laneKey = ( device_of( operation[ 'orginDir' ] , devCache ) , device_of( operation[ 'destDir' ] , devCache ) , 
+                    zlib.crc32( operation[ 'dest' ].encode( 'utf-8' , 'surrogateescape' ) ) % lanesPerDevice )
+        lanes.setdefault( laneKey , [] ).append( opDex )
+
+    def run_lane( opDices ):
+        """ Execute the operations of one lane in order , Each lane syncs its own cross-device copies """
+        mover = CrossDeviceMover()
+        for opDex in opDices:
+            opReport[ opDex ] = execute_operation( movePlan[ opDex ] , opOffset + opDex , dirCache , verbose , mover )
+        settle_copies( mover )
+
+    with ThreadPoolExecutor( max_workers = max( 1 , workers ) ) as pool:
+        for result in pool.map( run_lane , lanes.values() ):
+            pass # Iterate so that any exception raised in a lane is raised here
+    if ownCache and stats is not None:
+        stats.update( dirCache.summary() )
     return opReport
 
+def iter_execute_move_plan( movePlan , verbose = False , workers = 1 , stats = None , journal = None ):
+    """ Carry out each dir creation / file move / file rename operation from 'iter_move_plan' as it arrives , generate operation status """
+    # NOTE: With 'workers' > 1 , operations are gathered into batches that are executed concurrently , A batch runs once it holds 
+    #       'EXECBATCH' operations or 'EXECWAIT' seconds after its first , so a slow scan does not hold up the moves it has planned
+    #       With one worker , each operation is executed as it arrives
+    # NOTE: The destination dirs of each batch are created in bulk before it runs
+    # NOTE: If a 'stats' dict is given , it receives the directory statistics once the generator has been exhausted
+    # NOTE: If a 'MoveJournal' is given , each batch is journaled before it runs and its results are journaled before they are generated
+    dirCache = DestDirCache()
+    opDex    = 0
+    for batch in iter_batches( movePlan , EXECBATCH if workers > 1 else 1 , EXECWAIT ):
+        dirCache.create_all( plan_dir_creation( batch ) )
+        if journal is not None:
+            journal.begin( batch , opDex )
+        if workers > 1:
+            opReport = execute_move_plan_concurrent( batch , verbose , workers , opOffset = opDex , dirCache = dirCache )
+        else:
+            opReport = execute_operations( batch , opDex , dirCache , verbose )
+        if journal is not None:
+            journal.commit( opReport )
+        yield from opReport
+        opDex += len( batch )
+    if stats is not None:
+        stats.update( dirCache.summary() )
+
+def execute_move_plan( movePlan , verbose = False , workers = 1 , stats = None , journal = None ):
+    """ Carry out all dir creation / file move / file rename operations determined by 'create_move_plan' , return operation status """
+    if workers > 1 and journal is None:
+        return execute_move_plan_concurrent( movePlan , verbose , workers , stats = stats )
+    return list( iter_execute_move_plan( movePlan , verbose , workers , stats , journal ) )
+
+# [X] Journal the execution so that it can be resumed or undone
+
+JOURNALPREFIX = "moveJournal" # Journals are written to 'LOGDIR' as "moveJournal<timestamp>.jsonl"
+UNDOSUFFIX    = "_undo" # ----- Undoing a journal writes "moveJournal<timestamp>_undo<N>.jsonl" beside it
+RESULTKEYS = ( 'success' , 'statusMsg' , 'moveMode' , 'bytesMoved' ) # Fields of an operation report that are journaled
+
+class MoveJournal( object ):
+    """ Write-ahead log of a move plan execution , one JSON object per line , synced to disk once per batch of operations """
+    # NOTE: Each batch of operations is written as { "opNum" , "op" , "src" } intents and synced BEFORE any of them run ,
+    #       then their results are written as { "opNum" , "done" , <RESULTKEYS> } and synced before the reports are passed on
+    #       So after a crash , every operation that may have touched the disk has an intent , see 'resume_move_plan'
+    # NOTE: "src" is the [ size , mtime ] of the origin when the intent was written , see 'settle_interrupted'
+
+    def __init__( self , path ):
+        """ Open the journal at 'path' for appending """
+        self.path    = path
+        self.outFile = open( path , 'a' , encoding = 'utf-8' , errors = 'surrogateescape' )
+        if self.outFile.tell() > 0: # Resuming , end a line that was torn by a crash so that it does not swallow the next entry
+            with open( path , 'rb' ) as inFile:
+                inFile.seek( -1 , os.SEEK_END )
+                if inFile.read( 1 ) != b'\n':
+                    self.outFile.write( "\n" )
+
+    def append( self , entries ):
+        """ Write 'entries' and sync them to disk """
+        self.outFile.write( "".join( json.dumps( entry ) + "\n" for entry in entries ) )
+        self.outFile.flush()
+        os.fsync( self.outFile.fileno() )
+
+    def begin( self , batch , opOffset ):
+        """ Journal the intent to run each operation in 'batch' , numbered from 'opOffset' """
+        self.append( { 'opNum' : opOffset + i , 'op' : operation , 'src' : source_signature( operation[ 'orgn' ] ) } 
+                     for i , operation in enumerate( batch ) )
+
+    def commit( self , opReport ):
+        """ Journal the results of the operations in 'opReport' """
+        self.append( dict( [ ( 'opNum' , report[ 'opNum' ] ) , ( 'done' , True ) ] + 
+                           [ ( key , report[ key ] ) for key in RESULTKEYS if key in report ] ) for report in opReport )
+
+    def close( self ):
+        """ Close the journal file """
+        self.outFile.close()
+
+    def __enter__( self ):
+        """ Return the journal for use in a 'with' block """
+        return self
+
+    def __exit__( self , excType , excValue , excTrace ):
+        """ Close the journal , even if an exception was raised """
+        self.close()
+
+def new_journal_path( logDir ):
+    """ Return a timestamped journal path in 'logDir' """
+    return os.path.join( logDir , fname_timestamp_with_prefix( JOURNALPREFIX , 'jsonl' ) )
+
+def latest_journal_path( logDir ):
+    """ Return the path of the most recent run journal in 'logDir' , or None if there are none """
+    # NOTE: Undo journals are skipped , their names sort after the run they undo and would be picked instead of it
+    journals = sorted( fName for fName in os.listdir( logDir ) 
+                       if fName.startswith( JOURNALPREFIX ) and fName.endswith( '.jsonl' ) and UNDOSUFFIX not in fName )
+    return os.path.join( logDir , journals[-1] ) if journals else None
+
+def new_undo_journal_path( journalPath ):
+    """ Return an unused undo journal path beside the journal at 'journalPath' """
+    stem = os.path.splitext( journalPath )[0] + UNDOSUFFIX
+    undoJournalPath = stem + ".jsonl"
+    count = 1
+    while os.path.lexists( undoJournalPath ):
+        count += 1
+        undoJournalPath = stem + str( count ) + ".jsonl"
+    return undoJournalPath
+
+def source_signature( path ):
+    """ Return [ size , mtime in ns ] of the regular file at 'path' , or None if there is none """
+    info = stat_file( path )
+    return [ info.st_size , info.st_mtime_ns ] if info is not None else None
+
+def read_journal( journalPath ):
+    """ Return ( { opNum : op } , { opNum : result } , { opNum : src } ) of all the intents and results in the journal at 'journalPath' """
+    intents = {}
+    results = {}
+    sources = {}
+    with open( journalPath , 'r' , encoding = 'utf-8' , errors = 'surrogateescape' ) as inFile:
+        for line in inFile:
+            try:
+                entry = json.loads( line )
+            except ValueError: # The last line may be torn by a crash , it was never synced
+                continue
+            if 'done' in entry:
+                results[ entry[ 'opNum' ] ] = entry
+            else:
+                intents[ entry[ 'opNum' ] ] = entry[ 'op' ]
+                sources[ entry[ 'opNum' ] ] = entry.get( 'src' , None ) # Journals of older versions have none
+    return intents , results , sources
+
+def settle_interrupted( operation , opNum , source = None ):
+    """ Inspect the disk to learn what became of an 'operation' that was interrupted , 'source' is its journaled "src" , 
+    Return a report if it finished or cannot be run again , otherwise None """
+    # NOTE: Nothing is deleted unless it is shown to be this run's own work: A copy cut short is only ever at the destination plus 
+    #       'COPYSUFFIX' , no larger than the journaled origin , A destination that exists next to its origin is only this run's 
+    #       finished copy if both still have the journaled size and mtime , then the copy is kept and the origin removed , 
+    #       Anything else at the destination came from elsewhere , and is left alone
+    report = deepcopy( operation )
+    report[ 'opNum' ] = opNum
+
+    def settled( success , msg ):
+        """ Return the report with its status """
+        report.update( { 'success' : success , 'statusMsg' : msg } )
+        return report
+
+    orgnInfo = stat_file( operation[ 'orgn' ] )
+    partInfo = stat_file( operation[ 'dest' ] + COPYSUFFIX )
+    if partInfo is not None and orgnInfo is not None and source is not None and partInfo.st_size <= source[0]:
+        os.remove( operation[ 'dest' ] + COPYSUFFIX ) # Copy cut short by the crash , done again
+    orgnExists = os.path.lexists( operation[ 'orgn' ] )
+    destExists = os.path.lexists( operation[ 'dest' ] )
+    if destExists and not orgnExists: # The move finished , but its result was not journaled
+        return settled( True , "SUCCESS: FOUND DONE ON RESUME" )
+    if destExists and orgnExists:
+        if operation[ 'op' ] != 'nm' and source is not None and orgnInfo is not None and \
+           source_signature( operation[ 'dest' ] ) == source == [ orgnInfo.st_size , orgnInfo.st_mtime_ns ]:
+            os.remove( operation[ 'orgn' ] ) # The copy was synced and renamed into place , only the origin was left
+            return settled( True , "SUCCESS: FOUND COPIED ON RESUME" )
+        return settled( False , "FAIL: DESTINATION EXISTS ON RESUME" )
+    return None
+
+def resume_move_plan( journalPath , verbose = False , workers = 1 ):
+    """ Finish the operations in the journal at 'journalPath' that have no result , without rescanning , Return their status """
+    intents , results , sources = read_journal( journalPath )
+    opReport = []
+    pending  = []
+    for opNum in sorted( intents ):
+        if opNum not in results:
+            report = settle_interrupted( intents[ opNum ] , opNum , sources[ opNum ] )
+            if report is None:
+                pending.append( opNum )
+            else:
+                opReport.append( report )
+    dirCache = DestDirCache()
+    with MoveJournal( journalPath ) as journal:
+        journal.commit( opReport ) # Record the operations that were found finished , or that cannot be run again
+        for start in range( 0 , len( pending ) , EXECBATCH ):
+            opNums = pending[ start : start + EXECBATCH ]
+            batch  = [ intents[ opNum ] for opNum in opNums ]
+            dirCache.create_all( plan_dir_creation( batch ) )
+            if workers > 1:
+                batchReport = execute_move_plan_concurrent( batch , verbose , workers , dirCache = dirCache )
+            else:
+                batchReport = execute_operations( batch , 0 , dirCache , verbose )
+            for opNum , report in zip( opNums , batchReport ): # Restore the numbers of the original plan
+                report[ 'opNum' ] = opNum
+            journal.commit( batchReport )
+            opReport.extend( batchReport )
+    return sorted( opReport , key = lambda report : report[ 'opNum' ] )
+
+def undo_journal( journalPath , undoJournalPath = None , verbose = False ):
+    """ Move every file moved by the journal at 'journalPath' back to its origin , last operation first , Return the status of each """
+    # NOTE: The undo is itself a journaled move plan , so it can be resumed ( and undone ) in the same way
+    intents , results , sources = read_journal( journalPath )
+    undoPlan = []
+    for opNum in sorted( intents , reverse = True ):
+        operation = intents[ opNum ]
+        if opNum in results:
+            done = results[ opNum ][ 'success' ]
+        else:
+            report = settle_interrupted( operation , opNum , sources[ opNum ] )
+            done   = report is not None and report[ 'success' ]
+        if done:
+            undoPlan.append( { 'op': 'nm' if operation[ 'op' ] == 'nm' else 'mv' , 
+                               'orgn': operation[ 'dest' ] , 
+                               'orginDir' : operation[ 'destDir' ] , 
+                               'dest': operation[ 'orgn' ] , 
+                               'destDir': operation[ 'orginDir' ] , 
+                               'undoOf': opNum } )
+    undoJournalPath = undoJournalPath if undoJournalPath else new_undo_journal_path( journalPath )
+    if os.path.lexists( undoJournalPath ): # Appending would mix two undos whose operation numbers both start at 0
+        raise FileExistsError( "Undo journal already exists: " + undoJournalPath )
+    with MoveJournal( undoJournalPath ) as journal:
+        return execute_move_plan( undoPlan , verbose , journal = journal )
+
+# [X] Scan -> Plan -> Execute , streamed
+
+def tee_to( items , sink = None ):
+    """ Pass every element of 'items' through unchanged , also handing each one to the callable 'sink' if one was given """
+    for item in items:
+        if sink is not None:
+            sink( item )
+        yield item
+
+def stream_repair( searchPath , libraryPath , workers = 1 , index = None , 
+                   recordSink = None , planSink = None , verbose = False , moveWorkers = 1 , stats = None , dupFilter = None , 
+                   journal = None , resolver = None , profiler = None ):
+    """ Scan 'searchPath' , plan , and execute moves into 'libraryPath' as a pipeline , Generate operation status as each op finishes """
+    # NOTE: Each file flows through all three stages as soon as it is scanned , so the first move happens within seconds of starting
+    #       and memory does not grow with the size of the library ( unless the sinks keep everything )
+    # NOTE: A file moved into a directory that the scan has not reached yet will be scanned again , but it will already be in its
+    #       proper place with a safe name , so no second operation is planned for it , and 'dupFilter' knows that it was moved
+    # NOTE: If a 'StageProfiler' is given , each stage ( and the sinks , as 'log' ) is timed on its own , see 'StageProfiler.timed_iter'
+    if profiler is None:
+        records = tee_to( iter_library_metadata( searchPath , workers , index ) , recordSink )
+        moves   = tee_to( iter_move_plan( records , libraryPath , dupFilter , resolver ) , planSink )
+        return iter_execute_move_plan( moves , verbose , moveWorkers , stats , journal )
+    records = tee_to( profiler.timed_iter( 'scan' , iter_library_metadata( searchPath , workers , index , profiler ) ) , 
+                      profiler.timed_call( 'log' , recordSink ) )
+    moves   = tee_to( profiler.timed_iter( 'plan' , iter_move_plan( records , libraryPath , dupFilter , resolver ) ) , 
+                      profiler.timed_call( 'log' , planSink ) )
+    return tee_to( profiler.timed_iter( 'execute' , iter_execute_move_plan( moves , verbose , moveWorkers , stats , journal ) ) , 
+                   profiler.note_report )
+
+# [X] Per-stage profiling
+
+PROFILEPREFIX = "profile" # Profiles are written to 'LOGDIR' as "profile<timestamp>.json" , next to the exec log
+PARSEBINS = [ 0.125 * 2 ** i for i in range( 14 ) ] # Upper edges of the tag-parse latency buckets , in ms , 0.125ms to 1s
+PROFILERUNS = True # -- Write a profile of every menu repair
+PROFILESTAGE = None # - Name of one stage to run under 'cProfile' , one of 'walk' , 'parse' , 'scan' , 'plan' , 'execute' , 'log'
+PROCIO = "/proc/self/io" # Read / write syscall counters of this process , Linux only
+
+def read_proc_io():
+    """ Return the read / write syscall counters of this process as { 'syscr' : n , 'syscw' : n } , or None where '/proc' is missing """
+    # NOTE: Counts every thread of the process , but not the scan worker processes
+    try:
+        with open( PROCIO , 'r' ) as ioFile:
+            fields = dict( line.split( ':' , 1 ) for line in ioFile if ':' in line )
+        return { 'syscr' : int( fields[ 'syscr' ] ) , 'syscw' : int( fields[ 'syscw' ] ) }
+    except ( OSError , KeyError , ValueError ):
+        return None
+
+class StageProfiler( object ):
+    """ Wall time of each pipeline stage , tag-parse latency histogram , filesystem op counts , and bytes moved for one run """
+    # NOTE: Stages are nested ( the plan pulls records from the scan , which pulls entries from the walk ) , so each stage is charged 
+    #       only its own time , the time spent in the stages it pulled from is subtracted , see 'enter' / 'exit'
+    # NOTE: Filesystem ops are estimated , tallied where the organizer makes the calls or inferred from the operation reports , 
+    #       calls made inside eyed3 or the OS are not seen , The measured read / write syscalls of the process are in 'ioSyscalls'
+    # NOTE: With a parallel scan , 'parse' is the time spent waiting on the pool , and 'cProfile' sees only that wait
+
+    def __init__( self , profileStage = None ):
+        """ Start with no stages timed , If 'profileStage' is named , that stage also runs under 'cProfile' """
+        self.runWatch     = Stopwatch()
+        self.stages       = {} # stage --> { 'seconds' : Own wall time , 'calls' : Times entered , 'items' : Items produced }
+        self.stack        = [] # Frames of the stages currently running , innermost last
+        self.parseBins    = [ 0 ] * ( len( PARSEBINS ) + 1 ) # Last bucket is everything slower than 'PARSEBINS[-1]'
+        self.parseStats   = { 'files' : 0 , 'seconds' : 0.0 , 'maxSeconds' : 0.0 }
+        self.opCounts     = {} # op --> estimated count
+        self.bytesMoved   = {} # moveMode --> bytes
+        self.profileStage = profileStage
+        self.profile      = cProfile.Profile() if profileStage else None
+        self.ioStart      = read_proc_io()
+
+    def enter( self , stage ):
+        """ Start timing one pass through 'stage' , Return the frame to hand to 'exit' """
+        frame = [ stage , Stopwatch() , 0.0 ] # [ stage , watch , time spent in nested stages ]
+        self.stack.append( frame )
+        if stage == self.profileStage:
+            self.profile.enable()
+        return frame
+
+    def exit( self , frame , items = 0 ):
+        """ Stop timing the pass 'frame' , which produced 'items' , Charge its own time to its stage """
+        stage , watch , nested = frame
+        elapsed = watch.elapsed()
+        if stage == self.profileStage:
+            self.profile.disable()
+        self.stack.pop()
+        if self.stack:
+            self.stack[-1][2] += elapsed
+        stats = self.stages.setdefault( stage , { 'seconds' : 0.0 , 'calls' : 0 , 'items' : 0 } )
+        stats[ 'seconds' ] += elapsed - nested
+        stats[ 'calls' ]   += 1
+        stats[ 'items' ]   += items
+
+    def timed_iter( self , stage , items ):
+        """ Pass every element of 'items' through unchanged , charging the time spent producing each one to 'stage' """
+        itemIter = iter( items )
+        while True:
+            frame = self.enter( stage )
+            try:
+                item = next( itemIter )
+            except StopIteration:
+                self.exit( frame )
+                return
+            except BaseException:
+                self.exit( frame )
+                raise
+            self.exit( frame , 1 )
+            yield item
+
+    def timed_call( self , stage , func ):
+        """ Return a version of the callable 'func' whose calls are charged to 'stage' , or None if 'func' is None """
+        if func is None:
+            return None
+
+        def timed( *args , **kwargs ):
+            """ Call 'func' as one pass through 'stage' """
+            frame = self.enter( stage )
+            try:
+                return func( *args , **kwargs )
+            finally:
+                self.exit( frame , 1 )
+
+        return timed
+
+    def count( self , op , n = 1 ):
+        """ Tally 'n' filesystem ops of the kind 'op' """
+        self.opCounts[ op ] = self.opCounts.get( op , 0 ) + n
+
+    def note_parses( self , parsed ):
+        """ Add the latencies from 'fetch_song_metadata_timed_chunk' to the histogram , Return the song metadata dicts alone """
+        self.count( 'tagOpen' , len( parsed ) )
+        for _ , seconds in parsed:
+            ms = seconds * 1000.0
+            binDex = 0
+            while binDex < len( PARSEBINS ) and ms > PARSEBINS[ binDex ]:
+                binDex += 1
+            self.parseBins[ binDex ] += 1
+            self.parseStats[ 'files' ]      += 1
+            self.parseStats[ 'seconds' ]    += seconds
+            self.parseStats[ 'maxSeconds' ]  = max( self.parseStats[ 'maxSeconds' ] , seconds )
+        return [ songData for songData , _ in parsed ]
+
+    def note_report( self , report ):
+        """ Tally the estimated filesystem ops and the bytes of one operation report from 'execute_operation' """
+        # NOTE: Inferred from the report , Every op stats its origin , an op with an origin checks its destination , a finished move checks its result
+        self.count( 'stat' )
+        if report.get( 'statusMsg' ) != "FAIL: ORIGIN FILE DNE":
+            self.count( 'lexists' )
+        if 'moveMode' in report:
+            self.count( report[ 'moveMode' ] ) # 'rename' or 'copy'
+            self.count( 'isfile' )
+            if report.get( 'success' ):
+                self.bytesMoved[ report[ 'moveMode' ] ] = self.bytesMoved.get( report[ 'moveMode' ] , 0 ) + report[ 'bytesMoved' ]
+
+    def summary( self , stats = None ):
+        """ Return the profile as a dict , Directory ops are taken from the exec 'stats' of 'iter_execute_move_plan' if given """
+        opCounts = dict( self.opCounts )
+        if stats is not None and 'dirSyscalls' in stats:
+            opCounts[ 'dir' ] = stats[ 'dirSyscalls' ]
+        ioNow = read_proc_io()
+        ioSyscalls = None
+        if ( self.ioStart is not None ) and ( ioNow is not None ):
+            ioSyscalls = { 'read' : ioNow[ 'syscr' ] - self.ioStart[ 'syscr' ] , 'write' : ioNow[ 'syscw' ] - self.ioStart[ 'syscw' ] }
+        nParsed = self.parseStats[ 'files' ]
+        return {
+            'op'           : 'profile' ,
+            'totalSeconds' : round( self.runWatch.elapsed() , 6 ) ,
+            'stages'       : { stage : { 'seconds' : round( times[ 'seconds' ] , 6 ) , 'calls' : times[ 'calls' ] , 
+                                         'items' : times[ 'items' ] } for stage , times in self.stages.items() } ,
+            'parseLatency' : { 'binEdges_ms' : PARSEBINS , 'counts' : self.parseBins , 'files' : nParsed , 
+                               'mean_ms' : round( 1000.0 * self.parseStats[ 'seconds' ] / nParsed , 4 ) if nParsed else None , 
+                               'max_ms' : round( 1000.0 * self.parseStats[ 'maxSeconds' ] , 4 ) } ,
+            'estimatedOps' : opCounts , 
+            'ioSyscalls'   : ioSyscalls , 
+            'bytesMoved'   : dict( self.bytesMoved , total = sum( self.bytesMoved.values() ) ) , 
+            'profileStage' : self.profileStage , 
+        }
+
+    def write( self , outPath , stats = None ):
+        """ Write the profile to 'outPath' as JSON , and the 'cProfile' stats of the profiled stage beside it as '.prof' """
+        with open( outPath , 'w' ) as outFile:
+            json.dump( self.summary( stats ) , outFile , indent = 2 )
+        if self.profile is not None:
+            self.profile.dump_stats( os.path.splitext( outPath )[0] + ".prof" ) # Read with 'python -m pstats' or snakeviz
+
+
 # [X] Check and execute directory deletion plans
 
 def del_empty_subdirs( searchDir ):
@@ -383,23 +1528,296 @@ def del_empty_subdirs( searchDir ):
                 os.rmdir( dirpath )
             # else , the directory is not empty , do not attempt deletion
         except OSError as ex:
-            print "Rejected" , ex
+            print( "Rejected" , ex )
+
+def vacated_dirs( opReport ):
+    """ Return the set of origin dirs that files were moved out of in 'opReport' , the only dirs that the execution could have emptied """
+    return set( report[ 'orginDir' ] for report in opReport if report.get( 'success' , False ) and report[ 'op' ] != 'nm' )
+
+def prune_empty_ancestors( dirSet , stopDir ):
+    """ Delete each dir in 'dirSet' that is empty , then each of its ancestors that is left empty , up to but not including 'stopDir' ,
+    Return the number of dirs deleted """
+    # NOTE: 'os.rmdir' refuses to delete a dir that is not empty , so each dir costs one call and there is no need to list it
+    # NOTE: Deepest dirs first , so that a parent is tried only after all of its vacated children
+    stopDir = os.path.abspath( stopDir )
+    tried   = set()
+    removed = 0
+    for dirPath in sorted( ( os.path.abspath( dirPath ) for dirPath in dirSet ) , key = lambda path : path.count( os.sep ) , reverse = True ):
+        while dirPath not in tried and dirPath != stopDir and dirPath.startswith( stopDir + os.sep ): # Never leave 'stopDir'
+            tried.add( dirPath )
+            try:
+                os.rmdir( dirPath )
+                removed += 1
+            except OSError: # Not empty ( or already gone ) , so its ancestors are not empty either
+                break
+            dirPath = os.path.dirname( dirPath )
+    return removed
+
+# [X] Watch the inbox and file new tracks as they arrive
+
+WATCHDEBOUNCE  = 2.0 # -- Seconds a file must go unchanged before it is filed , so that files still being written are left alone
+WATCHPOLL      = 10.0 # - Seconds between scans of the inbox when inotify is not available
+WATCHWAKE      = 5.0 # -- Longest sleep while idle , so that a stop request is noticed
+WATCHIGNOREEXT = [ "PART" , "TMP" , "CRDOWNLOAD" , "YTDL" ] # Extensions of downloads that have not finished
+
+class InotifyWatch( object ):
+    """ Minimal 'inotify' binding through 'ctypes' , Report the files written or moved into a dir tree , Linux only """
+    # URL , inotify API: http://man7.org/linux/man-pages/man7/inotify.7.html
+    IN_MODIFY      = 0x00000002
+    IN_CLOSE_WRITE = 0x00000008
+    IN_MOVED_TO    = 0x00000080
+    IN_CREATE      = 0x00000100
+    IN_Q_OVERFLOW  = 0x00004000
+    IN_IGNORED     = 0x00008000
+    IN_ISDIR       = 0x40000000
+    MASK           = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+    EVENTHEAD      = struct.Struct( 'iIII' ) # wd , mask , cookie , len
+
+    def __init__( self , rootDir ):
+        """ Watch 'rootDir' and every dir under it , Raise OSError if inotify is not available """
+        self.libc = ctypes.CDLL( ctypes.util.find_library( 'c' ) , use_errno = True )
+        self.fd   = self.libc.inotify_init1( os.O_NONBLOCK | os.O_CLOEXEC )
+        if self.fd < 0:
+            raise OSError( ctypes.get_errno() , "inotify_init1 failed" )
+        self.dirs = {} # watch descriptor --> dirPath
+        self.add_tree( rootDir )
+
+    def add_tree( self , rootDir ):
+        """ Watch 'rootDir' and every dir under it , Return the paths of the files already in the tree """
+        filePaths = []
+        for dirName , subdirList , fileList in os.walk( rootDir ):
+            wd = self.libc.inotify_add_watch( self.fd , os.fsencode( dirName ) , InotifyWatch.MASK )
+            if wd >= 0: # else the dir vanished before it could be watched
+                self.dirs[ wd ] = dirName
+            filePaths.extend( os.path.join( dirName , fName ) for fName in fileList )
+        return filePaths
+
+    def read_events( self , timeout ):
+        """ Wait up to 'timeout' seconds for events , Return the paths that changed , None in the list means that events were lost """
+        ready , _ , _ = select.select( [ self.fd ] , [] , [] , timeout )
+        if not ready:
+            return []
+        try:
+            data = os.read( self.fd , 65536 )
+        except BlockingIOError:
+            return []
+        paths  = []
+        offset = 0
+        while offset + InotifyWatch.EVENTHEAD.size <= len( data ):
+            wd , mask , cookie , nameLen = InotifyWatch.EVENTHEAD.unpack_from( data , offset )
+            name    = data[ offset + InotifyWatch.EVENTHEAD.size : offset + InotifyWatch.EVENTHEAD.size + nameLen ].rstrip( b'\0' )
+            offset += InotifyWatch.EVENTHEAD.size + nameLen
+            if mask & InotifyWatch.IN_Q_OVERFLOW:
+                paths.append( None )
+            elif mask & InotifyWatch.IN_IGNORED: # The dir was deleted
+                self.dirs.pop( wd , None )
+            elif wd in self.dirs and name:
+                path = os.path.join( self.dirs[ wd ] , os.fsdecode( name ) )
+                if mask & InotifyWatch.IN_ISDIR:
+                    if mask & ( InotifyWatch.IN_CREATE | InotifyWatch.IN_MOVED_TO ): # A new dir , which may already hold files
+                        paths.extend( self.add_tree( path ) )
+                else:
+                    paths.append( path )
+        return paths
+
+    def close( self ):
+        """ Stop watching """
+        os.close( self.fd )
+
+class InboxWatcher( object ):
+    """ File new tracks from 'scanDir' into 'libraryPath' within seconds of their arrival , Run until stopped """
+    # NOTE: Uses inotify where available , and sleeps until something changes , Otherwise the inbox is scanned every 'WATCHPOLL' seconds
+    #       and the 'LibraryIndex' tells which files are new or changed
+    # NOTE: A file is filed only once its signature has not changed for 'WATCHDEBOUNCE' seconds
+    # NOTE: Only the new files go through the plan and the executor , the rest of the library is never rescanned
+
+    def __init__( self , scanDir , libraryPath , logDir , moveWorkers = 1 , verbose = False , 
+                  debounce = WATCHDEBOUNCE , pollInterval = WATCHPOLL ):
+        """ Load the index and the artist table from 'logDir' , and start watching 'scanDir' """
+        self.scanDir      = scanDir
+        self.libraryPath  = libraryPath
+        self.logDir       = logDir
+        self.moveWorkers  = moveWorkers
+        self.verbose      = verbose
+        self.debounce     = debounce
+        self.pollInterval = pollInterval
+        self.index        = LibraryIndex( os.path.join( logDir , INDEXNAME ) )
+        self.resolver     = ArtistResolver( os.path.join( logDir , ARTISTTABLENAME ) , libraryPath )
+        self.dupFilter    = DuplicateFilter( self.index ) # Catches the same track downloaded twice during this session
+        self.pending      = {} # path --> [ time of the last change , signature at that time ]
+        self.lastPoll     = None # Time of the last full scan of 'scanDir'
+        self.stopEvent    = threading.Event()
+        self.filed        = 0 # Number of operations executed
+        try:
+            self.inotify = InotifyWatch( scanDir )
+        except ( OSError , AttributeError ) as err: # No inotify on this platform , poll instead
+            print( "InboxWatcher: inotify is not available , polling every" , pollInterval , "s ..." , err )
+            self.inotify = None
+
+    def note( self , path ):
+        """ Mark 'path' as changed just now """
+        if os.path.splitext( path )[1][1:].upper() in WATCHIGNOREEXT or path.startswith( os.path.join( self.logDir , '' ) ):
+            return
+        self.pending[ path ] = [ time.monotonic() , None ]
+
+    def poll_changes( self ):
+        """ Scan 'scanDir' , marking every file that is not in the index with its current signature """
+        self.lastPoll = time.monotonic()
+        for dirName , fName , info in scan_library_entries( self.scanDir ):
+            fullPath = os.path.join( dirName , fName )
+            entry    = self.index.entries.get( fullPath , None )
+            if fullPath not in self.pending and ( entry is None or entry[0] != LibraryIndex.signature( info ) ):
+                self.note( fullPath )
+
+    def settled( self ):
+        """ Return [ ( path , stat ) , ... ] for the pending files that have not changed for 'debounce' seconds """
+        now   = time.monotonic()
+        ready = []
+        for path , ( lastChange , lastSig ) in list( self.pending.items() ):
+            if now - lastChange < self.debounce:
+                continue
+            info = stat_file( path )
+            if info is None: # Gone , or not a regular file
+                del self.pending[ path ]
+            elif LibraryIndex.signature( info ) == lastSig:
+                del self.pending[ path ]
+                ready.append( ( path , info ) )
+            else: # Still changing , or seen for the first time , check again later
+                self.pending[ path ] = [ now , LibraryIndex.signature( info ) ]
+        return ready
+
+    def retry_later( self , path , info , err ):
+        """ Report that 'path' could not be filed , and keep it pending so that it is tried again after 'debounce' seconds """
+        print( "InboxWatcher: Could not file" , path , ", Retrying later ..." , err )
+        self.pending[ path ] = [ time.monotonic() , LibraryIndex.signature( info ) ]
+
+    def file_batch( self , ready , execLog = None , journal = None ):
+        """ Plan and execute the moves for the settled files in 'ready' , Return the operation reports """
+        # NOTE: A failure never stops the watcher , the files involved stay pending , A file that was moved before the failure
+        #       is dropped from 'pending' by the next 'settled' , since it is no longer in the inbox
+        records = []
+        filing  = []
+        for path , info in ready:
+            fileSig = LibraryIndex.signature( info )
+            try:
+                songData = self.index.lookup( path , fileSig )
+                if songData is None:
+                    songData = fetch_song_metadata( path )
+                    self.index.update( path , fileSig , songData )
+                records.append( fetch_file_record( os.path.dirname( path ) , os.path.basename( path ) , info.st_mtime , info.st_size , songData ) )
+                filing.append( ( path , info ) )
+            except Exception as err: # Only this file waits , the rest of the batch is filed
+                self.retry_later( path , info , err )
+        try:
+            execution = execute_move_plan( create_move_plan( records , self.libraryPath , self.dupFilter , self.resolver ) , 
+                                           self.verbose , self.moveWorkers , journal = journal )
+            self.index.apply_moves( execution )
+            prune_empty_ancestors( vacated_dirs( execution ) , self.scanDir )
+            self.index.save()
+            self.resolver.save()
+        except Exception as err:
+            for path , info in filing:
+                self.retry_later( path , info , err )
+            return []
+        if execLog is not None:
+            for report in execution:
+                execLog.write( report )
+        self.filed += len( execution )
+        return execution
+
+    def run( self , duration = None ):
+        """ File arriving tracks until 'stop' is called , 'duration' seconds pass , or Ctrl+C is pressed , Return the number of operations """
+        quitTime = time.monotonic() + duration if duration is not None else None
+        logName  = fname_timestamp_with_prefix( "watchLog" , LOGEXT[ LOGFORMAT ] )
+        with RecordLogWriter( os.path.join( self.logDir , logName ) ) as execLog , \
+             MoveJournal( new_journal_path( self.logDir ) ) as journal:
+            self.poll_changes() # File whatever arrived while nobody was watching
+            try:
+                while not self.stopEvent.is_set() and ( quitTime is None or time.monotonic() < quitTime ):
+                    # 1. Sleep until something changes , or until the next pending file may have settled
+                    timeout = self.debounce if self.pending else ( WATCHWAKE if self.inotify else self.pollInterval )
+                    if quitTime is not None:
+                        timeout = max( 0.0 , min( timeout , quitTime - time.monotonic() ) )
+                    if self.inotify is not None:
+                        for path in self.inotify.read_events( timeout ):
+                            if path is None: # The kernel dropped events , fall back to a scan
+                                self.poll_changes()
+                            else:
+                                self.note( path )
+                    else:
+                        self.stopEvent.wait( timeout )
+                        if time.monotonic() - self.lastPoll >= self.pollInterval: # Else only the pending files are re-stat'ed , by 'settled'
+                            self.poll_changes()
+                    # 2. File the tracks that are done being written
+                    ready = self.settled()
+                    if ready:
+                        self.file_batch( ready , execLog , journal )
+            except KeyboardInterrupt:
+                print( "InboxWatcher: Stopped by user" )
+        if self.inotify is not None:
+            self.inotify.close()
+        return self.filed
+
+    def stop( self ):
+        """ Ask 'run' to return , noticed within 'WATCHWAKE' seconds """
+        self.stopEvent.set()
 
 # == Test Functions ==
 
-def gather_files( searchPath ): 
-    """ Find all the singular files under 'searchPath' (recursive) and move them directly to 'searchPath' , undoes organiztion """
-    # Walk the 'searchPath'
-    for dirName , subdirList , fileList in os.walk( searchPath ): # for each subdir in 'srchDir', including 'srchDir'
-        if dirName != LOGDIR:
-            for fName in fileList: # for each file in this subdir  
-                if os.path.splitext( fName )[1][1:].upper() not in EXTIGNORE:
-                    fullPath = os.path.join( dirName , fName )
-                    if os.path.isfile( fullPath ):
-                        print "Moving" , fullPath , "to" , os.path.join( searchPath , fName )
-                        shutil.move( fullPath , os.path.join( searchPath , fName ) )
-        else:
-            print "Skipping the logging directory ..."
+FLATTENPROGRESS = 1000 # Print the progress of a flatten every this many operations
+
+def iter_flatten_plan( searchPath , skipDirs = () ):
+    """ Plan a move of every file under the subdirs of 'searchPath' into 'searchPath' itself , Generate 'mv' operations , in scan order """
+    # NOTE: The top level is listed once up front , after that every destination name is claimed in memory , so each file costs one
+    #       stat from the walk and nothing more , Two files with the same name get "_2" , "_3" , ... instead of overwriting each other
+    # NOTE: Only the claimed names are kept , the plan itself is generated as it is walked
+    skipDirs = [ os.path.abspath( dirPath ) for dirPath in skipDirs if dirPath ]
+    claimed  = set( os.path.join( searchPath , name ) for name in os.listdir( searchPath ) ) # Files and dirs , a file may not take a dir's name
+    for dirName , fName , _ in scan_library_entries( searchPath ):
+        absDir = os.path.abspath( dirName )
+        if dirName == searchPath or any( absDir == skip or absDir.startswith( skip + os.sep ) for skip in skipDirs ):
+            continue # Already in place , or in the logging directory
+        if os.path.splitext( fName )[1][1:].upper() in EXTIGNORE:
+            continue
+        fullPath = os.path.join( dirName , fName )
+        yield { 'op': 'mv' , 
+                'orgn': fullPath , 
+                'orginDir' : dirName , 
+                'dest': claim_dest( claimed , searchPath , fName , fullPath , checkDisk = False ) , 
+                'destDir': searchPath }
+
+def report_progress( reports , label , every = FLATTENPROGRESS ):
+    """ Pass every operation report through unchanged , printing the count and the throughput every 'every' reports and at the end """
+    watch = Stopwatch()
+    count = failed = nBytes = 0
+
+    def show():
+        """ Print one progress line """
+        elapsed = max( watch.elapsed() , EPSILON )
+        print( label , count , "operations ," , failed , "failed ," , round( count / elapsed , 1 ) , "ops/s ," , 
+               round( nBytes / elapsed / 1e6 , 2 ) , "MB/s" , file = sys.stderr ) # Standard error , so that it does not mix with reports
+
+    for report in reports:
+        count  += 1
+        failed += 0 if report[ 'success' ] else 1
+        nBytes += report.get( 'bytesMoved' , 0 )
+        if count % every == 0:
+            show()
+        yield report
+    show()
+
+def gather_files( searchPath , dryRun = False , workers = 1 , journal = None , verbose = False , skipDirs = None ): 
+    """ Find all the singular files under 'searchPath' (recursive) and move them directly to 'searchPath' , undoes organiztion , 
+    Generate operation status as each op finishes """
+    # NOTE: The moves go through the same executor ( and 'MoveJournal' , if given ) as a repair , so a flatten can be resumed or undone
+    # NOTE: By default the logging directory is left alone
+    skipDirs = [ LOGDIR ] if skipDirs is None else skipDirs
+    movePlan = iter_flatten_plan( searchPath , skipDirs )
+    if dryRun:
+        execution = ( dry_run_operation( operation , opDex ) for opDex , operation in enumerate( movePlan ) )
+    else:
+        execution = iter_execute_move_plan( movePlan , verbose , workers , journal = journal )
+    return report_progress( execution , "Would flatten" if dryRun else "Flattened" )
 
 # == End Test ==
 
@@ -416,28 +1834,82 @@ def fname_timestamp_with_prefix( prefix , ext ):
 
 def remove_XML_header( pString ):
     """ Remove the front of 'pString' up to and including the first closing ">" , Removes the XML header from 'pString' """
-    skipping = True
-    skipStop = '>' 
-    rtnStr = ""
-    for char in pString:
-        if not skipping:
-            rtnStr += char        
-        if char == skipStop:
-            skipping = False
-    return rtnStr
+    headEnd = pString.find( '>' )
+    return pString[ headEnd + 1 : ] if headEnd > -1 else ""
+
+def record_to_XML_fragment( record ):
+    """ Return the XML for one 'record' , without the XML header """
+    if isinstance( record , LibraryRecord ): # Slotted records are expanded to the full dict record for logging
+        record = record.as_dict()
+    return remove_XML_header( dicttoxml( record , custom_root = 'record' ).decode( 'utf-8' ) ) # 'dicttoxml' returns bytes
 
 def records_to_XML_string( recordsList , outPath = None ):
     """ Convert a 'recordsList' to a string representing an XML document """
-    rtnStr = """<?xml version="1.0" encoding="UTF-8" ?>""" + endl + """<log>""" + endl
-    for record in recordsList:
-        rtnStr += remove_XML_header( dicttoxml( record , custom_root = 'record' ) ) + endl
-    rtnStr += """</log>"""
+    parts = [ """<?xml version="1.0" encoding="UTF-8" ?>""" , """<log>""" ]
+    parts.extend( record_to_XML_fragment( record ) for record in recordsList )
+    parts.append( """</log>""" )
+    rtnStr = endl.join( parts )
     if outPath: # If the user provided an output path , write the XML string to a file
-        outFile = open( outPath , 'w' )
-        outFile.write( rtnStr )
-        outFile.close()
+        with open( outPath , 'w' ) as outFile:
+            outFile.write( rtnStr )
     return rtnStr
 
+LOGFORMAT = "xml" # --------- Format of the file / plan / exec logs , "xml" is read by older tools , "jsonl" is much faster to write
+LOGBUFSIZE = 1024 * 1024 # -- Bytes buffered by a log writer before each write to disk
+LOGEXT = { "xml" : "txt" , "jsonl" : "jsonl" } # File extension of each log format
+
+class RecordLogWriter( object ):
+    """ Write records to a log file one at a time as they are produced , as XML ( same document as 'records_to_XML_string' ) or JSON Lines ,
+    An 'outPath' of '-' writes to standard output """
+    # NOTE: Use as a context manager , the file is closed ( and the XML document is finished ) on exit
+    # NOTE: 'write' can be handed to 'stream_repair' as a sink , so that records are logged as they stream past
+
+    def __init__( self , outPath , fmt = LOGFORMAT , bufferSize = LOGBUFSIZE ):
+        """ Open 'outPath' for writing records in the 'fmt' format """
+        if fmt not in LOGEXT:
+            raise ValueError( "RecordLogWriter: Format " + str( fmt ) + " is not one of " + str( list( LOGEXT ) ) )
+        self.outPath = outPath
+        self.fmt     = fmt
+        self.count   = 0 # Number of records written
+        if outPath == '-': # Standard output , for use in a shell pipeline
+            self.outFile = sys.stdout
+        else:
+            self.outFile = open( outPath , 'w' , buffering = bufferSize , encoding = 'utf-8' , errors = 'surrogateescape' )
+        if self.fmt == "xml":
+            self.outFile.write( """<?xml version="1.0" encoding="UTF-8" ?>""" + endl + """<log>""" + endl )
+
+    def write( self , record ):
+        """ Append one 'record' to the log """
+        if self.fmt == "xml":
+            self.outFile.write( record_to_XML_fragment( record ) + endl ) # Same separator as 'records_to_XML_string'
+        else:
+            if isinstance( record , LibraryRecord ):
+                record = record.as_dict()
+            self.outFile.write( json.dumps( record , default = str ) + "\n" )
+        self.count += 1
+
+    def close( self ):
+        """ Finish the log and close the file """
+        if not self.outFile.closed:
+            if self.fmt == "xml":
+                self.outFile.write( """</log>""" )
+            if self.outFile is sys.stdout:
+                self.outFile.flush()
+            else:
+                self.outFile.close()
+
+    def __enter__( self ):
+        """ Return the writer for use in a 'with' block """
+        return self
+
+    def __exit__( self , excType , excValue , excTrace ):
+        """ Close the log , even if an exception was raised """
+        self.close()
+
+def log_path( prefix , fmt = LOGFORMAT ):
+    """ Return a timestamped path in 'LOGDIR' for a log with a 'prefix'ed name in the 'fmt' format """
+    return os.path.join( LOGDIR , fname_timestamp_with_prefix( prefix , LOGEXT[ fmt ] ) )
+
 # == End Archival ==
 
 # == User Interaction ==
@@ -453,18 +1925,18 @@ def menu_loop():
 
     while( menuRun ):
         sep( __prog_signature__() )
-        print "The library dir is set to:  " , LIBDIR
-        print "The scanning dir is set to: " , SCANDIR
-        print "The logging dir is set to:  " , LOGDIR
-        print "The current mode is:        " , mode
+        print( "The library dir is set to:  " , LIBDIR )
+        print( "The scanning dir is set to: " , SCANDIR )
+        print( "The logging dir is set to:  " , LOGDIR )
+        print( "The current mode is:        " , mode )
         if not os.path.isdir( LOGDIR ):
             try:
                 os.makedirs( LOGDIR )
             except:
-                print "Could not create the logging directory!"
+                print( "Could not create the logging directory!" )
         accessible = validate_dirs_writable( LIBDIR , SCANDIR , LOGDIR )
-        print "Directories are accessible:" , accessible
-        print \
+        print( "Directories are accessible:" , accessible )
+        print( 
               """ ~~ MENU ~~ 
 	      0. Quit
 	      1. Change Mode
@@ -472,114 +1944,416 @@ def menu_loop():
 	      3. Change Library Directory
 	      4. Change Scanning Directory
 	      5. Change Logging Directory 
-	      6. Flatten Library ( Gather files , Delete dirs )"""
+	      6. Flatten Library ( Gather files , Delete dirs )
+	      7. Resume an Interrupted Run ( From the move journal )
+	      8. Undo a Run ( From the move journal )
+	      9. Watch the Inbox ( File new tracks as they arrive , Ctrl+C to stop )
+	     10. Set Aside Near-Duplicates ( Same song , other encoding , Needs ffmpeg )""" )
         try:
-            response = int( raw_input( "Menu Choice >> " ) )
+            response = int( input( "Menu Choice >> " ) )
         except ValueError:
-            print "ERROR: Please enter a number corresponding to the desired menu choice!"
+            print( "ERROR: Please enter a number corresponding to the desired menu choice!" )
 
         if   response == 0: 
             menuRun = False
-            print "EXIT"
+            print( "EXIT" )
             break
 
         elif response == 1:
             sep( "Change Mode" , 1 )
-            choices = list( modeEnum.iteritems() )
-            for i in xrange( len( choices ) ):
-                print str(i) + ": " + str( choices[i][0] ) + " , " + str( choices[i][0] )
+            choices = list( modeEnum.items() )
+            for i in range( len( choices ) ):
+                print( str(i) + ": " + str( choices[i][0] ) + " , " + str( choices[i][0] ) )
             choice = None
             validChoice = False
             while choice.__class__.__name__ != 'int' and not validChoice:
                 try:
-                    choice = int( raw_input( "Choose a mode and press enter: " ) )
+                    choice = int( input( "Choose a mode and press enter: " ) )
                     if choice > -1 and choice < len( choices ):
                         validChoice = True
                     else:
-                        print choice , "is not a valid option, try again."
+                        print( choice , "is not a valid option, try again." )
                 except:
-                    print "ERROR: Could not parse user selection"
+                    print( "ERROR: Could not parse user selection" )
             mode = modeEnum[ choices[ choice ][0] ] # Set the mode to the user choice
-            print "Mode was set to" , mode
+            print( "Mode was set to" , mode )
 
         elif response == 2:
             sep( "Execute: Scan -> Repair -> Clean" , 1 )
             if not accessible: # If the user does not have access to any one of the relevant directory
-                print "ALERT: This action is barred! User does not have write permission to relevant directories or directories DNE!"
+                print( "ALERT: This action is barred! User does not have write permission to relevant directories or directories DNE!" )
             else:
                 # Scan , Plan , Move
-                fileInfo = fetch_library_metadata( SCANDIR ) # For a repair , the 'SCANDIR' and 'LIBDIR' should be the same
-                moves = create_move_plan( fileInfo , LIBDIR )
-                execution = execute_move_plan( moves , verbose = True )
-                # Log everything 
-                records_to_XML_string( fileInfo  , outPath = os.path.join( LOGDIR , fname_timestamp_with_prefix( "fileLog" , 'txt' ) ) )
-                records_to_XML_string( moves     , outPath = os.path.join( LOGDIR , fname_timestamp_with_prefix( "planLog" , 'txt' ) ) ) 
-                records_to_XML_string( execution , outPath = os.path.join( LOGDIR , fname_timestamp_with_prefix( "execLog" , 'txt' ) ) )
-                # Erase empty dirs in the 'SCANDIR' (It's possible we removed a large number of files from this dir)
-                del_empty_subdirs( SCANDIR )
+                index = LibraryIndex( os.path.join( LOGDIR , INDEXNAME ) ) # Files that have not changed since the last scan are not re-parsed
+                execStats = { 'op' : 'summary' } # The last record of the exec log is the summary of the execution
+                dupFilter = DuplicateFilter( index ) # Exact duplicates are moved to 'DUPFOLDERNAME' under 'LIBDIR'
+                resolver  = ArtistResolver( os.path.join( LOGDIR , ARTISTTABLENAME ) , LIBDIR ) # Artist name variants share one folder
+                profiler  = StageProfiler( PROFILESTAGE ) if PROFILERUNS else None # Written next to the exec log
+                # Log everything as it streams past
+                with RecordLogWriter( log_path( "fileLog" ) ) as fileLog , RecordLogWriter( log_path( "planLog" ) ) as planLog , \
+                     RecordLogWriter( log_path( "execLog" ) ) as execLog , MoveJournal( new_journal_path( LOGDIR ) ) as journal:
+                    execution = stream_repair( SCANDIR , LIBDIR , workers = SCANWORKERS , index = index , # For a repair , the 'SCANDIR' and 
+                                               recordSink = fileLog.write , planSink = planLog.write , # 'LIBDIR' should be the same
+                                               verbose = True , moveWorkers = EXECWORKERS , stats = execStats , dupFilter = dupFilter , 
+                                               journal = journal , # An interrupted run can be resumed with menu option 7
+                                               resolver = resolver , profiler = profiler )
+                    movedFrom = set() # Origin dirs of the files that were moved , the only dirs that may need to be erased
+
+                    def log_report( report ):
+                        """ Log one operation report , and remember where a file was moved from """
+                        execLog.write( report )
+                        movedFrom.update( vacated_dirs( [ report ] ) )
+
+                    index.apply_moves( tee_to( execution , log_report ) )
+                    execStats.update( dupFilter.counts )
+                    execLog.write( execStats )
+                print( "Scanned" , fileLog.count , "files ," , index.hits , "unchanged ," , index.misses , "parsed" )
+                if profiler is not None:
+                    profiler.write( os.path.join( LOGDIR , fname_timestamp_with_prefix( PROFILEPREFIX , "json" ) ) , execStats )
+                index.save()
+                resolver.save()
+                # Erase the dirs in the 'SCANDIR' that were emptied by the moves (It's possible we removed a large number of files from this dir)
+                print( "Erased" , prune_empty_ancestors( movedFrom , SCANDIR ) , "empty dirs" )
 
         elif response == 3:
             sep( "Change Library Directory" , 1 )
-            nuPath = tokenize_with_wspace( raw_input( "Enter the components of the library path, separated by spaces.\n>> " ) )
+            nuPath = tokenize_with_wspace( input( "Enter the components of the library path, separated by spaces.\n>> " ) )
             try:
                 nuPath = os.path.join( nuPath )
                 if os.path.isdir( nuPath ):
                     if validate_dirs_writable( nuPath ):
                         LIBDIR = nuPath
                     else:
-                        print "ERROR: You do not have write permission to this path!"
+                        print( "ERROR: You do not have write permission to this path!" )
                 else:
-                    print "ERROR: Not a path!"
+                    print( "ERROR: Not a path!" )
             except Exception as err:
-                print "ERROR: Could not change directory" , endl , err
+                print( "ERROR: Could not change directory" , endl , err )
 
         elif response == 4:
             sep( "Change Scanning Directory" , 1 )
-            nuPath = tokenize_with_wspace( raw_input( "Enter the components of the library path, separated by spaces.\n>> " ) )
+            nuPath = tokenize_with_wspace( input( "Enter the components of the library path, separated by spaces.\n>> " ) )
             try:
                 nuPath = os.path.join( nuPath )
                 if os.path.isdir( nuPath ):
                     if validate_dirs_writable( nuPath ):
                         SCANDIR = nuPath
                     else:
-                        print "ERROR: You do not have write permission to this path!"
+                        print( "ERROR: You do not have write permission to this path!" )
                 else:
-                    print "ERROR: Not a path!"
+                    print( "ERROR: Not a path!" )
             except Exception as err:
-                print "ERROR: Could not change directory" , endl , err
+                print( "ERROR: Could not change directory" , endl , err )
 
         elif response == 5:
             sep( "Change Logging Directory" , 1 ) 
-            nuPath = tokenize_with_wspace( raw_input( "Enter the components of the library path, separated by spaces.\n>> " ) )
+            nuPath = tokenize_with_wspace( input( "Enter the components of the library path, separated by spaces.\n>> " ) )
             try:
                 nuPath = os.path.join( nuPath )
                 if os.path.isdir( nuPath ):
                     if validate_dirs_writable( nuPath ):
                         LOGDIR = nuPath
                     else:
-                        print "ERROR: You do not have write permission to this path!"
+                        print( "ERROR: You do not have write permission to this path!" )
                 else:
-                    print "ERROR: Not a path!"
+                    print( "ERROR: Not a path!" )
             except Exception as err:
-                print "ERROR: Could not change directory" , endl , err
+                print( "ERROR: Could not change directory" , endl , err )
 
         elif response == 6:
             sep( "Flatten Library" , 1 )
-            print "Gathering files ..."
-            gather_files( LIBDIR )
-            print "Erasing empty dirs ..."
+            print( "Gathering files ..." )
+            index = LibraryIndex( os.path.join( LOGDIR , INDEXNAME ) ) # Keep the index in step with the files that were moved
+            with RecordLogWriter( log_path( "execLog" ) ) as execLog , MoveJournal( new_journal_path( LOGDIR ) ) as journal:
+                index.apply_moves( tee_to( gather_files( LIBDIR , workers = EXECWORKERS , journal = journal ) , execLog.write ) )
+            index.save()
+            print( "Erasing empty dirs ..." )
             del_empty_subdirs( LIBDIR )
-            print "Complete!"
+            print( "Complete!" )
+
+        elif response in ( 7 , 8 ):
+            sep( "Resume an Interrupted Run" if response == 7 else "Undo a Run" , 1 )
+            journalPath = input( "Enter the path of the move journal , or press enter for the latest one.\n>> " ).strip()
+            journalPath = journalPath if journalPath else latest_journal_path( LOGDIR )
+            if not journalPath or not os.path.isfile( journalPath ):
+                print( "ERROR: No move journal found!" )
+            else:
+                if response == 7:
+                    execution = resume_move_plan( journalPath , verbose = True , workers = EXECWORKERS )
+                else:
+                    execution = undo_journal( journalPath , verbose = True )
+                index = LibraryIndex( os.path.join( LOGDIR , INDEXNAME ) ) # Keep the index in step with the files that were moved
+                index.apply_moves( execution )
+                index.save()
+                print( "Erased" , prune_empty_ancestors( vacated_dirs( execution ) , LIBDIR ) , "empty dirs" )
+                print( "Completed" , sum( 1 for report in execution if report[ 'success' ] ) , "of" , len( execution ) , "operations" )
+
+        elif response == 9:
+            sep( "Watch the Inbox" , 1 )
+            if not accessible: # If the user does not have access to any one of the relevant directory
+                print( "ALERT: This action is barred! User does not have write permission to relevant directories or directories DNE!" )
+            else:
+                print( "Watching" , SCANDIR , ", Press Ctrl+C to stop ..." )
+                filed = InboxWatcher( SCANDIR , LIBDIR , LOGDIR , moveWorkers = EXECWORKERS , verbose = True ).run()
+                print( "Executed" , filed , "operations" )
+
+        elif response == 10:
+            sep( "Set Aside Near-Duplicates" , 1 )
+            if not accessible: # If the user does not have access to any one of the relevant directory
+                print( "ALERT: This action is barred! User does not have write permission to relevant directories or directories DNE!" )
+            else:
+                print( "Fingerprinting" , LIBDIR , "..." )
+                index    = LibraryIndex( os.path.join( LOGDIR , INDEXNAME ) ) # Keep the index in step with the files that were moved
+                finder   = NearDuplicateFinder()
+                movePlan = plan_near_duplicates( LIBDIR , SCANWORKERS , index , finder )
+                print( finder.counts )
+                with RecordLogWriter( log_path( "planLog" ) ) as planLog , RecordLogWriter( log_path( "execLog" ) ) as execLog , \
+                     MoveJournal( new_journal_path( LOGDIR ) ) as journal: # Undo with menu option 8
+                    for operation in movePlan:
+                        planLog.write( operation )
+                    index.apply_moves( tee_to( iter_execute_move_plan( movePlan , True , EXECWORKERS , journal = journal ) , execLog.write ) )
+                index.save()
+                print( "Moved" , len( movePlan ) , "near-duplicates to" , os.path.join( LIBDIR , DUPFOLDERNAME ) , "for review" )
 
         else:
-            print "ERROR: Please enter a number corresponding to the desired menu choice!"    
+            print( "ERROR: Please enter a number corresponding to the desired menu choice!" )
 
 # == End Interaction ==
 
+# == Command Line ==
+
+# NOTE: Each stage reads and writes JSON Lines , so that the stages can be run , timed , and inspected separately , for example:
+#       python organize-music-library.py scan  INBOX --jobs 8 --index idx.pkl --out records.jsonl
+#       python organize-music-library.py plan  LIBRARY --records records.jsonl --out plan.jsonl
+#       python organize-music-library.py execute --plan plan.jsonl --journal journal.jsonl --out exec.jsonl
+#       python organize-music-library.py --profile scan.json --profile-stage parse scan INBOX --out records.jsonl
+#       python organize-music-library.py prune --exec exec.jsonl --stop INBOX
+#       python organize-music-library.py neardups LIBRARY --out neardups.jsonl , then 'execute --plan neardups.jsonl'
+#       python organize-music-library.py watch INBOX LIBRARY --logdir LOGS
+#       Running with no arguments starts the menu
+
+def read_jsonl( path ):
+    """ Generate one object per line of the JSON Lines file at 'path' , '-' reads standard input """
+    inFile = sys.stdin if path == '-' else open( path , 'r' , encoding = 'utf-8' , errors = 'surrogateescape' )
+    try:
+        for line in inFile:
+            if line.strip():
+                yield json.loads( line )
+    finally:
+        if inFile is not sys.stdin:
+            inFile.close()
+
+def report_stage( stage , count , seconds ):
+    """ Print the timing of one stage to standard error as a JSON line , so that it does not mix with the output records """
+    print( json.dumps( { 'stage' : stage , 'items' : count , 'seconds' : round( seconds , 6 ) , 
+                         'perSecond' : round( count / seconds , 3 ) if seconds > 0 else None } ) , file = sys.stderr )
+
+def dry_run_operation( operation , opDex ):
+    """ Return the report that executing 'operation' would likely produce , without touching any file """
+    report = deepcopy( operation )
+    report[ 'opNum' ]  = opDex
+    report[ 'dryRun' ] = True
+    if operation[ 'op' ] not in ( 'mv' , 'nm' , 'dup' ):
+        report[ 'success' ] , report[ 'statusMsg' ] = False , "FAIL: OPERATION NOT RECOGNIZED"
+    elif stat_file( operation[ 'orgn' ] ) is None:
+        report[ 'success' ] , report[ 'statusMsg' ] = False , "FAIL: ORIGIN FILE DNE"
+    elif os.path.lexists( operation[ 'dest' ] ):
+        report[ 'success' ] , report[ 'statusMsg' ] = False , "FAIL: DESTINATION EXISTS"
+    else:
+        report[ 'success' ] , report[ 'statusMsg' ] = True , "DRY RUN"
+    return report
+
+def profiled( stage , items , profiler ):
+    """ Return 'items' timed as 'stage' by 'profiler' , or unchanged if there is no profiler """
+    return items if profiler is None else profiler.timed_iter( stage , items )
+
+def cli_scan( args ):
+    """ Scan 'args.searchPath' and write one file record per line , Return the number of records """
+    index = LibraryIndex( args.index ) if args.index else None
+    with RecordLogWriter( args.out , 'jsonl' ) as outLog:
+        for record in profiled( 'scan' , iter_library_metadata( args.searchPath , args.jobs , index , args.profiler ) , args.profiler ):
+            outLog.write( record )
+    if index is not None:
+        index.save()
+    return outLog.count
+
+def cli_plan( args ):
+    """ Plan the records in 'args.records' into 'args.libraryPath' and write one operation per line , Return the number of operations """
+    index     = LibraryIndex( args.index ) if args.index else None
+    dupFilter = None if args.no_dups else DuplicateFilter( index )
+    resolver  = ArtistResolver( args.aliases , args.libraryPath ) if args.aliases else None
+    with RecordLogWriter( args.out , 'jsonl' ) as outLog:
+        for operation in profiled( 'plan' , iter_move_plan( read_jsonl( args.records ) , args.libraryPath , dupFilter , resolver ) , 
+                                   args.profiler ):
+            outLog.write( operation )
+    if resolver is not None:
+        resolver.save()
+    if index is not None: # Keeps the audio spans and hashes for the next plan
+        index.save()
+    return outLog.count
+
+def cli_execute( args ):
+    """ Execute the plan in 'args.plan' and write one operation report per line , Return the number of operations """
+    movePlan = read_jsonl( args.plan )
+    execStats = { 'op' : 'summary' }
+    with RecordLogWriter( args.out , 'jsonl' ) as outLog:
+        if args.dry_run:
+            for opDex , operation in enumerate( movePlan ):
+                outLog.write( dry_run_operation( operation , opDex ) )
+        else:
+            journal = MoveJournal( args.journal ) if args.journal else None
+            try:
+                for report in profiled( 'execute' , iter_execute_move_plan( movePlan , args.verbose , args.jobs , execStats , journal ) , 
+                                        args.profiler ):
+                    if args.profiler is not None:
+                        args.profiler.note_report( report )
+                    outLog.write( report )
+            finally:
+                if journal is not None:
+                    journal.close()
+            print( json.dumps( execStats ) , file = sys.stderr )
+    args.execStats = execStats
+    return outLog.count
+
+def cli_prune( args ):
+    """ Erase the dirs vacated by the operation reports in 'args.exec' , Return the number of dirs erased ( or that would be ) """
+    vacated = vacated_dirs( report for report in read_jsonl( args.exec ) if report.get( 'op' ) != 'summary' )
+    if args.dry_run:
+        for dirPath in sorted( vacated ):
+            print( "Would check" , dirPath , file = sys.stderr )
+        return len( vacated )
+    return prune_empty_ancestors( vacated , args.stop )
+
+def cli_flatten( args ):
+    """ Gather every file under 'args.libraryPath' into its top level , write one operation report per line , and erase the empty dirs , 
+    Return the number of operations """
+    journal = MoveJournal( args.journal ) if args.journal and not args.dry_run else None
+    try:
+        with RecordLogWriter( args.out , 'jsonl' ) as outLog:
+            for report in gather_files( args.libraryPath , args.dry_run , args.jobs , journal , args.verbose , [ args.logdir ] ):
+                outLog.write( report )
+    finally:
+        if journal is not None:
+            journal.close()
+    if not args.dry_run:
+        del_empty_subdirs( args.libraryPath )
+    return outLog.count
+
+def cli_neardups( args ):
+    """ Fingerprint the audio under 'args.libraryPath' and write the plan that sets aside each near-duplicate , Return the number of operations """
+    index  = LibraryIndex( args.index ) if args.index else None
+    finder = NearDuplicateFinder( args.radius , minCorrelation = args.min_correlation )
+    with RecordLogWriter( args.out , 'jsonl' ) as outLog:
+        for operation in plan_near_duplicates( args.libraryPath , args.jobs , index , finder ):
+            outLog.write( operation )
+    if index is not None:
+        index.save()
+    print( json.dumps( finder.counts ) , file = sys.stderr )
+    return outLog.count
+
+def cli_watch( args ):
+    """ File new tracks from 'args.searchPath' into 'args.libraryPath' as they arrive , Return the number of operations """
+    watcher = InboxWatcher( args.searchPath , args.libraryPath , args.logdir , args.jobs , args.verbose , 
+                            args.debounce , args.poll )
+    return watcher.run( args.duration )
+
+def build_arg_parser():
+    """ Return the parser for the command line interface """
+    parser = argparse.ArgumentParser( description = __prog_signature__() + " , Run with no arguments for the menu" )
+    parser.add_argument( '--logdir' , default = None , help = "Logging directory , skipped when flattening , Required by 'watch'" )
+    parser.add_argument( '-v' , '--verbose' , action = 'store_true' , help = "Print each operation as it is executed" )
+    parser.add_argument( '--profile' , default = None , help = "Write a per-stage profile of the scan / plan / execute stage as JSON" )
+    parser.add_argument( '--profile-stage' , default = None , help = "Also run this profiled stage under cProfile , written beside the profile" )
+    stages = parser.add_subparsers( dest = 'stage' )
+    stages.required = True
+
+    scan = stages.add_parser( 'scan' , help = "Read the tags of every file under a dir , write records as JSON Lines" )
+    scan.add_argument( 'searchPath' )
+    scan.add_argument( '--out' , default = '-' , help = "Records file , '-' for standard output" )
+    scan.add_argument( '--jobs' , type = int , default = SCANWORKERS , help = "Tag-parsing processes" )
+    scan.add_argument( '--index' , default = None , help = "Scan index file , unchanged files are not re-parsed" )
+    scan.set_defaults( func = cli_scan )
+
+    plan = stages.add_parser( 'plan' , help = "Plan the moves for scanned records , write operations as JSON Lines" )
+    plan.add_argument( 'libraryPath' )
+    plan.add_argument( '--records' , default = '-' , help = "Records file from 'scan' , '-' for standard input" )
+    plan.add_argument( '--out' , default = '-' , help = "Plan file , '-' for standard output" )
+    plan.add_argument( '--aliases' , default = None , help = "Artist alias table , merges variants of an artist name" )
+    plan.add_argument( '--no-dups' , action = 'store_true' , help = "Do not look for duplicates" )
+    plan.add_argument( '--index' , default = None , help = "Scan index , caches the audio spans and hashes of the duplicate check" )
+    plan.set_defaults( func = cli_plan )
+
+    execute = stages.add_parser( 'execute' , help = "Execute a plan , write operation reports as JSON Lines" )
+    execute.add_argument( '--plan' , default = '-' , help = "Plan file from 'plan' , '-' for standard input" )
+    execute.add_argument( '--out' , default = '-' , help = "Report file , '-' for standard output" )
+    execute.add_argument( '--jobs' , type = int , default = 1 , help = "Move threads" )
+    execute.add_argument( '--journal' , default = None , help = "Move journal , for resuming or undoing the execution" )
+    execute.add_argument( '--dry-run' , action = 'store_true' , help = "Report what would happen without moving anything" )
+    execute.set_defaults( func = cli_execute )
+
+    prune = stages.add_parser( 'prune' , help = "Erase the dirs emptied by an execution" )
+    prune.add_argument( '--exec' , default = '-' , help = "Report file from 'execute' , '-' for standard input" )
+    prune.add_argument( '--stop' , required = True , help = "Never erase this dir or anything above it" )
+    prune.add_argument( '--dry-run' , action = 'store_true' , help = "List the dirs that would be checked" )
+    prune.set_defaults( func = cli_prune )
+
+    flatten = stages.add_parser( 'flatten' , help = "Gather all files into the top of a dir and erase the empty dirs" )
+    flatten.add_argument( 'libraryPath' )
+    flatten.add_argument( '--out' , default = '-' , help = "Report file , '-' for standard output" )
+    flatten.add_argument( '--jobs' , type = int , default = 1 , help = "Move threads" )
+    flatten.add_argument( '--journal' , default = None , help = "Move journal , for resuming or undoing the flatten" )
+    flatten.add_argument( '--dry-run' , action = 'store_true' , help = "Report the moves without making them" )
+    flatten.set_defaults( func = cli_flatten )
+
+    neardups = stages.add_parser( 'neardups' , help = "Plan to set aside tracks that sound the same as another , write operations as JSON Lines" )
+    neardups.add_argument( 'libraryPath' )
+    neardups.add_argument( '--out' , default = '-' , help = "Plan file , run it with 'execute'" )
+    neardups.add_argument( '--jobs' , type = int , default = SCANWORKERS , help = "Tag-parsing processes and decoding threads" )
+    neardups.add_argument( '--index' , default = None , help = "Scan index file , unchanged files are not re-parsed" )
+    neardups.add_argument( '--radius' , type = float , default = NEARDUPRADIUS , help = "Largest spectrum distance of a near-duplicate" )
+    neardups.add_argument( '--min-correlation' , type = float , default = NEARDUPCORR , 
+                           help = "Smallest loudness envelope correlation of a near-duplicate" )
+    neardups.set_defaults( func = cli_neardups )
+
+    watch = stages.add_parser( 'watch' , help = "File new tracks from an inbox as they arrive , until Ctrl+C" )
+    watch.add_argument( 'searchPath' )
+    watch.add_argument( 'libraryPath' )
+    watch.add_argument( '--jobs' , type = int , default = 1 , help = "Move threads" )
+    watch.add_argument( '--debounce' , type = float , default = WATCHDEBOUNCE , help = "Seconds a file must go unchanged" )
+    watch.add_argument( '--poll' , type = float , default = WATCHPOLL , help = "Seconds between scans without inotify" )
+    watch.add_argument( '--duration' , type = float , default = None , help = "Stop after this many seconds" )
+    watch.set_defaults( func = cli_watch )
+    return parser
+
+def run_cli( argv ):
+    """ Run one stage from the command line arguments 'argv' , Return the exit status """
+    global LOGDIR
+    parser = build_arg_parser()
+    args   = parser.parse_args( argv )
+    if args.profile_stage and not args.profile:
+        parser.error( "--profile-stage needs --profile" )
+    if args.stage == 'watch' and not args.logdir: # The watcher keeps its index , journals , and logs there , not in the library
+        parser.error( "watch needs --logdir" )
+    LOGDIR = args.logdir
+    args.profiler  = StageProfiler( args.profile_stage ) if args.profile else None
+    args.execStats = None
+    bgn    = time.perf_counter()
+    count  = args.func( args )
+    report_stage( args.stage , count , time.perf_counter() - bgn )
+    if args.profiler is not None:
+        args.profiler.write( args.profile , args.execStats )
+    return 0
+
+# == End Command Line ==
+
 # == Main ==================================================================================================================================
 
 if __name__ == "__main__":
 
+    # ~~ Command Line ~~
+    if len( sys.argv ) > 1: # Run one stage non-interactively , see 'build_arg_parser'
+        sys.exit( run_cli( sys.argv[1:] ) )
+
     # ~~ Locate Music Library ~~
     #          Drive letter separator for Windows --v
     LIBRARY_LOCATIONS = [ "/media/mawglin/MUSIC/Music", 
@@ -587,7 +2361,7 @@ if __name__ == "__main__":
     SCANDIR_LOCATIONS = [ "/media/mawglin/MUSIC/Music/zzz_Inbox" ]
     LIBDIR = first_valid_dir( LIBRARY_LOCATIONS )   
     SCANDIR = first_valid_dir( SCANDIR_LOCATIONS )
-    print LIBDIR
+    print( LIBDIR )
     LOGDIR = os.path.join( LIBDIR , "Logs" )
 
     menu_loop()
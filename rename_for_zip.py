@@ -36,7 +36,7 @@ import shutil
 # ~~ Special ~~
 import numpy as np
 # ~~ Local ~~
-from file_org_ops import safe_dir_name , makedirs_exist_ok
+from file_org_ops import safe_dir_name
 
 # ~~ Constants , Shortcuts , Aliases ~~
 EPSILON = 1e-7
@@ -68,7 +68,8 @@ if __name__ == "__main__":
     termArgs = sys.argv[1:] # Terminal arguments , if they exist
     
     # 0. Create the output dir , if it does not exist
-    makedirs_exist_ok( _OUTDIR )
+    if not os.path.isdir( _OUTDIR ):
+        os.makedirs( _OUTDIR )
     
     # 1. For each file
     for root , dirs , files in os.walk( _INPDIR , topdown = False ):
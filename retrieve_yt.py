@@ -6,7 +6,8 @@
 from __future__ import division # Future imports must be called before everything else, including triple-quote docs!
 
 # ~~ Standard ~~
-import os , shutil , traceback , sys
+import os , shutil , traceback , sys , time , random , threading , subprocess
+import concurrent.futures
 # ~~ Local ~~
 SOURCEDIR = os.path.dirname( os.path.abspath( '__file__' ) ) # URL, dir containing source file: http://stackoverflow.com/a/7783326
 PARENTDIR = os.path.dirname( SOURCEDIR )
@@ -14,7 +15,10 @@ PARENTDIR = os.path.dirname( SOURCEDIR )
 def prepend_dir_to_path( pathName ): sys.path.insert( 0 , pathName ) # Might need this to fetch a lib in a parent directory
 prepend_dir_to_path( SOURCEDIR )
 from marchhare.Utils3 import ( LogMH , parse_lines , ascii , SuccessTally , dict_A_add_B_new_only ,
-                               ensure_dir , install_constants , get_EXT , nowTimeStampFine )
+                               ensure_dir , install_constants , get_EXT , nowTimeStampFine , strip_EXT )
+# ~~ Special ~~
+import youtube_dl
+import youtube_dl.postprocessor.common
  
 """
 retrieve_yt.py
@@ -58,8 +62,12 @@ def parse_video_entry( txtLine ):
 #         'FL_URL' : _____ Flag for whether a URL was loaded
 #         'rawDir' : _____ Directory holding the raw file or `None`
 #         'FL_RAWDIR' : __ Flag for whether a raw file directory exists
-#         'rawAudioPath' : Path to the downloaded file
-#         'FL_DLOK' : ____ Flag for whether the raw file was successfully downloaded and copied
+#         'rawAudioPath' : Path to the converted file in 'rawDir'
+#         'FL_DLOK' : ____ Flag for whether the raw file was successfully downloaded and converted
+#         'DL_STATE' : ___ Where the download is: QUEUED , DOWNLOADING , DOWNLOADED , TRANSCODING , DONE , or FAILED
+#         'DL_ERROR' : ___ Stage and message of the last failure , if any
+#         'dlTime_s' : ___ Seconds spent downloading
+#         'tcTime_s' : ___ Seconds spent converting to MP3
 #     }
 # ...  
 #     '%PF_URL' : ____ Count of videos that have proper URLS
@@ -89,6 +97,28 @@ def YTID_keys_from_dict( viDict ):
     """ Return a list that is all the YouTube video IDs that appear as keys in `viDict` """
     return [ ytid for ytid in viDict.keys() if is_yt_ID( ytid ) ]
 
+def set_meta( sssn , ID , fields ):
+    """ Update the 'fields' of 'ID' , and save them to the session store if there is one """
+    store = getattr( sssn , 'STORE' , None )
+    if store:
+        store.update_video( ID , fields )
+        # Full API responses are kept only in the store , See 'get_meta_response'
+        fields = { key : val for key , val in fields.items() if key not in store.RESPONSEKEYS }
+    sssn.METADATA[ ID ].update( fields )
+
+def get_meta_response( sssn , ID , kind = 'Metadata' ):
+    """ Return the API response of 'kind' for 'ID' , from the session store if there is one , or None """
+    store = getattr( sssn , 'STORE' , None )
+    if store:
+        return store.get_response( ID , kind )
+    return sssn.METADATA[ ID ].get( kind , None )
+
+def set_stat( sssn , key , value ):
+    """ Set the session-wide '%' entry 'key' , and save it to the session store if there is one """
+    sssn.METADATA[ key ] = value
+    if getattr( sssn , 'STORE' , None ):
+        sssn.STORE.set_settings( { key : value } )
+
 def init_metadata_from_list( sssn , fPath ):
     """ Get all the URLs from the prepared list """
     lineData = parse_lines( fPath , parse_video_entry )
@@ -110,8 +140,14 @@ def init_metadata_from_list( sssn , fPath ):
         rtnDict[ '%PF_URL' ] = tally.get_stats()
     inCount = len( rtnDict ) - 1
     sssn.LOG.prnt( "Read input file with" , inCount , "entries" )
-    #  5. Merge new metadata with existing
+    #  5. Merge new metadata with existing , and save the new entries
+    newKeys = [ key for key in rtnDict if key not in sssn.METADATA ]
     dict_A_add_B_new_only( sssn.METADATA , rtnDict )
+    for key in newKeys:
+        if is_yt_ID( key ):
+            set_meta( sssn , key , rtnDict[ key ] )
+        else:
+            set_stat( sssn , key , rtnDict[ key ] )
     metaCount = len( YTID_keys_from_dict( sssn.METADATA ) )
     sssn.LOG.prnt( "Current playtlist has" , metaCount , "entries" )
 
@@ -126,126 +162,250 @@ def ensure_raw_dirs( sssn , RAW_FILE_DIR ):
         try:
             ensure_dir( enRawDir )
             created = True
-            sssn.METADATA[ enID ][ 'rawDir' ] = enRawDir
         except Exception as ex:
             sssn.LOG.prnt( "ERROR , ensure_raw_dirs: Could not create the directory" , enRawDir )
             created = False
-            sssn.METADATA[ enID ][ 'rawDir' ] = None
             print( ex )
-        sssn.METADATA[ enID ][ 'FL_RAWDIR' ] = created
+        set_meta( sssn , enID , { 'rawDir' : enRawDir if created else None , 'FL_RAWDIR' : created } )
         tally.tally( created )
-    sssn.METADATA[ '%PF_RAWDIRS' ] = tally.get_stats()
+    set_stat( sssn , '%PF_RAWDIRS' , tally.get_stats() )
+
+# === DOWNLOAD SCHEDULING ==================================================================================================================
+
+# ~~ Scheduling Constants ~~
+DLWORKERS    = 2 # ___________________________ Simultaneous downloads , Keep low to stay polite to the server
+TCWORKERS    = max( 1 , os.cpu_count() or 1 ) # Simultaneous FFmpeg conversions , CPU-bound
+DLINTERVAL_S = 20.0 # ________________________ Least time between the starts of two downloads , Across all workers
+DLJITTER_S   = 160.0 # _______________________ Random extra time added to each interval , Uniform on [ 0 , jitter ]
+FFMPEG       = "ffmpeg" # ____________________ FFmpeg executable
+DLTEMPDIR    = ".download" # _________________ Per-ID temp dir inside the raw dir , holds the stream until it is converted
+DLOUTTMPL    = "%(title)s-%(id)s.%(ext)s" # __ youtube-dl output template inside the temp dir
+
+class RateLimiter:
+    """ Spaces the starts of requests across all threads , with a random jitter so that the requests are not periodic """
+
+    def __init__( self , minInterval_s = DLINTERVAL_S , jitter_s = DLJITTER_S ):
+        """ Set the least gap between starts and the most extra random delay """
+        self.minInterval_s = minInterval_s
+        self.jitter_s      = jitter_s
+        self.nextStart     = 0.0
+        self.lock          = threading.Lock()
+
+    def wait( self ):
+        """ Block until this thread may start a request , Return the number of seconds waited """
+        # NOTE: Slots are claimed under the lock but slept outside of it , so that waiting threads queue up in order
+        with self.lock:
+            now  = time.time()
+            slot = max( now , self.nextStart )
+            self.nextStart = slot + self.minInterval_s + random.uniform( 0.0 , self.jitter_s )
+        delay = slot - now
+        if delay > 0:
+            time.sleep( delay )
+        return delay
+
+class OutputCapture( youtube_dl.postprocessor.common.PostProcessor ):
+    """ Last link of the youtube-dl postprocessor chain , Records where the finished file was left """
+
+    def __init__( self , downloader = None ):
+        """ No paths yet """
+        super( OutputCapture , self ).__init__( downloader )
+        self.paths = []
+        self.infos = []
+
+    def run( self , information ):
+        """ Note the path and info of the file that youtube-dl just finished , Delete nothing , Pass the info along unchanged """
+        self.paths.append( information[ 'filepath' ] )
+        self.infos.append( information )
+        return [] , information
+
+def split_postprocessors( postprocessors ):
+    """ Return the postprocessors before 'FFmpegExtractAudio' , and those after it , Leaving it out """
+    keys = [ pp.get( 'key' ) for pp in postprocessors ]
+    if 'FFmpegExtractAudio' not in keys:
+        return list( postprocessors ) , []
+    cut = keys.index( 'FFmpegExtractAudio' )
+    return list( postprocessors[ : cut ] ) , list( postprocessors[ cut + 1 : ] )
+
+def FFmpeg_audio_args( ydlOpts ):
+    """ Return the codec , extension , and FFmpeg quality args that the 'FFmpegExtractAudio' postprocessor in 'ydlOpts' would use """
+    codec   = 'mp3'
+    quality = '192'
+    for pp in ydlOpts.get( 'postprocessors' , [] ):
+        if pp.get( 'key' ) == 'FFmpegExtractAudio':
+            codec   = pp.get( 'preferredcodec' , codec ) or codec
+            quality = pp.get( 'preferredquality' , quality ) or quality
+    # NOTE: Same rule as youtube-dl: Quality below 10 is a VBR level , otherwise it is a bitrate in kbps
+    if float( quality ) < 10:
+        qualArgs = [ '-q:a' , str( quality ) ]
+    else:
+        qualArgs = [ '-b:a' , str( quality ) + 'k' ]
+    codecArgs = { 'mp3' : [ '-acodec' , 'libmp3lame' ] , 'm4a' : [ '-acodec' , 'aac' ] , 'opus' : [ '-acodec' , 'libopus' ] ,
+                  'vorbis' : [ '-acodec' , 'libvorbis' ] , 'flac' : [ '-acodec' , 'flac' ] , 'wav' : [] }.get( codec , [] )
+    EXT = { 'vorbis' : 'ogg' }.get( codec , codec )
+    return codec , EXT , codecArgs + qualArgs
+
+class DownloadScheduler:
+    """ Overlaps downloads with FFmpeg conversion: A small pool fetches , a CPU-sized pool converts , A rate limiter spaces the fetches """
+    # NOTE: A 'YoutubeDL' object is not thread-safe , so each download builds its own from 'ydlOpts'
+
+    def __init__( self , sssn , ydlOpts , dlWorkers = DLWORKERS , tcWorkers = TCWORKERS , rateLimiter = None , maxPending = None ):
+        """ Set up the pools , The audio extraction is taken out of the downloader options and run here instead """
+        self.sssn        = sssn
+        self.store       = getattr( sssn , 'STORE' , None ) # Saves each state change , if set
+        self.ydlOpts     = dict( ydlOpts )
+        self.codec , self.EXT , self.ffArgs = FFmpeg_audio_args( ydlOpts )
+        # NOTE: Postprocessors before the extraction run in youtube-dl on the download pool , those after it run on the converted file
+        self.ydlOpts[ 'postprocessors' ] , self.afterPPs = split_postprocessors( ydlOpts.get( 'postprocessors' , [] ) )
+        self.dlWorkers   = max( 1 , dlWorkers )
+        self.tcWorkers   = max( 1 , tcWorkers )
+        self.rateLimiter = rateLimiter if rateLimiter else RateLimiter()
+        # Bound on files that are downloading or downloaded but not yet converted , so that a slow converter does not fill the disk
+        self.pending     = threading.BoundedSemaphore( maxPending if maxPending else self.dlWorkers + 2 * self.tcWorkers )
+        self.lock        = threading.Lock()
+        self.tally       = SuccessTally()
+        self.dlPool      = None
+        self.tcPool      = None
+
+    def set_state( self , ID , state , **fields ):
+        """ Record the 'state' of 'ID' and any other 'fields' in the session metadata """
+        with self.lock:
+            entry = self.sssn.METADATA[ ID ]
+            fields[ 'DL_STATE' ] = state
+            entry.update( fields )
+            if state in ( 'DONE' , 'FAILED' ):
+                self.tally.tally( state == 'DONE' )
+            # NOTE: Saved under the lock , so that the changes of one ID reach the store in order
+            if self.store:
+                self.store.update_video( ID , fields )
+
+    def log( self , *args ):
+        """ Log from any thread """
+        with self.lock:
+            self.sssn.LOG.prnt( *args )
+
+    def fail( self , ID , stage , ex ):
+        """ Mark 'ID' as failed at 'stage' , and log why """
+        self.log( "ERROR , DownloadScheduler:" , stage , "failed for" , ID , ":" , ex )
+        self.set_state( ID , 'FAILED' , FL_DLOK = False , rawAudioPath = None , DL_ERROR = stage + ": " + str( ex ) )
+
+    def fetch( self , ID ):
+        """ Download the audio stream of 'ID' into its own temp dir , Return the path of the downloaded file , and its youtube-dl info """
+        # NOTE: Each ID writes only to its own temp dir , and the path comes back from the postprocessor chain , so no dir is ever scanned
+        tempDir = os.path.join( self.sssn.METADATA[ ID ][ 'rawDir' ] , DLTEMPDIR )
+        ensure_dir( tempDir )
+        opts = dict( self.ydlOpts )
+        opts[ 'outtmpl' ] = os.path.join( tempDir , DLOUTTMPL )
+        self.rateLimiter.wait()
+        self.set_state( ID , 'DOWNLOADING' )
+        bgn = time.time()
+        ydl     = youtube_dl.YoutubeDL( opts )
+        capture = OutputCapture( ydl )
+        ydl.add_post_processor( capture )
+        ydl.download( [ self.sssn.METADATA[ ID ][ 'url' ] ] ) # This function MUST be passed a list!
+        if len( capture.paths ) == 0:
+            raise IOError( "youtube-dl finished without reporting a file" )
+        srcPath = capture.paths[-1]
+        self.set_state( ID , 'DOWNLOADED' , dlTime_s = time.time() - bgn )
+        return srcPath , capture.infos[-1]
+
+    def post_process( self , dstPath , info ):
+        """ Run the postprocessors that follow the audio extraction on the converted file , as youtube-dl would have """
+        opts = dict( self.ydlOpts )
+        opts[ 'postprocessors' ] = self.afterPPs
+        info = { key : val for key , val in info.items() if key != '__postprocessors' } # Those already ran with the download
+        info[ 'ext' ] = self.EXT
+        youtube_dl.YoutubeDL( opts ).post_process( dstPath , info ) # Raises 'DownloadError' if one fails
+
+    def transcode( self , ID , srcPath , info = None ):
+        """ Convert 'srcPath' straight into the raw dir of 'ID' , Remove the temp dir , Return the path of the converted file """
+        self.set_state( ID , 'TRANSCODING' )
+        bgn = time.time()
+        dstPath = os.path.join( self.sssn.METADATA[ ID ][ 'rawDir' ] , os.path.basename( strip_EXT( srcPath ) ) + '.' + self.EXT )
+        if get_EXT( srcPath ) == self.EXT.upper(): # Already in the target format , Rename on the same disk instead of converting
+            os.replace( srcPath , dstPath )
+        else:
+            cmd = [ FFMPEG , '-y' , '-loglevel' , 'error' , '-i' , srcPath , '-vn' ] + self.ffArgs + [ dstPath ]
+            proc = subprocess.run( cmd , stdout = subprocess.PIPE , stderr = subprocess.PIPE )
+            if proc.returncode != 0:
+                raise IOError( "FFmpeg exited with " + str( proc.returncode ) + ": " + proc.stderr.decode( 'utf-8' , 'replace' ).strip() )
+        if self.afterPPs:
+            self.post_process( dstPath , info if info else {} )
+        # NOTE: The temp dir is kept after a failure , so that youtube-dl can resume the partial stream next session
+        shutil.rmtree( os.path.dirname( srcPath ) , ignore_errors = True )
+        self.set_state( ID , 'DONE' , FL_DLOK = True , rawAudioPath = dstPath , tcTime_s = time.time() - bgn )
+        return dstPath
+
+    def run_transcode( self , ID , srcPath , info = None ):
+        """ Conversion task , Frees a pending slot when finished """
+        try:
+            dstPath = self.transcode( ID , srcPath , info )
+            self.log( "Converted" , ID , "--to->" , dstPath )
+        except Exception as ex:
+            self.fail( ID , 'transcode' , ex )
+        finally:
+            self.pending.release()
 
-def download_videos_as_MP3( sssn , dlTimer , ydl , limitN = None ):
+    def run_download( self , ID ):
+        """ Download task , Hands the file to the conversion pool """
+        self.pending.acquire()
+        try:
+            srcPath , info = self.fetch( ID )
+        except Exception as ex:
+            self.fail( ID , 'download' , ex )
+            self.pending.release()
+            return
+        self.log( "Downloaded" , ID , ", queued for conversion" )
+        try:
+            self.tcPool.submit( self.run_transcode , ID , srcPath , info )
+        except Exception as ex: # The conversion pool was shut down , The task will never free its slot
+            self.fail( ID , 'transcode' , ex )
+            self.pending.release()
+
+    def run( self , IDs ):
+        """ Download and convert every ID in 'IDs' , Block until all are finished , Return the pass/fail tally """
+        for ID in IDs:
+            self.set_state( ID , 'QUEUED' )
+        # NOTE: The download pool is drained before the conversion pool is shut down , so every hand-off finds an open pool
+        with concurrent.futures.ThreadPoolExecutor( max_workers = self.tcWorkers ) as self.tcPool:
+            with concurrent.futures.ThreadPoolExecutor( max_workers = self.dlWorkers ) as self.dlPool:
+                for ID in IDs:
+                    self.dlPool.submit( self.run_download , ID )
+        return self.tally
+
+def download_videos_as_MP3( sssn , dlTimer , ydlOpts , limitN = None , rateLimiter = None ,
+                            dlWorkers = DLWORKERS , tcWorkers = TCWORKERS ):
     """ Download all the videos currently loaded in the session, skipping overfiles already saved """
-    haveCount = 0
-    skipCount = 0
-    failCount = 0
-    total     = 0
-    tally     = SuccessTally()
+    tally = SuccessTally()
+    todo  = []
     # 0. Retrieve the list of IDs
     IDs    = YTID_keys_from_dict( sssn.METADATA )
     numIDs = len( IDs )
-    # 0.5. For each video ID
-    for IDex , ID in enumerate( IDs ):
-        print( "\n~~~ Downloading and Converting" , IDex+1 , "of" , numIDs , "at" , nowTimeStampFine() , "~~~\n"  )
-        ready       = True
-        enDest      = None
-        enCpSuccess = False
-        # 1. Check that the video was not downloaded previously
-        DLed = 'FL_DLOK' in sssn.METADATA[ ID ] # Check if this function was run on this ID
-        if DLed: # If we have seens this ID, check if it was downloaded successfully
-            DLed = sssn.METADATA[ ID ][ 'FL_DLOK' ]
-        if DLed: 
+    # 1. For each video ID , Sort into done , not ready , and to do
+    for ID in IDs:
+        # 2. Check that the video was not downloaded previously
+        if sssn.METADATA[ ID ].get( 'FL_DLOK' , False ):
             sssn.LOG.prnt( "Raw file already exists for" , ID )
-            tally.tally( sssn.METADATA[ ID ][ 'FL_DLOK' ] )
-            continue
-        # 2. Check that both the URL and the raw dir exist
-        ready = ( sssn.METADATA[ ID ][ 'FL_URL' ] ) and ( sssn.METADATA[ ID ][ 'FL_RAWDIR' ] )
-        # 3. If the raw file cannot be stored, skip
-        if not ready:
-            sssn.LOG.prnt( "ERROR , download_videos_as_MP3:" , 
-                           "Cannot store raw file for" , ID )
-            sssn.METADATA[ ID ][ 'FL_DLOK' ] = False
-            tally.tally( sssn.METADATA[ ID ][ 'FL_DLOK' ] )
-        else:
-            # 4. Attempt download, keeping track of how long it took to retrieve
-            try:
-                currURL = sssn.METADATA[ ID ]['url']
-                sssn.LOG.prnt( "No file from" , currURL , ", dowloading ..." )
-                dlTimer.start()
-                ydl.download( [ currURL ] )  # This function MUST be passed a list!
-                enElapsed = dlTimer.elapsed()
-                sssn.LOG.prnt( "Downloading and Processing, DL Time:" , enElapsed , "seconds" )
-                # NOTE: Not marking this ok until it is successfully moved
-            # 5. If the download failed, mark, log, and continue to next
-            except Exception as ex:
-                sssn.METADATA[ ID ][ 'FL_DLOK' ] = False
-                sssn.LOG.prnt( "ERROR , download_videos_as_MP3:" , 
-                                       "Could not download from " , currURL )
-                print( ex )
-                traceback.print_exc()
-                tally.tally( sssn.METADATA[ ID ][ 'FL_DLOK' ] )
-                continue
-            # 6. Find file and attempt move
-            try:
-                fNames = list_all_files_w_EXT( sssn.SOURCEDIR , [ 'MP3' ] )
-                if len( fNames ) > 0:
-                    # Assume that the first item is the newly-arrived file
-                    fSaved = fNames[0]
-                    # 13. Raw File End Destination
-                    enDest = os.path.join( sssn.METADATA[ ID ][ 'rawDir' ] , fSaved )
-                    enCpSuccess = False # I. File Success
-                    try:
-                        print( "About to move" , fSaved , "\nto\n" , enDest )
-                        shutil.move( fSaved , enDest )
-                        enCpSuccess = True
-                        sssn.LOG.prnt( "Move success!:" , fSaved , "--to->" , enDest )
-                        sssn.METADATA[ ID ][ 'rawAudioPath' ] = enDest
-                    except Exception as ex:
-                        enCpSuccess = False
-                        sssn.LOG.prnt( "ERROR , download_videos_as_MP3:" , 
-                                       "Could not move file from" , fSaved , "--to->" , enDest )
-                        print( ex )
-                    sssn.METADATA[ ID ][ 'FL_DLOK' ] = enCpSuccess
-                    tally.tally( sssn.METADATA[ ID ][ 'FL_DLOK' ] )
-                else:
-                    sssn.METADATA[ ID ][ 'FL_DLOK' ] = False
-                    sssn.METADATA[ ID ][ 'rawAudioPath' ] = None
-                    sssn.LOG.prnt( "ERROR , download_videos_as_MP3:" , 
-                                   "No downloaded MP3s detected for" , ID )
-                    tally.tally( sssn.METADATA[ ID ][ 'FL_DLOK' ] )
-            except Exception as ex:
-                sssn.LOG.prnt( "ERROR , download_videos_as_MP3:" , 
-                                       "There was a problem with" , ID )
-                print( ex )
-                traceback.print_exc()
-                sssn.METADATA[ ID ][ 'FL_DLOK' ] = False
-                tally.tally( sssn.METADATA[ ID ][ 'FL_DLOK' ] )
-                continue
-        # 4. Log success and time , 
-        # FIXME
-        
-        # 5. Tally success , Log file locations
-        
-        
+            tally.PASS()
+        # 3. Check that both the URL and the raw dir exist , If the raw file cannot be stored, skip
+        elif not ( sssn.METADATA[ ID ][ 'FL_URL' ] and sssn.METADATA[ ID ].get( 'FL_RAWDIR' , False ) ):
+            sssn.LOG.prnt( "ERROR , download_videos_as_MP3:" , "Cannot store raw file for" , ID )
+            set_meta( sssn , ID , { 'FL_DLOK' : False , 'DL_STATE' : 'FAILED' } )
+            tally.FAIL()
+        elif ( limitN is None ) or ( len( todo ) < limitN ):
+            todo.append( ID )
+    sssn.LOG.prnt( "About to download" , len( todo ) , "of" , numIDs , "videos at" , nowTimeStampFine() )
+    # 4. Download and convert , keeping track of how long it took to retrieve
+    dlTimer.start()
+    runTally = DownloadScheduler( sssn , ydlOpts , dlWorkers , tcWorkers , rateLimiter ).run( todo )
+    sssn.LOG.prnt( "Downloading and Processing, Total Time:" , dlTimer.elapsed() , "seconds" )
     # 5. Save success status
-    sssn.METADATA[ '%PF_RAWFILES' ] = tally.get_stats()
-        
-        
-        ## 10. Download Raw MP3 File
-            ## 11. If this file does not have an entry, the raw file exists, and the file is ok, then download
-            #if not ( enCache and enCache['fSuccess'] ):
-                #cacheMod = True
-                
-                ## 12. Locate and move the raw file
-                #            
-            ## 14. else skip download
-            #else:
-                #LOG.prnt( "Raw file from" , entry['url'] , "was previously cached at" , enCache['Timestamp'] )
-                #enDest      = None
-                #enCpSuccess = True
-                #enElapsed   = None      
+    tally.nPass += runTally.nPass
+    tally.nFail += runTally.nFail
+    tally.N     += runTally.N
+    set_stat( sssn , '%PF_RAWFILES' , tally.get_stats() )
+    return sssn.METADATA[ '%PF_RAWFILES' ]
+
+# ___ END SCHEDULING _______________________________________________________________________________________________________________________
 
 
 def remove_empty_kwargs( **kwargs ):
@@ -676,22 +836,146 @@ def fetch_comments_by_thread_id( ytThreadID ):
         textFormat = "plainText"
     )
 
-def list_all_files_w_EXT( searchPath , EXTlst ):
-    """ Return all of the paths in 'searchPath' that have extensions that appear in 'EXTlst' , Extensions are not case sensitive """
-    items = os.listdir( searchPath )
-    rtnLst = []
-    for item in items:
-        fEXT = get_EXT( item )
-        if fEXT in EXTlst:
-            rtnLst.append( item )
-    return rtnLst
+
+
+
+# === BATCHED METADATA =====================================================================================================================
+
+YTBATCH    = 50 # IDs per 'videos().list' call , the API maximum
+YTLISTCOST = 1 # Quota units charged per 'videos().list' call , whatever the number of IDs or parts
+
+def chunk_list( items , size ):
+    """ Return 'items' as a list of consecutive lists no longer than 'size' """
+    return [ items[ i : i + size ] for i in range( 0 , len( items ) , size ) ]
+
+def fetch_metadata_batched( sssn , IDs = None , client = None , part = None , force = False ):
+    """ Fetch the API metadata of 'IDs' ( default: all in the session ) , 50 per call , Store each under its ID as 'Metadata' ,
+    Return the number of calls made """
+    # NOTE: Each stored response is cut down to the one item of its video , so it has the same shape as a single-ID response
+    client = client if client else sssn.youtube
+    part   = part if part else sssn.METADATA_SPEC
+    if IDs is None:
+        IDs = YTID_keys_from_dict( sssn.METADATA )
+    # 1. Coalesce the IDs that still need metadata , once each , in order
+    pending = []
+    seen    = set()
+    for ID in IDs:
+        entry = sssn.METADATA[ ID ]
+        if ( ID not in seen ) and ( force or not entry.get( 'FL_META' , False ) ):
+            pending.append( ID )
+            seen.add( ID )
+    sssn.LOG.prnt( "Fetching metadata for" , len( pending ) , "videos in batches of" , YTBATCH )
+    # 2. One request per batch , Following the pages of each
+    nCalls = 0
+    found  = set()
+    for batch in chunk_list( pending , YTBATCH ):
+        # NOTE: No 'maxResults' , the API rejects it together with 'id' , and answers all the IDs of a batch in one page
+        request = client.videos().list( part = part , id = ",".join( batch ) )
+        while request is not None:
+            try:
+                response = request.execute()
+            except Exception as ex:
+                sssn.LOG.prnt( "ERROR , fetch_metadata_batched: Request failed for" , len( batch ) , "IDs ," , ex )
+                nCalls += 1
+                break
+            nCalls += 1
+            # 3. Merge each item back into its entry
+            for item in response.get( 'items' , [] ):
+                ID = item.get( 'id' )
+                if ID not in seen:
+                    continue
+                single = { key : val for key , val in response.items() if key not in ( 'items' , 'nextPageToken' , 'pageInfo' ) }
+                single[ 'items' ] = [ item ]
+                set_meta( sssn , ID , { 'Metadata' : single , 'FL_META' : True } )
+                found.add( ID )
+            request = client.videos().list_next( request , response )
+    # 4. IDs the API did not return are private , deleted , or mistyped
+    tally = SuccessTally()
+    for ID in pending:
+        if ID not in found:
+            sssn.LOG.prnt( "ERROR , fetch_metadata_batched: No metadata returned for" , ID )
+            set_meta( sssn , ID , { 'FL_META' : False } )
+        tally.tally( ID in found )
+    if tally.N:
+        set_stat( sssn , '%PF_META' , tally.get_stats() )
+    # 5. Track the quota spent , across sessions
+    quota = dict( sssn.METADATA.get( '%QUOTA' , { 'calls' : 0 , 'units' : 0 } ) )
+    quota[ 'calls' ] += nCalls
+    quota[ 'units' ] += nCalls * YTLISTCOST
+    set_stat( sssn , '%QUOTA' , quota )
+    sssn.LOG.prnt( "Metadata: Made" , nCalls , "calls for" , len( pending ) , "IDs ," , len( found ) , "found ," ,
+                   quota[ 'units' ] , "quota units spent in total" )
+    return nCalls
+
+# ___ END BATCHED __________________________________________________________________________________________________________________________
 
 
 
 
 # === Testing ==============================================================================================================================
 
+class FakeRequest:
+    """ Stand-in for a 'videos().list' request by ID """
+
+    def __init__( self , client , IDs , part ):
+        self.client = client
+        self.IDs    = IDs
+        self.part   = part
+
+    def execute( self ):
+        """ Return the items of all the requested IDs in one page , as the API does for a list by ID , Count the call """
+        self.client.nCalls += 1
+        found = [ self.client.videos_[ ID ] for ID in self.IDs if ID in self.client.videos_ ]
+        return { 'kind' : 'youtube#videoListResponse' , 'items' : found ,
+                 'pageInfo' : { 'totalResults' : len( found ) , 'resultsPerPage' : len( found ) } }
+
+class FakeYouTubeClient:
+    """ Local stand-in for the YouTube Data API client , Answers 'videos().list' from a dict of made-up videos """
+
+    def __init__( self , IDs ):
+        """ Make one video item for each of 'IDs' """
+        self.videos_ = { ID : { 'id' : ID , 'snippet' : { 'title' : "Video " + ID , 'localized' : { 'description' : "0:00 A - B" } } ,
+                                'contentDetails' : { 'duration' : 'PT3M20S' } } for ID in IDs }
+        self.nCalls  = 0
+
+    def videos( self ):
+        """ The client's 'videos' resource is the client itself """
+        return self
+
+    def list( self , part , id , maxResults = None ):
+        """ Return a request for the comma-separated 'id's , Refuse what the API refuses """
+        if maxResults is not None:
+            raise ValueError( "'maxResults' is not supported together with 'id'" )
+        IDs = id.split( ',' )
+        if len( IDs ) > YTBATCH:
+            raise ValueError( "Too many IDs in one request: " + str( len( IDs ) ) )
+        return FakeRequest( self , IDs , part )
+
+    def list_next( self , previous_request , previous_response ):
+        """ Return the request for the next page , A list by ID has only the one page """
+        return None
+
+class FakeLog:
+    """ Prints what would be logged """
+
+    def prnt( self , *args ):
+        print( *args )
+
 if __name__ == "__main__":
-    pass
+    # ~~ Batched metadata against the fake client ~~
+    sssn = type( 'FakeSession' , ( object , ) , {} )()
+    sssn.LOG           = FakeLog()
+    sssn.METADATA_SPEC = 'snippet,contentDetails,statistics'
+    sssn.METADATA      = { "%011d" % i : { 'id' : "%011d" % i } for i in range( 1234 ) }
+    liveIDs = [ ID for ID in YTID_keys_from_dict( sssn.METADATA ) if int( ID ) % 100 ] # Every 100th video is gone
+    sssn.youtube = FakeYouTubeClient( liveIDs )
+    nCalls = fetch_metadata_batched( sssn )
+    print( "Calls:" , nCalls , ", One per ID would have been:" , len( YTID_keys_from_dict( sssn.METADATA ) ) )
+    assert nCalls == len( chunk_list( YTID_keys_from_dict( sssn.METADATA ) , YTBATCH ) ) # One call per batch
+    assert all( sssn.METADATA[ ID ][ 'FL_META' ] == ( ID in sssn.youtube.videos_ ) for ID in YTID_keys_from_dict( sssn.METADATA ) )
+    assert get_meta_response( sssn , liveIDs[0] )[ 'items' ][0][ 'id' ] == liveIDs[0]
+    assert fetch_metadata_batched( sssn , liveIDs ) == 0 # Nothing left to fetch
+    assert sssn.METADATA[ '%QUOTA' ] == { 'calls' : nCalls , 'units' : nCalls * YTLISTCOST }
+    print( "Quota:" , sssn.METADATA[ '%QUOTA' ] )
 
 # ___ End Tests ____________________________________________________________________________________________________________________________
@@ -0,0 +1,15 @@
+""" Shared fixtures , Puts the repo root on the path and loads the organizer script as a module """
+
+import os , sys , importlib.util
+import pytest
+
+REPODIR = os.path.dirname( os.path.dirname( os.path.abspath( __file__ ) ) )
+sys.path.insert( 0 , REPODIR )
+
+@pytest.fixture( scope = 'session' )
+def oml():
+    """ Return 'organize-music-library.py' imported as a module , Its name is not a valid identifier """
+    spec   = importlib.util.spec_from_file_location( 'organize_music_library' , os.path.join( REPODIR , 'organize-music-library.py' ) )
+    module = importlib.util.module_from_spec( spec )
+    spec.loader.exec_module( module )
+    return module
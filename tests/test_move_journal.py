@@ -0,0 +1,88 @@
+""" Journaled execution of a move plan: settling interrupted operations on resume , and undo """
+
+import os , shutil
+import pytest
+from file_org_ops import COPYSUFFIX
+
+@pytest.fixture
+def dirs( tmp_path ):
+    """ Return ( origin dir , destination dir , journal path ) in a fresh temp dir """
+    src = tmp_path / 'inbox'
+    dst = tmp_path / 'library'
+    src.mkdir()
+    dst.mkdir()
+    return str( src ) , str( dst ) , str( tmp_path / 'moveJournalTest.jsonl' )
+
+def move_op( src , dst , name ):
+    """ Return a plan operation that moves 'name' from 'src' to 'dst' """
+    return { 'op' : 'mv' , 'orgn' : os.path.join( src , name ) , 'orginDir' : src , 'dest' : os.path.join( dst , name ) , 'destDir' : dst }
+
+def write( path , text ):
+    with open( path , 'w' ) as outFile:
+        outFile.write( text )
+
+def read( path ):
+    with open( path ) as inFile:
+        return inFile.read()
+
+def interrupted_plan( oml , src , dst , journalPath , names ):
+    """ Journal the intents of a plan for 'names' , as a run that crashed before any result was written , Return the plan """
+    plan = [ move_op( src , dst , name ) for name in names ]
+    for name in names:
+        write( os.path.join( src , name ) , name * 100 )
+    with oml.MoveJournal( journalPath ) as journal:
+        journal.begin( plan , 0 )
+    return plan
+
+def test_resume_runs_pending_operations( oml , dirs ):
+    src , dst , journalPath = dirs
+    interrupted_plan( oml , src , dst , journalPath , [ 'a' , 'b' ] )
+    reports = oml.resume_move_plan( journalPath )
+    assert [ report[ 'success' ] for report in reports ] == [ True , True ]
+    assert sorted( os.listdir( dst ) ) == [ 'a' , 'b' ] and os.listdir( src ) == []
+    assert oml.resume_move_plan( journalPath ) == [] # Every intent now has a result
+
+def test_resume_finds_finished_rename( oml , dirs ):
+    src , dst , journalPath = dirs
+    interrupted_plan( oml , src , dst , journalPath , [ 'a' ] )
+    os.rename( os.path.join( src , 'a' ) , os.path.join( dst , 'a' ) ) # Moved , but the result was never written
+    report , = oml.resume_move_plan( journalPath )
+    assert report[ 'success' ] and report[ 'statusMsg' ] == "SUCCESS: FOUND DONE ON RESUME"
+
+def test_resume_keeps_file_it_did_not_make( oml , dirs ):
+    src , dst , journalPath = dirs
+    interrupted_plan( oml , src , dst , journalPath , [ 'a' ] )
+    write( os.path.join( dst , 'a' ) , "someone else's" )
+    report , = oml.resume_move_plan( journalPath )
+    assert not report[ 'success' ] and report[ 'statusMsg' ] == "FAIL: DESTINATION EXISTS ON RESUME"
+    assert read( os.path.join( dst , 'a' ) ) == "someone else's" and os.path.isfile( os.path.join( src , 'a' ) )
+
+def test_resume_redoes_cut_short_copy( oml , dirs ):
+    src , dst , journalPath = dirs
+    interrupted_plan( oml , src , dst , journalPath , [ 'a' ] )
+    write( os.path.join( dst , 'a' + COPYSUFFIX ) , 'a' * 40 )
+    report , = oml.resume_move_plan( journalPath )
+    assert report[ 'success' ] and report[ 'statusMsg' ] == "SUCCESS"
+    assert os.listdir( dst ) == [ 'a' ] and read( os.path.join( dst , 'a' ) ) == 'a' * 100
+
+def test_resume_finishes_copy_that_kept_its_origin( oml , dirs ):
+    src , dst , journalPath = dirs
+    interrupted_plan( oml , src , dst , journalPath , [ 'a' ] )
+    shutil.copy2( os.path.join( src , 'a' ) , os.path.join( dst , 'a' ) ) # Copied and renamed into place , origin not yet removed
+    report , = oml.resume_move_plan( journalPath )
+    assert report[ 'success' ] and report[ 'statusMsg' ] == "SUCCESS: FOUND COPIED ON RESUME"
+    assert os.listdir( src ) == []
+
+def test_undo_restores_origins( oml , dirs ):
+    src , dst , journalPath = dirs
+    plan = [ move_op( src , dst , name ) for name in ( 'a' , 'b' ) ]
+    for name in ( 'a' , 'b' ):
+        write( os.path.join( src , name ) , name )
+    with oml.MoveJournal( journalPath ) as journal:
+        assert all( report[ 'success' ] for report in oml.execute_move_plan( plan , journal = journal ) )
+    undoPath = oml.new_undo_journal_path( journalPath )
+    undone   = oml.undo_journal( journalPath , undoPath )
+    assert [ report[ 'undoOf' ] for report in undone ] == [ 1 , 0 ] and all( report[ 'success' ] for report in undone )
+    assert sorted( os.listdir( src ) ) == [ 'a' , 'b' ] and os.listdir( dst ) == []
+    with pytest.raises( FileExistsError ): # Appending to the same undo journal would mix two runs
+        oml.undo_journal( journalPath , undoPath )
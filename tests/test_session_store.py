@@ -0,0 +1,50 @@
+""" 'SessionStore': METADATA entries written one ID at a time come back whole , across a reopen """
+
+import pytest
+
+pytest.importorskip( 'oauth2client' )
+pytest.importorskip( 'pygn' )
+SessionStore = pytest.importorskip( 'API_sssn_py3' ).SessionStore
+
+ID = 'dQw4w9WgXcQ'
+
+ENTRY = { 'url' : 'https://www.youtube.com/watch?v=' + ID , 'seq' : 3 , 'FL_URL' : True , 'rawDir' : '/raw/' + ID , 
+          'FL_RAWDIR' : True , 'FL_DLOK' : True , 'DL_STATE' : 'DONE' , 'rawAudioPath' : '/raw/' + ID + '/a.mp3' , 
+          'dlTime_s' : 1.5 , 'tcTime_s' : 0.25 , 'FL_META' : True , 'DL_ERROR' : None ,
+          'Tracklist' : [ { 'timestamp' : [ 0 , 1 , 5 ] , 'videoSeq' : 1 , 'balance' : 'Artist - Song' , 'line' : '1:05 Artist - Song' } ] }
+RESPONSE = { 'kind' : 'youtube#videoListResponse' , 'items' : [ { 'id' : ID } ] }
+
+@pytest.fixture
+def store( tmp_path ):
+    store = SessionStore( str( tmp_path / 'session.db' ) )
+    yield store
+    store.close()
+
+def test_video_round_trip( store ):
+    store.update_video( ID , dict( ENTRY , Metadata = RESPONSE ) )
+    assert store.get_video( ID ) == dict( ENTRY , id = ID ) # Responses are left out unless asked for
+    assert store.get_video( ID , withResponses = True )[ 'Metadata' ] == RESPONSE
+    assert store.get_response( ID , 'Metadata' ) == RESPONSE and store.get_response( ID , 'Threads' ) is None
+
+def test_update_keeps_other_fields( store ):
+    store.update_video( ID , ENTRY )
+    store.update_video( ID , { 'DL_STATE' : 'FAILED' , 'FL_DLOK' : False , 'note' : 'retry' } )
+    entry = store.get_video( ID )
+    assert entry[ 'DL_STATE' ] == 'FAILED' and entry[ 'FL_DLOK' ] is False and entry[ 'note' ] == 'retry'
+    assert entry[ 'rawAudioPath' ] == ENTRY[ 'rawAudioPath' ] and entry[ 'Tracklist' ] == ENTRY[ 'Tracklist' ]
+    assert store.video_IDs( dlState = 'FAILED' ) == [ ID ] and store.video_IDs( dlOK = True ) == []
+
+def test_metadata_survives_reopen( tmp_path ):
+    path     = str( tmp_path / 'session.db' )
+    metadata = { ID : dict( ENTRY , Metadata = RESPONSE ) , '%PF_URL' : { 'pass' : 1 , 'fail' : 0 } }
+    store = SessionStore( path )
+    store.import_metadata( metadata )
+    store.close()
+    store = SessionStore( path )
+    try:
+        assert store.export_metadata() == { ID : dict( ENTRY , id = ID ) , '%PF_URL' : { 'pass' : 1 , 'fail' : 0 } }
+        assert store.export_metadata( withResponses = True )[ ID ][ 'Metadata' ] == RESPONSE
+        store.delete_video( ID )
+        assert store.get_video( ID ) is None and store.get_tracklist( ID ) == [] and store.get_response( ID , 'Metadata' ) is None
+    finally:
+        store.close()
@@ -197,11 +197,11 @@ def __prog_signature__(): return __progname__ + " , Version " + __version__
    
      
 def Stage_1_Download_w_Data( inputFile , overridePath = None , 
-                             minDelay_s = 20 , maxDelay_s = 180 ):
+                             rateLimiter = None , dlWorkers = DLWORKERS , tcWorkers = TCWORKERS ):
     """ Check environment for download , Fetch files and metadata , Save files and metadata """
     # NOTE: You may have to run this function several times, especially for long lists of URLs
 	# ffmpeg conversion seems to be a sufficient wait time, especially for large files 
-    doSleep = False 
+    doSleep = False
     # DEBUG
     dbugLim = False
     limit = 1
@@ -224,18 +224,23 @@ def Stage_1_Download_w_Data( inputFile , overridePath = None ,
     
     #  4. Process input file
     init_metadata_from_list( session , inputFile )
-    #  6. Init downloader
+    #  6. Init downloader , Each download builds its own from the options , so just check that they are accepted
     try:
-        ydl = youtube_dl.YoutubeDL( session.YDL_OPTS )
+        youtube_dl.YoutubeDL( session.YDL_OPTS )
         session.LOG.prnt( "Downloader initialized!" )
     except:
-        ydl = None
         session.LOG.prnt( "ERROR: Downloader could NOT be initialized!" )
         return False
     #  7. Create dirs for raw files
     ensure_raw_dirs( session , session.RAW_FILE_DIR )
-    #  8. Download files
-    download_videos_as_MP3( session , dlTimer , ydl )
+    #  8. Download files , Spacing the downloads with 'rateLimiter' while earlier ones convert
+    if rateLimiter is None:
+        rateLimiter = RateLimiter()
+    download_videos_as_MP3( session , dlTimer , session.YDL_OPTS , rateLimiter = rateLimiter ,
+                            dlWorkers = dlWorkers , tcWorkers = tcWorkers )
+    #  9. Fetch video metadata , 50 IDs per API call
+    if session.youtube:
+        fetch_metadata_batched( session )
     
             
             ## 15. Fetch Description Data
@@ -432,7 +437,7 @@ if __name__ == "__main__":
     # ~~~ Stage 1: Downloading ~~~
     if 1:
         Stage_1_Download_w_Data( "input/url_src_02.txt" , "input/outputOverride.txt" , 
-                                 minDelay_s = 30 , maxDelay_s = 60 )
+                                 rateLimiter = RateLimiter( minInterval_s = 30 , jitter_s = 30 ) )
     
     # ~~~ Stage 2: Processing ~~~
     if 0: